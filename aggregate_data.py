@@ -1,37 +1,68 @@
 import os
 import json
+import tracing
+import pricing
+import evaluate_models
 
 EVAL_OUTPUT_DIR = "evaluation_outputs3"
 INPUT_DIR = "input"
 GENERATED_DIR = "batch_outputs"
+DASHBOARD_DATA_PATH = "dashboard_data.js"
 
-data = []
-
-for model_dir in os.listdir(EVAL_OUTPUT_DIR):
-    model_path = os.path.join(EVAL_OUTPUT_DIR, model_dir)
-    if os.path.isdir(model_path):
-        for json_file in os.listdir(model_path):
-            if json_file.endswith(".json"):
-                file_path = os.path.join(model_path, json_file)
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        eval_data = json.load(f)
+def main():
+    tracing.start_run("aggregate")
+    refresh()
+
+def refresh():
+    # dashboard_data.js and the cost report; also called by watch.py whenever evaluations land
+    with tracing.span("aggregate") as attrs:
+        data = aggregate()
+        attrs["evaluations"] = len(data)
+    if os.path.exists(pricing.USAGE_PATH):
+        pricing.cost_report(data)
+    return data
+
+def aggregate():
+    data = []
+
+    for model_dir in os.listdir(EVAL_OUTPUT_DIR):
+        model_path = os.path.join(EVAL_OUTPUT_DIR, model_dir)
+        if os.path.isdir(model_path):
+            for json_file in os.listdir(model_path):
+                if json_file.endswith(".json"):
+                    file_path = os.path.join(model_path, json_file)
+                    try:
+                        with tracing.span("aggregate.parse", model=model_dir):
+                            with open(file_path, "r", encoding="utf-8") as f:
+                                eval_data = json.load(f)
+                        # Evaluations of views no longer scored (top-down, elevations)
+                        # would count as extra candidates of the same model
+                        if eval_data.get("view") and eval_data["view"] not in evaluate_models.PHASE1_SCORED_VIEWS:
+                            continue
                         data.append(eval_data)
-                except Exception as e:
-                    print(f"Error reading {file_path}: {e}")
-
-# Also let's output a mapping for the generator images
-# Format: input_filename + "_" + evaluated_model + ".png" -> usually the generated name
-for item in data:
-    input_file = item.get("input_file", "")
-    evaluated_model = item.get("evaluated_model", "")
-    base_name = os.path.splitext(input_file)[0]
-    
-    # Reconstruct generated file path
-    gen_file_name = f"{base_name}_{evaluated_model}.png"
-    item["generated_file"] = gen_file_name
-
-with open("dashboard_data.js", "w", encoding="utf-8") as f:
-    f.write("window.dashboardData = " + json.dumps(data, indent=4) + ";\n")
-
-print("Aggregated data to dashboard_data.js")
+                    except Exception as e:
+                        print(f"Error reading {file_path}: {e}")
+
+    # Also let's output a mapping for the generator images
+    # Format: input_filename + "_" + evaluated_model + ".png" -> usually the generated name
+    for item in data:
+        input_file = item.get("input_file", "")
+        evaluated_model = item.get("evaluated_model", "")
+        base_name = os.path.splitext(input_file)[0]
+
+        # Reconstruct generated file path (newer evaluations record it, e.g. Phase 1 scene views)
+        if "generated_file" not in item:
+            gen_file_name = f"{base_name}_{evaluated_model}.png"
+            item["generated_file"] = gen_file_name
+
+    with tracing.span("aggregate.write"):
+        # Renamed into place so the dashboard never loads a half-written file
+        with open(DASHBOARD_DATA_PATH + ".tmp", "w", encoding="utf-8") as f:
+            f.write("window.dashboardData = " + json.dumps(data, indent=4) + ";\n")
+        os.replace(DASHBOARD_DATA_PATH + ".tmp", DASHBOARD_DATA_PATH)
+
+    print(f"Aggregated {len(data)} evaluations to {DASHBOARD_DATA_PATH}")
+    return data
+
+if __name__ == "__main__":
+    main()
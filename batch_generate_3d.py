@@ -1,23 +1,61 @@
 import os
-import requests
 import json
 import base64
 import time
 import sys
 import re
 import mimetypes
-import io
-from PIL import Image
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import generation_cache
+import scheduler
+import hedging
+import tracing
+import pricing
+import request_body
+import input_store
+import response_archive
+
+# requests and PIL are imported where they are used, so planning a run
+# (python -m floorbench generate --dry-run) starts without loading them.
 
 API_KEY = "YOUR_OPENROUTER_API_KEY_HERE"
 
 if API_KEY == "YOUR_OPENROUTER_API_KEY_HERE":
     API_KEY = os.environ.get("OPENROUTER_API_KEY")
 
+# Chat completions endpoint; point OPENROUTER_API_URL at mock_openrouter.py to
+# run the pipeline offline (benchmarks, development) without spending credits.
+API_URL = os.environ.get("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+
 INPUT_DIR = "input"
 OUTPUT_DIR = "batch_outputs"
 
+# Upload encoding and concurrency (overridable from a run manifest, see run_manifest.py)
+MAX_IMAGE_SIZE = 2048
+JPEG_QUALITY = 85
+MAX_WORKERS = 5
+
+# Upper bound on an uploaded image's bytes (before base64), met by lowering
+# quality / switching format / downscaling (request_body.encode_within). Off by
+# default because it changes the request, and so the generation cache key, of
+# every plan it touches; try 1_500_000. WebP is only sent to models that take it.
+MAX_UPLOAD_BYTES = None
+ALLOW_WEBP = True
+
+# Optional per-model cap on concurrent requests (provider rate limits), e.g.
+# {"openai/gpt-5-image": 2}. Models not listed only share MAX_WORKERS.
+MODEL_CONCURRENCY = {}
+
+# Opt-in hedging (floorbench generate --hedge): a request still running at the
+# model's p90 latency gets one duplicate, first success wins. Capped per run.
+HEDGE_REQUESTS = False
+HEDGE_PERCENTILE = 90
+HEDGE_MAX_EXTRA_REQUESTS = 20
+hedge_budget = None
+
+# Hard spending cap in USD for one run (floorbench generate --budget), None for
+# no cap. Prices come from pricing.PRICES.
+BUDGET_USD = None
+
 MODELS = [
     "sourceful/riverflow-v2-pro",
     "sourceful/riverflow-v2-fast",
@@ -85,22 +123,14 @@ def setup_directories():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     os.makedirs(INPUT_DIR, exist_ok=True)
 
-def encode_image(image_path):
+def encode_image(image_path, model=None):
+    # request_body.DataURL for upload; JSONStream base64-encodes it on the fly
     if not os.path.exists(image_path):
         return None
     try:
-        img = Image.open(image_path)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
         # Optionally, restrict max size to avoid payload too large errors
-        max_size = 2048
-        if img.width > max_size or img.height > max_size:
-            img.thumbnail((max_size, max_size))
-            
-        buffer = io.BytesIO()
-        img.save(buffer, format="JPEG", quality=85)
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+        webp = ALLOW_WEBP and request_body.accepts_webp(model)
+        return request_body.encode_within(image_path, MAX_IMAGE_SIZE, JPEG_QUALITY, MAX_UPLOAD_BYTES, webp)
     except Exception as e:
         print(f"❌ Error encoding image {image_path}: {e}")
         return None
@@ -116,25 +146,111 @@ def extract_image_url(content):
     if match: return match.group(1)
     return None
 
+def extract_image_payload(result):
+    # (image URL, base64 image) from any of the response shapes models use;
+    # data: URLs are returned as base64
+    img_url = None
+    b64_image = None
+
+    if 'choices' in result and len(result['choices']) > 0:
+        choice = result['choices'][0]['message']
+        content = choice.get("content")
+
+        images_list = choice.get("images", [])
+        for img in images_list:
+            if img.get("type") == "image_url":
+                try:
+                    img_url = img["image_url"]["url"]
+                except:
+                    img_url = img.get("image_url")
+
+        if not img_url and not b64_image:
+            # Case 1: content is list (multimodal)
+            if isinstance(content, list):
+                for item in content:
+                    if item.get("type") == "image_url":
+                        if isinstance(item.get("image_url"), dict):
+                            img_url = item["image_url"].get("url")
+                        else:
+                            img_url = item.get("image_url")
+                    elif item.get("type") == "image":
+                        img_url = item.get("image_url")
+                    elif item.get("type") == "output_image":
+                        b64_image = item.get("b64_json")
+
+            # Case 2: content is string
+            elif isinstance(content, str):
+                img_url = extract_image_url(content)
+
+    # Case 3: some models return data field
+    if not img_url and not b64_image and "data" in result:
+        for item in result["data"]:
+            if "b64_json" in item:
+                b64_image = item["b64_json"]
+
+    # Handle base64 formatting
+    if img_url and img_url.startswith("data:image"):
+        b64_image = img_url.split(",", 1)[1]
+        img_url = None
+
+    return img_url, b64_image
+
+def generation_key(file_path, model):
+    params = {"max_image_size": MAX_IMAGE_SIZE, "jpeg_quality": JPEG_QUALITY}
+    if MAX_UPLOAD_BYTES is not None:
+        # Only when set, so existing cache entries stay valid without a budget
+        params["max_upload_bytes"] = MAX_UPLOAD_BYTES
+        params["webp"] = ALLOW_WEBP and request_body.accepts_webp(model)
+    return generation_cache.generation_key(file_path, model, PROMPT, params)
+
+def save_output(cache_key, img_bytes, output_path, model, filename):
+    cached_path = generation_cache.store(cache_key, img_bytes, {"model": model, "input": filename})
+    generation_cache.link(cached_path, output_path)
+
 def process_file_model(filename, model):
+    with tracing.span("generate", model=model, input=filename) as attrs:
+        attrs["ok"] = generate_one(filename, model, attrs)
+        return attrs["ok"]
+
+def generate_one(filename, model, attrs):
+    import requests
+
     file_path = os.path.join(INPUT_DIR, filename)
-    
-    mime_type = "image/jpeg"
-    
-    image_base64 = encode_image(file_path)
-    if not image_base64:
+
+    output_filename = output_filename_for(filename, model)
+    output_path = os.path.join(OUTPUT_DIR, output_filename)
+
+    if not os.path.exists(file_path):
         print(f"❌ Error: Could not read image at {file_path}")
         return False
 
-    filename_without_ext = os.path.splitext(filename)[0]
-    sanitized_model_name = model.replace("/", "_")
-    output_filename = f"{filename_without_ext}_{sanitized_model_name}.png"
-    output_path = os.path.join(OUTPUT_DIR, output_filename)
-    
-    if os.path.exists(output_path):
+    cache_key = generation_key(file_path, model)
+    if generation_cache.is_alias(output_path, cache_key):
+        attrs["outcome"] = "skipped"
         print(f"⏭️ Skipping {output_filename}, already exists.")
         return True
 
+    cached_path = generation_cache.lookup(cache_key)
+    if cached_path:
+        generation_cache.link(cached_path, output_path)
+        attrs["outcome"] = "cached"
+        print(f"♻️ Reused cached result for {output_filename}")
+        return True
+
+    # Plain files predate the cache; trust them as before. Links into the store
+    # for another key are stale (prompt, input or params changed) and get redone.
+    if os.path.exists(output_path) and not generation_cache.is_managed(output_path):
+        attrs["outcome"] = "skipped"
+        print(f"⏭️ Skipping {output_filename}, already exists.")
+        return True
+
+    attrs["outcome"] = "generated"
+    with tracing.span("generate.encode", model=model):
+        image = encode_image(file_path, model)
+    if not image:
+        print(f"❌ Error: Could not read image at {file_path}")
+        return False
+
     print(f"🔄 Processing {output_filename}...")
     headers = {
         "Authorization": f"Bearer {API_KEY}",
@@ -153,78 +269,49 @@ def process_file_model(filename, model):
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:{mime_type};base64,{image_base64}"
+                            "url": image
                         }
                     }
                 ]
             }
-        ]
+        ],
+        "usage": {"include": True}
     }
+    body = request_body.JSONStream(data)
 
     start_time = time.time()
     try:
-        response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data, timeout=120)
+        hedge_after = scheduler.latency_percentile("generate", model, HEDGE_PERCENTILE) if hedge_budget else None
+        with tracing.span("generate.request", model=model, hedged=hedge_after is not None):
+            if hedge_after is not None:
+                response = hedging.hedged_post(API_URL, headers, body, 120, hedge_after, hedge_budget)
+            else:
+                response = requests.post(API_URL, headers=headers, data=body, timeout=120)
         latency = time.time() - start_time
+        scheduler.record_latency("generate", model, latency, response.status_code == 200)
+        tracing.record_http("generate", model, response, start_time, latency)
         
         if response.status_code == 200:
-            result = response.json()
+            with tracing.span("generate.parse", model=model):
+                result = response.json()
+            pricing.record_usage("generate", model, result.get("usage", {}), subject=model.replace('/', '_'))
+            response_archive.archive_response("generate", model, result, subject=output_filename, latency=latency)
             
-            img_url = None
-            b64_image = None
-                
-            if 'choices' in result and len(result['choices']) > 0:
-                choice = result['choices'][0]['message']
-                content = choice.get("content")
-                
-                images_list = choice.get("images", [])
-                for img in images_list:
-                    if img.get("type") == "image_url":
-                        try:
-                            img_url = img["image_url"]["url"]
-                        except:
-                            img_url = img.get("image_url")
-
-                if not img_url and not b64_image:
-                    # Case 1: content is list (multimodal)
-                    if isinstance(content, list):
-                        for item in content:
-                            if item.get("type") == "image_url":
-                                if isinstance(item.get("image_url"), dict):
-                                    img_url = item["image_url"].get("url")
-                                else:
-                                    img_url = item.get("image_url")
-                            elif item.get("type") == "image":
-                                img_url = item.get("image_url")
-                            elif item.get("type") == "output_image":
-                                b64_image = item.get("b64_json")
-                    
-                    # Case 2: content is string
-                    elif isinstance(content, str):
-                        img_url = extract_image_url(content)
-            
-            # Case 3: some models return data field
-            if not img_url and not b64_image and "data" in result:
-                for item in result["data"]:
-                    if "b64_json" in item:
-                        b64_image = item["b64_json"]
-
-            # Handle base64 formatting
-            if img_url and img_url.startswith("data:image"):
-                b64_image = img_url.split(",", 1)[1]
-                img_url = None
+            img_url, b64_image = extract_image_payload(result)
 
             if b64_image:
-                img_bytes = base64.b64decode(b64_image)
-                with open(output_path, "wb") as f:
-                    f.write(img_bytes)
+                with tracing.span("generate.write", model=model):
+                    img_bytes = base64.b64decode(b64_image)
+                    save_output(cache_key, img_bytes, output_path, model, filename)
                 print(f"✅ SUCCESS: Saved {output_filename} (base64 image)! (Latency: {latency:.2f}s)")
                 return True
 
             elif img_url:
                 try:
-                    img_data = requests.get(img_url, timeout=30).content
-                    with open(output_path, "wb") as f:
-                        f.write(img_data)
+                    with tracing.span("generate.fetch_image", model=model):
+                        img_data = requests.get(img_url, timeout=30).content
+                    with tracing.span("generate.write", model=model):
+                        save_output(cache_key, img_data, output_path, model, filename)
                     print(f"✅ SUCCESS: Saved {output_filename} (URL image)! (Latency: {latency:.2f}s)")
                     return True
                 except Exception as e:
@@ -247,7 +334,45 @@ def process_file_model(filename, model):
         print(f"❌ Exception during request for {output_filename}: {e}")
         return False
 
+def plan_tasks():
+    # Find all images in input dir
+    files = input_store.canonical_inputs(INPUT_DIR)
+    print(f"Found {len(files)} images in '{INPUT_DIR}' directory.")
+    
+    tasks = []
+    for f in files:
+        for m in MODELS:
+            tasks.append((f, m))
+    return tasks
+
+def output_filename_for(filename, model):
+    return f"{os.path.splitext(filename)[0]}_{model.replace('/', '_')}.png"
+
+def is_pending(task):
+    return not os.path.exists(os.path.join(OUTPUT_DIR, output_filename_for(*task)))
+
+def predict_task(task):
+    if not is_pending(task):
+        return 0.0
+    filename, model = task
+    return scheduler.predict_latency("generate", model)
+
+def dry_run():
+    setup_directories()
+    tasks = plan_tasks()
+    pending = [t for t in tasks if is_pending(t)]
+    print(f"Total tasks: {len(tasks)} ({len(tasks) - len(pending)} already in '{OUTPUT_DIR}', {len(pending)} to run)")
+    predicted = scheduler.simulate_makespan([(t[1], predict_task(t)) for t in sorted(pending, key=predict_task, reverse=True)],
+                                            MAX_WORKERS, MODEL_CONCURRENCY)
+    print(f"Predicted makespan: {scheduler.format_duration(predicted)}")
+    pricing.print_estimate("generate", pending, model_of=lambda t: t[1])
+    if BUDGET_USD is not None:
+        pending, _ = pricing.fit_budget("generate", pending, lambda t: t[1], BUDGET_USD)
+    for filename, model in pending:
+        print(f"  {filename} -> {model}")
+
 def main():
+    global hedge_budget
     print("🚀 BATCH PROCESSING PIPELINE")
     
     if not API_KEY or API_KEY == "YOUR_OPENROUTER_API_KEY_HERE":
@@ -255,36 +380,51 @@ def main():
         sys.exit(1)
 
     setup_directories()
+    tracing.start_run("generate")
+    with tracing.span("ingest"):
+        input_store.ingest(INPUT_DIR)
     
-    # Find all images in input dir
-    files = [f for f in os.listdir(INPUT_DIR) if os.path.isfile(os.path.join(INPUT_DIR, f)) and f.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.avif'))]
-    print(f"Found {len(files)} images in '{INPUT_DIR}' directory.")
-    
-    tasks = []
-    for f in files:
-        for m in MODELS:
-            tasks.append((f, m))
-            
+    tasks = plan_tasks()
     print(f"Total tasks to run: {len(tasks)}")
 
     successful = 0
     failed = 0
 
-    # Run in parallel
+    pending = [t for t in tasks if is_pending(t)]
+    pricing.print_estimate("generate", pending, model_of=lambda t: t[1])
+    worker = process_file_model
+    deferred = []
+    if BUDGET_USD is not None:
+        _, deferred = pricing.fit_budget("generate", pending, lambda t: t[1], BUDGET_USD)
+        skipped = set(deferred)
+        tasks = [t for t in tasks if t not in skipped]
+        pricing.budget = pricing.Budget(BUDGET_USD)
+        worker = pricing.budgeted(process_file_model, "generate", lambda t: t[1], is_pending)
+
+    if HEDGE_REQUESTS:
+        hedge_budget = hedging.HedgeBudget(HEDGE_MAX_EXTRA_REQUESTS, MAX_WORKERS)
+
+    # Run in parallel, slowest models first so no single model is left as a long tail
     # NOTE: Using 5 concurrent workers. OpenRouter typically allows parallel requests, but you might run into rate limits on some models.
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {executor.submit(process_file_model, filename, model): (filename, model) for filename, model in tasks}
-        
-        for future in as_completed(futures):
-            success = future.result()
-            if success:
-                successful += 1
-            else:
-                failed += 1
+    for task, success in scheduler.run_scheduled(tasks, worker, MAX_WORKERS,
+                                                 model_of=lambda t: t[1], predict=predict_task,
+                                                 model_limits=MODEL_CONCURRENCY, checkpoint="generate"):
+        if success:
+            successful += 1
+        else:
+            failed += 1
 
     print("\n🏁 Batch Processing Complete.")
     print(f"✅ Successfully generated: {successful}")
     print(f"❌ Failed: {failed}")
+    if deferred:
+        print(f"⏸️ Deferred by budget: {len(deferred)}")
+    if hedge_budget:
+        hedge_budget.report()
+        hedge_budget.shutdown()
+    if pricing.budget:
+        pricing.budget.report()
+    tracing.summarize(tracing.trace_path())
 
 if __name__ == "__main__":
     main()
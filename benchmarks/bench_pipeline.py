@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import contextlib
+import io
+
+# Throughput benchmark of the generation and evaluation engines against the
+# local mock (mock_openrouter.py): tasks/sec, peak RSS and tail latency at
+# several concurrency levels. Each level runs in a fresh scratch directory so
+# caches, latency history and outputs never carry over between levels.
+#   python benchmarks/bench_pipeline.py --levels 1,4,8,16 --latency-median 0.5
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import mock_openrouter
+import tracing
+
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+
+MOCK_GENERATORS = [f"mock/generator-{i}" for i in range(8)]
+MOCK_EVALUATORS = ["mock/evaluator-a", "mock/evaluator-b"]
+
+class RssSampler(threading.Thread):
+    # Peak resident set size while a stage runs. ru_maxrss only ever grows over
+    # the whole process, so /proc is sampled instead where it exists.
+    def __init__(self, interval=0.01):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def current(self):
+        try:
+            with open("/proc/self/statm", "r") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            import resource
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, self.current())
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, self.current())
+        return self.peak
+
+def reset_state():
+    # Module-level caches that would otherwise leak from the previous scratch dir
+    import generation_cache
+    import scheduler
+    import pricing
+    import evaluate_models
+    import request_body
+    import input_store
+    generation_cache._index = None
+    generation_cache._input_hashes.clear()
+    scheduler._history = None
+    pricing._usage = None
+    pricing.budget = None
+    evaluate_models._duplicate_groups.clear()
+    evaluate_models._hash_index = None
+    del evaluate_models._reused[:]
+    request_body._decisions = None
+    input_store._index = None
+
+def write_inputs(count, size):
+    os.makedirs("input", exist_ok=True)
+    png = mock_openrouter.make_png(size)
+    for i in range(count):
+        with open(os.path.join("input", f"plan_{i:03d}.png"), "wb") as f:
+            f.write(png)
+
+def span_latencies(name):
+    spans = tracing.load_spans(tracing.trace_path())
+    return [s["duration"] for s in spans if s["name"] == name]
+
+def run_stage(stage, concurrency, api_url, args):
+    import batch_generate_3d
+    import evaluate_models
+
+    if stage == "generate":
+        module = batch_generate_3d
+        module.MODELS = MOCK_GENERATORS[:args.models]
+        module.OUTPUT_DIR = "batch_outputs"
+    else:
+        module = evaluate_models
+        module.EVALUATOR_MODELS = MOCK_EVALUATORS
+        module.GENERATED_DIR = "batch_outputs"
+        module.EVAL_OUTPUT_DIR = "evaluation_outputs"
+        # Every mock render is the same picture; copying evaluations would skip the calls being measured
+        module.DEDUP_MAX_DISTANCE = None
+    module.INPUT_DIR = "input"
+    module.API_URL = api_url
+    module.API_KEY = "mock"
+    module.MAX_WORKERS = concurrency
+
+    sampler = RssSampler()
+    sampler.start()
+    baseline = sampler.current()
+    start_time = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        module.main()
+    wall = time.time() - start_time
+    peak = sampler.stop()
+
+    latencies = span_latencies(stage)
+    p50, p95, p99 = tracing.percentiles(latencies)
+    failed = sum(1 for s in tracing.load_spans(tracing.trace_path()) if s["name"] == stage and not s["attrs"].get("ok"))
+    return {
+        "stage": stage,
+        "concurrency": concurrency,
+        "tasks": len(latencies),
+        "failed": failed,
+        "wall_s": round(wall, 3),
+        "tasks_per_s": round(len(latencies) / wall, 3) if wall > 0 else 0.0,
+        "p50_s": round(p50, 3),
+        "p95_s": round(p95, 3),
+        "p99_s": round(p99, 3),
+        "peak_rss_mb": round(peak / 1024 ** 2, 1),
+        "rss_growth_mb": round((peak - baseline) / 1024 ** 2, 1)
+    }
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark generate/evaluate throughput against mock_openrouter.py.")
+    parser.add_argument("--levels", default="1,4,8,16", help="comma-separated concurrency levels")
+    parser.add_argument("--stage", choices=("generate", "evaluate", "all"), default="all")
+    parser.add_argument("--inputs", type=int, default=5, help="synthetic input floor plans")
+    parser.add_argument("--models", type=int, default=4, help=f"mock generator models (max {len(MOCK_GENERATORS)})")
+    parser.add_argument("--input-size", type=int, default=1600, help="synthetic input edge length in px")
+    parser.add_argument("--image-size", type=int, default=1024, help="mock output image edge length in px")
+    parser.add_argument("--latency-median", type=float, default=0.5)
+    parser.add_argument("--latency-sigma", type=float, default=0.4)
+    parser.add_argument("--error-rate-429", type=float, default=0.0)
+    parser.add_argument("--error-rate-5xx", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directories")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    levels = [int(level) for level in args.levels.split(",")]
+    stages = ("generate", "evaluate") if args.stage == "all" else (args.stage,)
+
+    httpd = mock_openrouter.start(0, {
+        "latency_median": args.latency_median,
+        "latency_sigma": args.latency_sigma,
+        "error_rate_429": args.error_rate_429,
+        "error_rate_5xx": args.error_rate_5xx,
+        "image_size": args.image_size,
+        # Every response shape process_file_model parses gets exercised
+        "models": {model: {"shape": mock_openrouter.SHAPES[i % len(mock_openrouter.SHAPES)]}
+                   for i, model in enumerate(MOCK_GENERATORS)}
+    }, seed=args.seed)
+    api_url = mock_openrouter.api_url(httpd)
+    print(f"🧪 Mock at {api_url} (median {args.latency_median}s, sigma {args.latency_sigma})")
+
+    results = []
+    original_dir = os.getcwd()
+    try:
+        for concurrency in levels:
+            scratch = tempfile.mkdtemp(prefix=f"floorbench_c{concurrency}_")
+            os.chdir(scratch)
+            reset_state()
+            try:
+                write_inputs(args.inputs, args.input_size)
+                for stage in stages:
+                    if stage == "evaluate" and "generate" not in stages:
+                        # Evaluation needs generated images; make them without timing it
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            run_stage("generate", max(levels), api_url, args)
+                    result = run_stage(stage, concurrency, api_url, args)
+                    results.append(result)
+                    print(f"   {stage:<9} c={concurrency:<3} {result['tasks']:>4} tasks  {result['tasks_per_s']:>7.2f}/s  "
+                          f"p50 {result['p50_s']:.2f}s  p95 {result['p95_s']:.2f}s  p99 {result['p99_s']:.2f}s  "
+                          f"peak RSS {result['peak_rss_mb']:.0f} MB (+{result['rss_growth_mb']:.0f})"
+                          + (f"  ❌ {result['failed']}" if result["failed"] else ""))
+            finally:
+                os.chdir(original_dir)
+                if not args.keep:
+                    shutil.rmtree(scratch, ignore_errors=True)
+    finally:
+        httpd.shutdown()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"args": vars(args), "results": results, "timestamp": time.time()}, f, indent=4)
+    print(f"📄 Results written to {path}")
+
+if __name__ == "__main__":
+    main()
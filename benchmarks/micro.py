@@ -0,0 +1,275 @@
+import os
+import io
+import sys
+import json
+import glob
+import time
+import shutil
+import base64
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+from statistics import median
+
+# Micro-benchmarks for the CPU-bound hot paths, with regression gates:
+#   python benchmarks/micro.py --save-baseline   # on the reference machine
+#   python benchmarks/micro.py --check           # exit 1 on a regression
+# A benchmark regresses when its median time grows by more than
+# TIME_TOLERANCE or its peak traced memory by more than MEMORY_TOLERANCE.
+# Benchmarks whose dependencies are missing (PIL, tree-sitter) are skipped.
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+BASELINE_PATH = os.path.join(REPO_DIR, "benchmarks", "micro_baseline.json")
+
+TIME_TOLERANCE = 0.20
+MEMORY_TOLERANCE = 0.10
+
+# Size of the synthetic evaluation tree for the aggregate_data.py pass
+EVAL_TREE_FILES = 50000
+EVAL_TREE_MODELS = 50
+
+INPUT_FORMATS = (".jpg", ".png", ".webp", ".avif")
+
+class Skip(Exception):
+    pass
+
+def measure(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    # Separate pass: tracemalloc slows the code down too much to time it
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"median_s": median(times), "min_s": min(times), "peak_kb": peak / 1024, "repeat": repeat}
+
+def input_fixture(ext, scratch):
+    # A real input of this format when input/ has one, else a conversion of the
+    # first input (AVIF needs a Pillow build with AVIF support)
+    real = sorted(glob.glob(os.path.join(REPO_DIR, "input", f"*{ext}")))
+    if real:
+        return real[0]
+    try:
+        from PIL import Image
+    except ImportError:
+        raise Skip("PIL not installed")
+    source = sorted(glob.glob(os.path.join(REPO_DIR, "input", "*.jpg")))[0]
+    path = os.path.join(scratch, f"fixture{ext}")
+    try:
+        Image.open(source).save(path)
+    except (KeyError, OSError) as e:
+        raise Skip(f"Pillow cannot write {ext}: {e}")
+    return path
+
+def bench_encode_image(module_name, ext, scratch):
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        raise Skip("PIL not installed")
+    import request_body
+    module = __import__(module_name)
+    path = input_fixture(ext, scratch)
+
+    def run():
+        # Measure the encode itself, not the request_body JPEG cache
+        request_body._jpeg_cache.clear()
+        module.encode_image(path)
+    return run
+
+def bench_encode_search(scratch):
+    # Worst case of request_body.encode_within: no stored decision, and a budget
+    # the plain encode misses, so the full quality/subsampling/WebP search runs
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        raise Skip("PIL not installed")
+    import request_body
+    path = input_fixture(".png", scratch)
+    budget = len(request_body.encode_jpeg(path, 2048, 85)) // 3
+
+    def run():
+        request_body._jpeg_cache.clear()
+        request_body._decisions = {}
+        request_body.encode_within(path, 2048, 85, budget, webp=True)
+    return run
+
+def large_evaluation_response():
+    with open(sorted(glob.glob(os.path.join(REPO_DIR, "evaluation_outputs3", "*", "*.json")))[0], "r", encoding="utf-8") as f:
+        evaluation = json.load(f)
+    evaluation["detected_errors"] = [{"code": "E3-MIN", "severity": "minor",
+                                      "description": "Window on the north wall is offset from the plan. " * 4}] * 1500
+    prose = "The render shows a cutaway apartment with the walls extruded to full height. " * 300
+    return f"{prose}\n```json\n{json.dumps(evaluation, indent=2)}\n```\n{prose}"
+
+def bench_extract_json(fenced):
+    import evaluate_models
+    text = large_evaluation_response()
+    if not fenced:
+        text = text.replace("```json", "").replace("```", "")
+    return lambda: evaluate_models.extract_json(text)
+
+def bench_extract_image_url():
+    import batch_generate_3d
+    text = ("Here is a description of the isometric render and the rooms it shows. " * 3000
+            + "\n![render](https://example.com/renders/floor_plan10.png)\n")
+    return lambda: batch_generate_3d.extract_image_url(text)
+
+def bench_extract_image_payload(shape):
+    import batch_generate_3d
+    import mock_openrouter
+    with open(sorted(glob.glob(os.path.join(REPO_DIR, "batch_outputs", "*.png")))[0], "rb") as f:
+        b64 = base64.b64encode(f.read()).decode("ascii")
+    result = mock_openrouter.image_response("bench/model", shape, 8, "https://example.com")
+    # Swap the mock's tiny image for a real generated one
+    text = json.dumps(result).replace(base64.b64encode(mock_openrouter.make_png(8)).decode("ascii"), b64)
+    result = json.loads(text)
+    return lambda: batch_generate_3d.extract_image_payload(result)
+
+def bench_normalize_imports():
+    try:
+        import process_outputs
+    except ImportError as e:
+        raise Skip(f"process_outputs needs {e.name}")
+    block = """import * as THREE from 'https://unpkg.com/three@0.150.0/build/three.module.js';
+import { OrbitControls } from 'https://cdn.jsdelivr.net/npm/three@0.150.0/examples/jsm/controls/OrbitControls.js';
+import { GLTFLoader } from "three/examples/jsm/loaders/GLTFLoader.js";
+const wall = new THREE.Mesh(new THREE.BoxGeometry(4, 2.6, 0.15), new THREE.MeshStandardMaterial({ color: 0xdddddd }));
+wall.position.set(1.5, 1.3, -2); scene.add(wall);
+"""
+    code = block * 2000
+    return lambda: process_outputs.normalize_imports(code)
+
+def make_eval_tree(root, files, models):
+    template_path = sorted(glob.glob(os.path.join(REPO_DIR, "evaluation_outputs3", "*", "*.json")))[0]
+    with open(template_path, "r", encoding="utf-8") as f:
+        template = json.load(f)
+    per_model = files // models
+    for m in range(models):
+        model_dir = os.path.join(root, f"bench-model-{m:03d}")
+        os.makedirs(model_dir)
+        for i in range(per_model):
+            template["evaluated_model"] = f"bench-model-{m:03d}"
+            template["input_file"] = f"plan_{i:05d}.png"
+            template["total_score"] = (i * 7 + m) % 100
+            with open(os.path.join(model_dir, f"plan_{i:05d}_eval_by_bench.json"), "w", encoding="utf-8") as f:
+                json.dump(template, f)
+
+def bench_aggregate(scratch, files):
+    import aggregate_data
+    root = os.path.join(scratch, "evaluations")
+    make_eval_tree(root, files, EVAL_TREE_MODELS)
+    aggregate_data.EVAL_OUTPUT_DIR = root
+    aggregate_data.DASHBOARD_DATA_PATH = os.path.join(scratch, "dashboard_data.js")
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            aggregate_data.aggregate()
+    return run
+
+def benchmarks(scratch, eval_files):
+    # name -> (setup returning the function to time, repeat count)
+    suite = {}
+    for module_name, stage in (("batch_generate_3d", "generate"), ("evaluate_models", "evaluate")):
+        for ext in INPUT_FORMATS:
+            suite[f"encode_image[{stage},{ext[1:]}]"] = (
+                lambda m=module_name, e=ext: bench_encode_image(m, e, scratch), 10)
+    suite["encode_within[search]"] = (lambda: bench_encode_search(scratch), 5)
+    suite["extract_json[fenced]"] = (lambda: bench_extract_json(True), 50)
+    suite["extract_json[bare]"] = (lambda: bench_extract_json(False), 50)
+    suite["extract_image_url"] = (bench_extract_image_url, 50)
+    for shape in ("images", "content_list", "output_image", "data_b64", "markdown_url"):
+        suite[f"extract_image_payload[{shape}]"] = (lambda s=shape: bench_extract_image_payload(s), 200)
+    suite["normalize_imports"] = (bench_normalize_imports, 20)
+    suite[f"aggregate[{eval_files}]"] = (lambda: bench_aggregate(scratch, eval_files), 3)
+    return suite
+
+def compare(results, baseline, name_filter=None):
+    # (regressions, baseline entries that did not run, results with no baseline entry).
+    # A hot path skipped for a missing dependency counts as not run, not as passing.
+    regressions = []
+    missing = sorted(name for name in baseline if name not in results and (not name_filter or name_filter in name))
+    unbaselined = sorted(name for name in results if name not in baseline)
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["median_s"] > base["median_s"] * (1 + TIME_TOLERANCE):
+            regressions.append(f"{name}: {base['median_s'] * 1e3:.2f} ms -> {result['median_s'] * 1e3:.2f} ms")
+        if result["peak_kb"] > base["peak_kb"] * (1 + MEMORY_TOLERANCE) and result["peak_kb"] - base["peak_kb"] > 64:
+            regressions.append(f"{name}: peak {base['peak_kb']:.0f} KB -> {result['peak_kb']:.0f} KB")
+    return regressions, missing, unbaselined
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the pipeline's hot functions.")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--eval-files", type=int, default=EVAL_TREE_FILES, help="files in the synthetic evaluation tree")
+    parser.add_argument("--save-baseline", action="store_true", help=f"write results to {os.path.relpath(BASELINE_PATH, REPO_DIR)}")
+    parser.add_argument("--check", action="store_true",
+                        help="exit 1 if there is no baseline, or anything in it regressed or did not run")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    scratch = tempfile.mkdtemp(prefix="floorbench_micro_")
+    original_dir = os.getcwd()
+    # Trace files and other relative-path side effects land in the scratch dir
+    os.chdir(scratch)
+
+    results = {}
+    try:
+        for name, (setup, repeat) in benchmarks(scratch, args.eval_files).items():
+            if args.filter and args.filter not in name:
+                continue
+            try:
+                func = setup()
+            except Skip as e:
+                print(f"   ⏭️ {name:<40} skipped ({e})")
+                continue
+            result = measure(func, repeat)
+            results[name] = result
+            print(f"   {name:<42} {result['median_s'] * 1e3:>10.3f} ms  (min {result['min_s'] * 1e3:.3f})  "
+                  f"peak {result['peak_kb']:>9.0f} KB")
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    elif args.check:
+        print(f"\n❌ No baseline at {BASELINE_PATH}; record one with --save-baseline")
+        sys.exit(1)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        print(f"📄 Baseline written to {BASELINE_PATH}")
+        return
+
+    regressions, missing, unbaselined = compare(results, baseline, args.filter)
+    if unbaselined and baseline:
+        print(f"\n⚠️ Not in the baseline yet: {', '.join(unbaselined)}")
+    if missing:
+        print("\n❌ In the baseline but did not run:")
+        for name in missing:
+            print(f"   {name}")
+    if regressions:
+        print("\n❌ Regressions against baseline:")
+        for line in regressions:
+            print(f"   {line}")
+    if regressions or missing:
+        if args.check:
+            sys.exit(1)
+    elif baseline:
+        print("\n✅ No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
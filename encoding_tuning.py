@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import random
+import argparse
+from statistics import mean, median
+import evaluate_models
+import scheduler
+import tracing
+import pricing
+
+# Finds the cheapest upload encoding per evaluator that doesn't change its
+# scores. A stratified sample of already-scored (plan, render) pairs is
+# re-scored at every candidate in SETTINGS; the baseline candidate's re-score
+# measures the evaluator's own run-to-run noise, and a cheaper setting is
+# accepted when its deviation from the recorded scores stays within
+# MAX_EXTRA_DEVIATION points of that noise. The winners are written to
+# evaluate_models.ENCODING_PROFILES_PATH, which evaluate runs read.
+#   python encoding_tuning.py --dry-run
+#   python encoding_tuning.py --evaluators openai/gpt-5.2 --per-band 5
+TUNING_DIR = os.path.join(".cache", "encoding_tuning")
+
+# (max_size, JPEG quality) candidates; the first is the current default
+SETTINGS = [(1024, 80), (1280, 85), (768, 80), (768, 70), (512, 80)]
+
+# Rubric verdict bands (see EVAL_PROMPT); the sample draws evenly from each
+SCORE_BANDS = ((0, 29), (30, 49), (50, 74), (75, 89), (90, 100))
+PAIRS_PER_BAND = 4
+
+# Extra mean absolute score deviation (points) and verdict-flip rate a setting
+# may show on top of the baseline's re-score before it is rejected
+MAX_EXTRA_DEVIATION = 3.0
+MAX_EXTRA_FLIPS = 0.1
+
+def setting_name(setting):
+    return f"{setting[0]}px_q{setting[1]}"
+
+def setting_dir(evaluator, setting):
+    return os.path.join(TUNING_DIR, evaluator.replace('/', '_'), setting_name(setting))
+
+def scored_pairs(evaluator):
+    # Recorded evaluations by this evaluator of images that are still on disk
+    pairs = []
+    if not os.path.isdir(evaluate_models.EVAL_OUTPUT_DIR):
+        return pairs
+    suffix = f"_eval_by_{evaluator.replace('/', '_')}.json"
+    for model_dir in sorted(os.listdir(evaluate_models.EVAL_OUTPUT_DIR)):
+        model_path = os.path.join(evaluate_models.EVAL_OUTPUT_DIR, model_dir)
+        if not os.path.isdir(model_path):
+            continue
+        for name in sorted(os.listdir(model_path)):
+            if not name.endswith(suffix):
+                continue
+            with open(os.path.join(model_path, name), "r", encoding="utf-8") as f:
+                evaluation = json.load(f)
+            if evaluation.get("view") or evaluation.get("reused_from") or "total_score" not in evaluation:
+                continue
+            generated = os.path.join(evaluate_models.GENERATED_DIR,
+                                     evaluation.get("generated_file") or f"{name[:-len(suffix)]}_{model_dir}.png")
+            input_file = evaluation.get("input_file")
+            if not input_file or not os.path.exists(generated) \
+                    or not os.path.exists(os.path.join(evaluate_models.INPUT_DIR, input_file)):
+                continue
+            pairs.append({"input_file": input_file, "generated_path": generated, "model": model_dir,
+                          "score": evaluation["total_score"]})
+    return pairs
+
+def score_band(score):
+    for i, (low, high) in enumerate(SCORE_BANDS):
+        if low <= score <= high:
+            return i
+    return len(SCORE_BANDS) - 1
+
+def sample_pairs(evaluator, per_band, seed):
+    # Up to per_band pairs per verdict band, spread over as many generators as possible
+    rng = random.Random(f"{seed}:{evaluator}")
+    bands = {}
+    for pair in scored_pairs(evaluator):
+        bands.setdefault(score_band(pair["score"]), []).append(pair)
+    sample = []
+    for band in sorted(bands):
+        pairs = bands[band]
+        rng.shuffle(pairs)
+        by_model = {}
+        for pair in pairs:
+            by_model.setdefault(pair["model"], []).append(pair)
+        picked = []
+        while len(picked) < per_band and any(by_model.values()):
+            for model in sorted(by_model):
+                if by_model[model] and len(picked) < per_band:
+                    picked.append(by_model[model].pop())
+        sample.extend(picked)
+    return sample
+
+def measure_setting(evaluator, setting, pairs):
+    # Re-scores pairs with this encoding into its own output dir; returns what
+    # the calls cost in tokens, upload bytes and latency
+    evaluate_models.EVAL_OUTPUT_DIR = setting_dir(evaluator, setting)
+    evaluate_models.MAX_IMAGE_SIZE, evaluate_models.JPEG_QUALITY = setting
+    tasks = [(p["input_file"], p["generated_path"], evaluator, p["model"], None) for p in pairs]
+    pending = [t for t in tasks if evaluate_models.is_pending(t)]
+    print(f"\n🎛️ {evaluator} @ {setting_name(setting)}: {len(pending)} of {len(tasks)} pairs to score")
+    if not pending:
+        return
+
+    usage_before = len(pricing.usage_records())
+    started = time.time()
+    for _ in scheduler.run_scheduled(pending, evaluate_models.process_evaluation, evaluate_models.MAX_WORKERS,
+                                     model_of=lambda t: t[2], predict=evaluate_models.predict_task,
+                                     model_limits=evaluate_models.MODEL_CONCURRENCY):
+        pass
+
+    usage = [r for r in pricing.usage_records()[usage_before:] if r["model"] == evaluator and r["stage"] == "evaluate"]
+    spans = [s for s in tracing.load_spans(tracing.trace_path())
+             if s["start"] >= started and s["attrs"].get("model") == evaluator]
+    measured = {
+        "prompt_tokens": [r["prompt_tokens"] for r in usage],
+        "cost": [r["cost"] for r in usage],
+        "latency": [s["duration"] for s in spans if s["name"] == "evaluate.request" and s["status"] == "ok"],
+        "upload_bytes": [s["attrs"]["upload_bytes"] for s in spans
+                         if s["name"] == "evaluate.server" and s["attrs"].get("status_code") == 200]
+    }
+    # Accumulates over invocations, so a resumed experiment keeps earlier samples
+    path = os.path.join(setting_dir(evaluator, setting), "measurements.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        for key in measured:
+            measured[key] = previous.get(key, []) + measured[key]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(measured, f)
+
+def summarize_setting(evaluator, setting, pairs):
+    deviations, flips, scored = [], 0, 0
+    for pair in pairs:
+        path = evaluate_models.eval_output_path(pair["input_file"], evaluator, pair["model"])
+        path = os.path.join(setting_dir(evaluator, setting), pair["model"], os.path.basename(path))
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            score = json.load(f).get("total_score")
+        if score is None:
+            continue
+        scored += 1
+        deviations.append(abs(score - pair["score"]))
+        flips += score_band(score) != score_band(pair["score"])
+
+    measured = {}
+    path = os.path.join(setting_dir(evaluator, setting), "measurements.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            measured = json.load(f)
+    return {
+        "max_size": setting[0],
+        "quality": setting[1],
+        "scored": scored,
+        "mean_abs_deviation": round(mean(deviations), 2) if deviations else None,
+        "verdict_flip_rate": round(flips / scored, 3) if scored else None,
+        "median_prompt_tokens": median(measured["prompt_tokens"]) if measured.get("prompt_tokens") else None,
+        "median_latency_s": round(median(measured["latency"]), 2) if measured.get("latency") else None,
+        "median_upload_kb": round(median(measured["upload_bytes"]) / 1024, 1) if measured.get("upload_bytes") else None,
+        "mean_cost_usd": round(mean(measured["cost"]), 6) if measured.get("cost") else None
+    }
+
+def recommend(summaries, min_scored):
+    # Cheapest setting within the baseline's noise plus the allowed extra
+    baseline = summaries[0]
+    if baseline["scored"] < min_scored or baseline["mean_abs_deviation"] is None:
+        return None
+    accepted = [s for s in summaries
+                if s["scored"] >= min_scored and s["mean_abs_deviation"] is not None
+                and s["mean_abs_deviation"] <= baseline["mean_abs_deviation"] + MAX_EXTRA_DEVIATION
+                and s["verdict_flip_rate"] <= baseline["verdict_flip_rate"] + MAX_EXTRA_FLIPS]
+
+    def cost(s):
+        return (s["median_prompt_tokens"] if s["median_prompt_tokens"] is not None else float("inf"),
+                s["median_upload_kb"] if s["median_upload_kb"] is not None else float("inf"))
+    return min(accepted, key=cost)
+
+def print_summaries(evaluator, summaries, chosen):
+    print(f"\n📐 {evaluator}")
+    print(f"   {'setting':<13} {'n':>3} {'|Δscore|':>9} {'flips':>6} {'tokens':>8} {'upload':>9} {'latency':>8}")
+    for s in summaries:
+        mark = "✅" if chosen is s else "  "
+        print(f" {mark}{setting_name((s['max_size'], s['quality'])):<13} {s['scored']:>3} "
+              f"{s['mean_abs_deviation'] if s['mean_abs_deviation'] is not None else '-':>9} "
+              f"{s['verdict_flip_rate'] if s['verdict_flip_rate'] is not None else '-':>6} "
+              f"{s['median_prompt_tokens'] if s['median_prompt_tokens'] is not None else '-':>8} "
+              f"{str(s['median_upload_kb']) + ' KB' if s['median_upload_kb'] is not None else '-':>9} "
+              f"{str(s['median_latency_s']) + 's' if s['median_latency_s'] is not None else '-':>8}")
+
+def write_profiles(recommendations, path):
+    profiles = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            profiles = json.load(f)
+    profiles.update(recommendations)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=4, sort_keys=True)
+    print(f"\n📄 Encoding profiles written to {path}")
+
+def build_arg_parser(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(description="Tune upload resolution/quality per evaluator.")
+    parser.add_argument("--evaluators", nargs="+", default=evaluate_models.EVALUATOR_MODELS)
+    parser.add_argument("--per-band", type=int, default=PAIRS_PER_BAND, help="pairs sampled per verdict band")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dry-run", action="store_true", help="show the sample and estimated cost only")
+    parser.add_argument("--out", default=evaluate_models.ENCODING_PROFILES_PATH, help="profiles JSON to update")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    tracing.start_run("tune_encoding")
+    samples = {evaluator: sample_pairs(evaluator, args.per_band, args.seed) for evaluator in args.evaluators}
+
+    calls = [(evaluator, setting) for evaluator, pairs in samples.items() for setting in SETTINGS for _ in pairs]
+    for evaluator, pairs in samples.items():
+        bands = sorted({score_band(p["score"]) for p in pairs})
+        print(f"🎯 {evaluator}: {len(pairs)} pairs from {len({p['model'] for p in pairs})} generators, "
+              f"bands {', '.join(f'{SCORE_BANDS[b][0]}-{SCORE_BANDS[b][1]}' for b in bands)}")
+    pricing.print_estimate("evaluate", calls, model_of=lambda c: c[0])
+    if args.dry_run:
+        return
+
+    # The experiment must hit the API at exactly the setting under test: no
+    # tuned profile, no byte cap re-encoding it at a lower quality or as WebP
+    original = (evaluate_models.EVAL_OUTPUT_DIR, evaluate_models.MAX_IMAGE_SIZE, evaluate_models.JPEG_QUALITY,
+                evaluate_models.ENCODING_PROFILES_PATH, evaluate_models.DEDUP_MAX_DISTANCE,
+                evaluate_models.MAX_UPLOAD_BYTES, evaluate_models.ALLOW_WEBP)
+    evaluate_models.ENCODING_PROFILES_PATH = None
+    evaluate_models.DEDUP_MAX_DISTANCE = None
+    evaluate_models.MAX_UPLOAD_BYTES = None
+    evaluate_models.ALLOW_WEBP = False
+    recommendations = {}
+    try:
+        with scheduler.graceful_shutdown():
+            for evaluator, pairs in samples.items():
+                if not pairs:
+                    print(f"⚠️ {evaluator}: no recorded evaluations to re-score, skipping")
+                    continue
+                for setting in SETTINGS:
+                    if not scheduler.stop_requested():
+                        measure_setting(evaluator, setting, pairs)
+                if scheduler.stop_requested():
+                    # Re-scores so far are kept; running the experiment again resumes it
+                    print(f"🛑 Stopped before every setting was measured, no profile for {evaluator}")
+                    break
+                evaluate_models.EVAL_OUTPUT_DIR = original[0]
+                summaries = [summarize_setting(evaluator, setting, pairs) for setting in SETTINGS]
+                chosen = recommend(summaries, min_scored=max(1, len(pairs) // 2))
+                print_summaries(evaluator, summaries, chosen)
+                if chosen is None:
+                    print("   ⚠️ Too few baseline re-scores to recommend a setting")
+                    continue
+                recommendations[evaluator] = {
+                    "max_size": chosen["max_size"],
+                    "quality": chosen["quality"],
+                    "tuned": time.strftime("%Y-%m-%d"),
+                    "sample_pairs": len(pairs),
+                    "candidates": summaries
+                }
+    finally:
+        (evaluate_models.EVAL_OUTPUT_DIR, evaluate_models.MAX_IMAGE_SIZE, evaluate_models.JPEG_QUALITY,
+         evaluate_models.ENCODING_PROFILES_PATH, evaluate_models.DEDUP_MAX_DISTANCE,
+         evaluate_models.MAX_UPLOAD_BYTES, evaluate_models.ALLOW_WEBP) = original
+
+    if recommendations:
+        write_profiles(recommendations, args.out)
+    tracing.summarize(tracing.trace_path())
+
+if __name__ == "__main__":
+    main()
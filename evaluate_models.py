@@ -1,23 +1,73 @@
 import os
-import requests
 import json
-import base64
 import time
 import sys
-import io
 import re
-from PIL import Image
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import scheduler
+import tracing
+import pricing
+import request_body
+import image_dedup
+import input_store
+import generation_cache
+import response_archive
+
+# requests and PIL are imported where they are used, so planning a run
+# (python -m floorbench evaluate --dry-run) starts without loading them.
 
 API_KEY = ""
 
 if API_KEY == "YOUR_OPENROUTER_API_KEY_HERE":
     API_KEY = os.environ.get("OPENROUTER_API_KEY")
 
+# Same endpoint override as batch_generate_3d.py (OPENROUTER_API_URL)
+API_URL = os.environ.get("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+
 INPUT_DIR = "input"
 GENERATED_DIR = "batch_outputs"
 EVAL_OUTPUT_DIR = "evaluation_outputs3"
 
+# Phase 1 (Three.js code) scenes, rendered from fixed camera presets by
+# render_harness.py into generation_outputs/<model>/views/<view>.png. The
+# scored views are evaluated as extra candidates against the Phase 1 floor plan.
+PHASE1_OUTPUT_DIR = "generation_outputs"
+PHASE1_INPUT_FILE = "floor_plan.jpg"
+PHASE1_MODEL_PREFIX = "threejs_"
+# EVAL_PROMPT asks for an angled cutaway and rejects top-down shots outright,
+# so the top-down and elevation presets are captured for inspection only
+PHASE1_SCORED_VIEWS = ("isometric",)
+# Scored views are linked into GENERATED_DIR/<subdir>/<model>/<view>.png, so
+# their generated_file is relative to GENERATED_DIR like any other candidate's
+PHASE1_VIEWS_SUBDIR = "threejs_views"
+
+# Upload encoding and concurrency (overridable from a run manifest, see run_manifest.py)
+MAX_IMAGE_SIZE = 1024
+JPEG_QUALITY = 80
+# Per-image upload cap in bytes (before base64), see request_body.encode_within,
+# e.g. 400 * 1024; None sends the fixed-quality JPEG whatever its size. Off by
+# default: a cap is part of a manifest cell's key. WebP goes only to evaluators
+# that accept it.
+MAX_UPLOAD_BYTES = None
+ALLOW_WEBP = True
+# Per-evaluator upload size/quality recommended by encoding_tuning.py, e.g.
+# {"openai/gpt-5.2": {"max_size": 768, "quality": 80}}. Evaluators without an
+# entry (or all of them, with None) use MAX_IMAGE_SIZE / JPEG_QUALITY.
+ENCODING_PROFILES_PATH = "encoding_profiles.json"
+# limiting workers to 3 to avoid high rate limits since 3 vision requests per image
+MAX_WORKERS = 3
+
+# Optional per-evaluator cap on concurrent requests, e.g. {"openai/gpt-5.2": 2}
+MODEL_CONCURRENCY = {}
+
+# Hard spending cap in USD for one run (floorbench evaluate --budget), None for no cap
+BUDGET_USD = None
+
+# Images of the same plan (and view) within this many dHash bits of an already
+# evaluated one copy its evaluation, marked with "reused_from", instead of new
+# vision calls (see image_dedup.py). None evaluates every image.
+DEDUP_MAX_DISTANCE = image_dedup.MAX_DISTANCE
+
 EVALUATOR_MODELS = [
     "google/gemini-3-flash-preview",
     "openai/gpt-5.2",
@@ -227,22 +277,35 @@ Be consistent and objective.
 def setup_directories():
     os.makedirs(EVAL_OUTPUT_DIR, exist_ok=True)
 
-def encode_image(image_path):
+_encoding_profiles = {}  # profiles path -> parsed file
+
+def encoding_for(evaluator_model):
+    # (max_size, quality) for images uploaded to this evaluator
+    if ENCODING_PROFILES_PATH is None or evaluator_model is None:
+        return MAX_IMAGE_SIZE, JPEG_QUALITY
+    if ENCODING_PROFILES_PATH not in _encoding_profiles:
+        profiles = {}
+        if os.path.exists(ENCODING_PROFILES_PATH):
+            try:
+                with open(ENCODING_PROFILES_PATH, "r", encoding="utf-8") as f:
+                    profiles = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable {ENCODING_PROFILES_PATH}: {e}")
+        _encoding_profiles[ENCODING_PROFILES_PATH] = profiles
+    profile = _encoding_profiles[ENCODING_PROFILES_PATH].get(evaluator_model)
+    if not profile:
+        return MAX_IMAGE_SIZE, JPEG_QUALITY
+    return profile["max_size"], profile["quality"]
+
+def encode_image(image_path, evaluator_model=None):
+    # DataURL for upload, cached across tasks (the input plan is sent with every evaluation)
     if not os.path.exists(image_path):
         return None
     try:
-        img = Image.open(image_path)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
         # Max size to avoid payload too large
-        max_size = 1024
-        if img.width > max_size or img.height > max_size:
-            img.thumbnail((max_size, max_size))
-            
-        buffer = io.BytesIO()
-        img.save(buffer, format="JPEG", quality=80)
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+        max_size, quality = encoding_for(evaluator_model)
+        webp = ALLOW_WEBP and request_body.accepts_webp(evaluator_model)
+        return request_body.encode_within(image_path, max_size, quality, MAX_UPLOAD_BYTES, webp)
     except Exception as e:
         print(f"❌ Error encoding image {image_path}: {e}")
         return None
@@ -257,28 +320,164 @@ def extract_json(text):
     
     return text
 
-def process_evaluation(input_filename, generated_filename, evaluator_model, generated_model_name):
+def write_evaluation(output_path, json_data):
+    # Existence of the file marks the pair done, so it must never be half-written
+    tmp_path = f"{output_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        json.dump(json_data, f, indent=4)
+    os.replace(tmp_path, output_path)
+
+def eval_output_path(input_filename, evaluator_model, generated_model_name, view=None):
+    input_base_name = os.path.splitext(input_filename)[0]
+    if view:
+        input_base_name = f"{input_base_name}_{view}"
+    output_filename_json = f"{input_base_name}_eval_by_{evaluator_model.replace('/', '_')}.json"
+    return os.path.join(EVAL_OUTPUT_DIR, generated_model_name, output_filename_json)
+
+_duplicate_groups = {}  # (input file, view) -> perceptual hashes of its generated images
+_duplicate_lock = threading.Lock()
+_hash_index = None
+_reused = []
+
+def generated_siblings(input_filename, view):
+    # {generated path: evaluated model name} of every candidate for this plan/view
+    if view:
+        siblings = {}
+        views_root = os.path.join(GENERATED_DIR, PHASE1_VIEWS_SUBDIR)
+        if os.path.isdir(views_root):
+            for model_name in sorted(os.listdir(views_root)):
+                path = phase1_view_path(model_name, view)
+                if os.path.exists(path):
+                    siblings[path] = PHASE1_MODEL_PREFIX + model_name
+        return siblings
+    inp_name = os.path.splitext(input_filename)[0]
+    return {os.path.join(GENERATED_DIR, f): os.path.splitext(f)[0][len(inp_name) + 1:]
+            for f in sorted(os.listdir(GENERATED_DIR))
+            if f.lower().endswith('.png') and f.startswith(inp_name + "_")}
+
+def duplicate_group(input_filename, generated_path, view):
+    global _hash_index
+    key = (input_filename, view)
+    with _duplicate_lock:
+        group = _duplicate_groups.get(key)
+        if group is not None and generated_path in group["hashes"]:
+            return group
+        if _hash_index is None:
+            _hash_index = image_dedup.HashIndex()
+
+    # New plan, or an image generated since the group was hashed
+    models = generated_siblings(input_filename, view)
+    hashes = image_dedup.hash_files(models, _hash_index)
+    tree = image_dedup.BKTree()
+    for path, value in hashes.items():
+        tree.add(value, path)
+    cluster_of = {path: path for path in hashes}
+    for members in image_dedup.find_clusters(hashes, DEDUP_MAX_DISTANCE):
+        for path in members:
+            cluster_of[path] = members[0]
+    group = {"tree": tree, "hashes": hashes, "models": models, "cluster_of": cluster_of}
+    with _duplicate_lock:
+        _duplicate_groups[key] = group
+    return group
+
+def find_duplicate_evaluation(task):
+    # (evaluation path, model, distance) of an evaluated near-duplicate, or None
+    inp, gen, eval_m, gen_m, view = task
+    if DEDUP_MAX_DISTANCE is None or not os.path.exists(gen):
+        return None
+    try:
+        group = duplicate_group(inp, gen, view)
+    except ImportError:
+        return None
+    if gen not in group["hashes"]:
+        return None
+    for distance, path in group["tree"].search(group["hashes"][gen], DEDUP_MAX_DISTANCE):
+        if path == gen:
+            continue
+        source = eval_output_path(inp, eval_m, group["models"][path], view)
+        if os.path.exists(source):
+            return source, group["models"][path], distance
+    return None
+
+def reuse_evaluation(task, source_path, source_model, distance):
+    inp, gen, eval_m, gen_m, view = task
+    with tracing.span("evaluate.reuse", model=eval_m, source=source_model, distance=distance):
+        with open(source_path, "r", encoding="utf-8") as f:
+            json_data = json.load(f)
+        # A copy of a copy points at the evaluation that was actually paid for
+        json_data.setdefault("reused_from", {
+            "evaluated_model": source_model,
+            "generated_file": json_data.get("generated_file"),
+            "dhash_distance": distance
+        })
+        json_data["evaluated_model"] = gen_m
+        json_data["generated_file"] = os.path.relpath(gen, GENERATED_DIR).replace(os.sep, "/")
+        output_path = eval_output_path(inp, eval_m, gen_m, view)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        write_evaluation(output_path, json_data)
+    tracing.count("pipeline_evaluations_reused_total", model=eval_m)
+    with _duplicate_lock:
+        _reused.append(task)
+    print(f"♻️ Reused {source_model}'s evaluation by {eval_m} for {os.path.basename(gen)} ({distance} bits apart)")
+    return True
+
+def split_for_reuse(tasks):
+    # One image per duplicate cluster and evaluator goes first; the rest wait
+    # for a second pass, where they copy its evaluation (or run if it failed)
+    first, followers = [], []
+    leaders = set()
+    for task in tasks:
+        inp, gen, eval_m, gen_m, view = task
+        if DEDUP_MAX_DISTANCE is None or not is_pending(task) or not os.path.exists(gen):
+            first.append(task)
+            continue
+        try:
+            group = duplicate_group(inp, gen, view)
+        except ImportError:
+            return tasks, []
+        cluster = group["cluster_of"].get(gen, gen)
+        key = (inp, view, eval_m, cluster)
+        if key in leaders and not find_duplicate_evaluation(task):
+            followers.append(task)
+        else:
+            leaders.add(key)
+            first.append(task)
+    return first, followers
+
+def process_evaluation(input_filename, generated_path, evaluator_model, generated_model_name, view=None):
+    with tracing.span("evaluate", model=evaluator_model, evaluated_model=generated_model_name,
+                      input=input_filename, view=view or "") as attrs:
+        attrs["ok"] = evaluate_one(input_filename, generated_path, evaluator_model, generated_model_name, view)
+        return attrs["ok"]
+
+def evaluate_one(input_filename, generated_path, evaluator_model, generated_model_name, view=None):
     input_path = os.path.join(INPUT_DIR, input_filename)
-    generated_path = os.path.join(GENERATED_DIR, generated_filename)
+    generated_filename = os.path.basename(generated_path)
     
     # Store outputs in a subfolder per generated model
     output_dir_for_model = os.path.join(EVAL_OUTPUT_DIR, generated_model_name)
     os.makedirs(output_dir_for_model, exist_ok=True)
     
-    input_base_name = os.path.splitext(input_filename)[0]
-    output_filename_json = f"{input_base_name}_eval_by_{evaluator_model.replace('/', '_')}.json"
-    output_path = os.path.join(output_dir_for_model, output_filename_json)
+    output_path = eval_output_path(input_filename, evaluator_model, generated_model_name, view)
+    output_filename_json = os.path.basename(output_path)
     
     if os.path.exists(output_path):
         print(f"⏭️ Skipping {output_filename_json}, already exists.")
         return True
 
-    input_b64 = encode_image(input_path)
-    generated_b64 = encode_image(generated_path)
-    if not input_b64 or not generated_b64:
+    duplicate = find_duplicate_evaluation((input_filename, generated_path, evaluator_model, generated_model_name, view))
+    if duplicate:
+        return reuse_evaluation((input_filename, generated_path, evaluator_model, generated_model_name, view), *duplicate)
+
+    with tracing.span("evaluate.encode", model=evaluator_model):
+        input_image = encode_image(input_path, evaluator_model)
+        generated_image = encode_image(generated_path, evaluator_model)
+    if not input_image or not generated_image:
         return False
 
-    print(f"🔄 Evaluating {generated_filename} using {evaluator_model}...")
+    import requests
+
+    print(f"🔄 Evaluating {generated_model_name}/{generated_filename} using {evaluator_model}...")
     headers = {
         "Authorization": f"Bearer {API_KEY}",
         "Content-Type": "application/json"
@@ -296,39 +495,58 @@ def process_evaluation(input_filename, generated_filename, evaluator_model, gene
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{input_b64}"
+                            "url": input_image
                         }
                     },
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{generated_b64}"
+                            "url": generated_image
                         }
                     }
                 ]
             }
-        ]
+        ],
+        "usage": {"include": True}
     }
+    body = request_body.JSONStream(data)
 
     for attempt in range(4):
+        if attempt and scheduler.stop_requested():
+            print(f"🛑 Not retrying {generated_filename} with {evaluator_model}, stopping")
+            return False
         try:
-            response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data, timeout=120)
+            start_time = time.time()
+            with tracing.span("evaluate.request", model=evaluator_model, attempt=attempt):
+                response = requests.post(API_URL, headers=headers, data=body, timeout=120)
+            latency = time.time() - start_time
+            scheduler.record_latency("evaluate", evaluator_model, latency, response.status_code == 200)
+            tracing.record_http("evaluate", evaluator_model, response, start_time, latency)
             if response.status_code == 200:
-                result = response.json()
+                with tracing.span("evaluate.parse", model=evaluator_model):
+                    result = response.json()
+                pricing.record_usage("evaluate", evaluator_model, result.get("usage", {}), subject=generated_model_name)
+                response_archive.archive_response("evaluate", evaluator_model, result, subject=output_filename_json,
+                                                  latency=latency, attempt=attempt)
                 if 'choices' in result and len(result['choices']) > 0:
                     content = result['choices'][0]['message'].get("content")
                     if content:
                         try:
-                            json_str = extract_json(content)
-                            json_data = json.loads(json_str)
+                            with tracing.span("evaluate.parse_scores", model=evaluator_model):
+                                json_str = extract_json(content)
+                                json_data = json.loads(json_str)
                             
                             # Add metadata
                             json_data["evaluator_model"] = evaluator_model
                             json_data["evaluated_model"] = generated_model_name
                             json_data["input_file"] = input_filename
+                            # Relative to GENERATED_DIR, which the dashboard prefixes
+                            json_data["generated_file"] = os.path.relpath(generated_path, GENERATED_DIR).replace(os.sep, "/")
+                            if view:
+                                json_data["view"] = view
                             
-                            with open(output_path, "w", encoding='utf-8') as f:
-                                json.dump(json_data, f, indent=4)
+                            with tracing.span("evaluate.write", model=evaluator_model):
+                                write_evaluation(output_path, json_data)
                             print(f"✅ SUCCESS: Saved evaluation {output_filename_json}")
                             
                             err_file_path = output_path + ".err.txt"
@@ -362,10 +580,43 @@ def process_evaluation(input_filename, generated_filename, evaluator_model, gene
             
     return False
 
-def main():
-    setup_directories()
-    
-    input_files = [f for f in os.listdir(INPUT_DIR) if os.path.isfile(os.path.join(INPUT_DIR, f)) and f.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.avif'))]
+def phase1_view_path(model_name, view):
+    return os.path.join(GENERATED_DIR, PHASE1_VIEWS_SUBDIR, model_name, f"{view}.png")
+
+def collect_phase1_view_tasks():
+    tasks = []
+    if not os.path.isdir(PHASE1_OUTPUT_DIR) or not os.path.exists(os.path.join(INPUT_DIR, PHASE1_INPUT_FILE)):
+        return tasks
+
+    for model_name in sorted(os.listdir(PHASE1_OUTPUT_DIR)):
+        model_dir = os.path.join(PHASE1_OUTPUT_DIR, model_name)
+        views_dir = os.path.join(model_dir, "views")
+        if not os.path.isdir(views_dir) or not os.path.exists(os.path.join(model_dir, "index.html")):
+            continue
+        # Views are only current if the page was rendered cleanly since it was last built
+        report_path = os.path.join(model_dir, "render_report.json")
+        try:
+            if os.path.getmtime(report_path) < os.path.getmtime(os.path.join(model_dir, "index.html")):
+                continue
+            with open(report_path, "r", encoding="utf-8") as f:
+                if json.load(f).get("status") != "ok":
+                    continue
+        except (OSError, ValueError):
+            continue
+        for view in PHASE1_SCORED_VIEWS:
+            source = os.path.join(views_dir, f"{view}.png")
+            if not os.path.exists(source):
+                continue
+            view_path = phase1_view_path(model_name, view)
+            if not os.path.exists(view_path) or not os.path.samefile(source, view_path):
+                os.makedirs(os.path.dirname(view_path), exist_ok=True)
+                generation_cache.link(source, view_path)
+            for eval_model in EVALUATOR_MODELS:
+                tasks.append((PHASE1_INPUT_FILE, view_path, eval_model, PHASE1_MODEL_PREFIX + model_name, view))
+    return tasks
+
+def plan_tasks():
+    input_files = input_store.canonical_inputs(INPUT_DIR)
     generated_files = [f for f in os.listdir(GENERATED_DIR) if f.lower().endswith('.png')]
     
     tasks = []
@@ -376,28 +627,87 @@ def main():
             if gen_file.startswith(inp_name + "_"):
                 gen_model_name = os.path.splitext(gen_file)[0][len(inp_name)+1:]
                 for eval_model in EVALUATOR_MODELS:
-                    tasks.append((inp_file, gen_file, eval_model, gen_model_name))
+                    tasks.append((inp_file, os.path.join(GENERATED_DIR, gen_file), eval_model, gen_model_name, None))
                 break
-                
-    print(f"Total evaluation tasks: {len(tasks)}")
+
+    # Rendered Phase 1 scenes share the same pool and rubric as the image models
+    view_tasks = collect_phase1_view_tasks()
+    tasks.extend(view_tasks)
+
+    print(f"Total evaluation tasks: {len(tasks)} ({len(view_tasks)} from Phase 1 scene views)")
+    return tasks
+
+def is_pending(task):
+    inp, gen, eval_m, gen_m, view = task
+    return not os.path.exists(eval_output_path(inp, eval_m, gen_m, view))
+
+def predict_task(task):
+    if not is_pending(task):
+        return 0.0
+    return scheduler.predict_latency("evaluate", task[2])
+
+def dry_run():
+    tasks = plan_tasks()
+    pending = [t for t in tasks if is_pending(t)]
+    print(f"{len(tasks) - len(pending)} already in '{EVAL_OUTPUT_DIR}', {len(pending)} to run")
+    predicted = scheduler.simulate_makespan([(t[2], predict_task(t)) for t in sorted(pending, key=predict_task, reverse=True)],
+                                            MAX_WORKERS, MODEL_CONCURRENCY)
+    print(f"Predicted makespan: {scheduler.format_duration(predicted)}")
+    first, followers = split_for_reuse(pending)
+    reusable = [t for t in first if find_duplicate_evaluation(t)]
+    if followers or reusable:
+        print(f"♻️ {len(reusable)} can copy an existing evaluation of a near-duplicate image, "
+              f"{len(followers)} more once their cluster's first image is evaluated")
+    pricing.print_estimate("evaluate", pending, model_of=lambda t: t[2])
+    if BUDGET_USD is not None:
+        pending, _ = pricing.fit_budget("evaluate", pending, lambda t: t[2], BUDGET_USD)
+    for inp, gen, eval_m, gen_m, view in pending:
+        print(f"  {gen} ({inp}) -> {eval_m}")
+
+def main():
+    setup_directories()
+    tracing.start_run("evaluate")
+    with tracing.span("ingest"):
+        input_store.ingest(INPUT_DIR)
+    
+    tasks = plan_tasks()
     
     successful = 0
     failed = 0
 
-    # limiting workers to 3 to avoid high rate limits since 3 vision requests per image
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        futures = {executor.submit(process_evaluation, inp, gen, eval_m, gen_m): (inp, gen, eval_m, gen_m) for inp, gen, eval_m, gen_m in tasks}
-        
-        for future in as_completed(futures):
-            inp, gen, eval_m, gen_m = futures[future]
-            if future.result():
-                successful += 1
-            else:
-                failed += 1
+    pending = [t for t in tasks if is_pending(t)]
+    pricing.print_estimate("evaluate", pending, model_of=lambda t: t[2])
+    worker = process_evaluation
+    deferred = []
+    if BUDGET_USD is not None:
+        _, deferred = pricing.fit_budget("evaluate", pending, lambda t: t[2], BUDGET_USD)
+        skipped = set(deferred)
+        tasks = [t for t in tasks if t not in skipped]
+        pricing.budget = pricing.Budget(BUDGET_USD)
+        worker = pricing.budgeted(process_evaluation, "evaluate", lambda t: t[2], is_pending)
+
+    with scheduler.graceful_shutdown():
+        for batch in split_for_reuse(tasks):
+            if not batch or scheduler.stop_requested():
+                continue
+            for task, success in scheduler.run_scheduled(batch, worker, MAX_WORKERS,
+                                                         model_of=lambda t: t[2], predict=predict_task,
+                                                         model_limits=MODEL_CONCURRENCY, checkpoint="evaluate"):
+                if success:
+                    successful += 1
+                else:
+                    failed += 1
 
     print("\n🏁 Evaluation Processing Complete.")
     print(f"✅ Successfully evaluated: {successful}")
     print(f"❌ Failed: {failed}")
+    if _reused:
+        print(f"♻️ Reused from near-duplicate images: {len(_reused)} (python image_dedup.py for the clusters)")
+    if deferred:
+        print(f"⏸️ Deferred by budget: {len(deferred)}")
+    if pricing.budget:
+        pricing.budget.report()
+    tracing.summarize(tracing.trace_path())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1 @@
+# Single entry point for the benchmark pipeline: python -m floorbench <command>
@@ -0,0 +1,217 @@
+import sys
+import argparse
+
+# Pipeline modules (and through them requests, PIL, selenium, tree-sitter) are
+# imported inside each command, so `--help`, dry runs and aggregation start
+# without loading the heavy dependencies of the other stages.
+
+DASHBOARD_PORT = 8002
+
+def cmd_generate(args):
+    if args.phase1:
+        import generate_phase1
+        generate_phase1.main()
+        return
+
+    import batch_generate_3d
+    batch_generate_3d.HEDGE_REQUESTS = args.hedge
+    if args.budget is not None:
+        batch_generate_3d.BUDGET_USD = args.budget
+    if args.max_upload_kb is not None:
+        batch_generate_3d.MAX_UPLOAD_BYTES = args.max_upload_kb * 1024
+    if args.dry_run:
+        batch_generate_3d.dry_run()
+    else:
+        batch_generate_3d.main()
+
+def cmd_evaluate(args):
+    import evaluate_models
+    if args.budget is not None:
+        evaluate_models.BUDGET_USD = args.budget
+    if args.max_upload_kb is not None:
+        evaluate_models.MAX_UPLOAD_BYTES = args.max_upload_kb * 1024
+    if args.dry_run:
+        evaluate_models.dry_run()
+    else:
+        evaluate_models.main()
+
+def cmd_aggregate(args):
+    import aggregate_data
+    aggregate_data.main()
+
+def cmd_render(args):
+    if not args.skip_process:
+        import process_outputs
+        process_outputs.main()
+
+    import render_harness
+    render_harness.main(["--changed-only"] if args.changed_only else [])
+
+def cmd_run(args):
+    import run_manifest
+    run_manifest.run(args.manifests, dry_run=args.dry_run)
+
+def cmd_queue(args):
+    import work_queue
+    work_queue.main(args.forward_args)
+
+def cmd_mock(args):
+    import mock_openrouter
+    mock_openrouter.main(args.forward_args)
+
+def cmd_dedup(args):
+    import image_dedup
+    image_dedup.main(args.forward_args)
+
+def cmd_ingest(args):
+    import input_store
+    input_store.main(args.forward_args)
+
+def cmd_archive(args):
+    import response_archive
+    response_archive.main(args.forward_args)
+
+def cmd_watch(args):
+    import watch
+    watch.main(args.forward_args)
+
+def cmd_tune_encoding(args):
+    import encoding_tuning
+    encoding_tuning.main(args.forward_args)
+
+def cmd_trace(args):
+    import glob
+    import os
+    import tracing
+
+    path = args.path
+    if path is None:
+        traces = sorted(glob.glob(os.path.join(tracing.TRACE_DIR, "*.jsonl")), key=os.path.getmtime)
+        if not traces:
+            print(f"No traces in {tracing.TRACE_DIR}/")
+            return
+        path = traces[-1]
+    tracing.summarize(path)
+    if args.otlp:
+        print(f"📤 OTLP/JSON written to {tracing.export_otlp(path)}")
+
+def cmd_serve(args):
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    httpd = ThreadingHTTPServer(('', args.port), SimpleHTTPRequestHandler)
+    print(f"Serving dashboard at http://localhost:{args.port}/ (Ctrl-C to stop)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="floorbench", description="3D floor plan benchmark pipeline.")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port while running")
+    parser.add_argument("--profile", action="store_true", help="profile every stage into profiles/")
+    parser.add_argument("--profile-modes", default="sample,memory", metavar="MODES",
+                        help="comma-separated sample,cprofile,memory (default: sample,memory)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help="generate 3D renders from input/ (batch_generate_3d.py)")
+    generate.add_argument("--dry-run", action="store_true", help="list pending tasks without calling the API")
+    generate.add_argument("--phase1", action="store_true", help="run the Phase 1 Three.js code generation instead")
+    generate.add_argument("--hedge", action="store_true", help="duplicate requests still running at the model's p90 latency")
+    generate.add_argument("--budget", type=float, help="hard spending cap in USD for this run")
+    generate.add_argument("--max-upload-kb", type=int, help="re-encode uploads to fit this many KB per image")
+    generate.set_defaults(func=cmd_generate)
+
+    evaluate = subparsers.add_parser("evaluate", help="score generated renders with evaluator models (evaluate_models.py)")
+    evaluate.add_argument("--dry-run", action="store_true", help="list pending evaluations without calling the API")
+    evaluate.add_argument("--budget", type=float, help="hard spending cap in USD for this run")
+    evaluate.add_argument("--max-upload-kb", type=int, help="re-encode uploads to fit this many KB per image")
+    evaluate.set_defaults(func=cmd_evaluate)
+
+    aggregate = subparsers.add_parser("aggregate", help="collect evaluations into dashboard_data.js (+ cost_report.json)")
+    aggregate.set_defaults(func=cmd_aggregate)
+
+    render = subparsers.add_parser("render", help="build Phase 1 pages and render them (process_outputs.py + render_harness.py)")
+    render.add_argument("--changed-only", action="store_true", help="only render pages whose HTML changed")
+    render.add_argument("--skip-process", action="store_true", help="don't rebuild index.html files first")
+    render.set_defaults(func=cmd_render)
+
+    run = subparsers.add_parser("run", help="run generate/evaluate stages declared in run manifests (runs/*.toml)")
+    run.add_argument("manifests", nargs="+", help="TOML run manifest(s)")
+    run.add_argument("--dry-run", action="store_true", help="show present / reusable / pending cells only")
+    run.set_defaults(func=cmd_run)
+
+    queue = subparsers.add_parser("queue", add_help=False,
+                                  help="shared work queue for several workers/hosts: enqueue | status | worker (work_queue.py)")
+    queue.add_argument("forward_args", nargs=argparse.REMAINDER)
+    queue.set_defaults(func=cmd_queue)
+
+    mock = subparsers.add_parser("mock", add_help=False, help="offline mock of the OpenRouter API (mock_openrouter.py)")
+    mock.add_argument("forward_args", nargs=argparse.REMAINDER)
+    mock.set_defaults(func=cmd_mock)
+
+    dedup = subparsers.add_parser("dedup", add_help=False,
+                                  help="report near-duplicate generated images (image_dedup.py)")
+    dedup.add_argument("forward_args", nargs=argparse.REMAINDER)
+    dedup.set_defaults(func=cmd_dedup)
+
+    ingest = subparsers.add_parser("ingest", add_help=False,
+                                   help="decode input plans once into the canonical store (input_store.py)")
+    ingest.add_argument("forward_args", nargs=argparse.REMAINDER)
+    ingest.set_defaults(func=cmd_ingest)
+
+    archive = subparsers.add_parser("archive", add_help=False,
+                                    help="inspect, import or replay archived API responses (response_archive.py)")
+    archive.add_argument("forward_args", nargs=argparse.REMAINDER)
+    archive.set_defaults(func=cmd_archive)
+
+    watch = subparsers.add_parser("watch", add_help=False,
+                                  help="generate, evaluate and aggregate as input/output files change (watch.py)")
+    watch.add_argument("forward_args", nargs=argparse.REMAINDER)
+    watch.set_defaults(func=cmd_watch)
+
+    tune = subparsers.add_parser("tune-encoding", add_help=False,
+                                 help="find each evaluator's cheapest upload size/quality (encoding_tuning.py)")
+    tune.add_argument("forward_args", nargs=argparse.REMAINDER)
+    tune.set_defaults(func=cmd_tune_encoding)
+
+    trace = subparsers.add_parser("trace", help="summarize a run trace (per-model p50/p95/p99, throughput)")
+    trace.add_argument("path", nargs="?", help="traces/<run>.jsonl (default: most recent)")
+    trace.add_argument("--otlp", action="store_true", help="also export it as OTLP/JSON")
+    trace.set_defaults(func=cmd_trace)
+
+    serve = subparsers.add_parser("serve", help="serve the dashboard from the repo root")
+    serve.add_argument("--port", type=int, default=DASHBOARD_PORT)
+    serve.set_defaults(func=cmd_serve)
+
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args, unknown = parser.parse_known_args(argv)
+    if hasattr(args, "forward_args"):
+        # Forwarding commands parse their own options (incl. --help); argparse's
+        # REMAINDER drops a leading option, so forward the raw tail instead
+        args.forward_args = argv[argv.index(args.command) + 1:]
+    elif unknown:
+        parser.error(f"unrecognized arguments: {' '.join(unknown)}")
+    if args.metrics_port:
+        import tracing
+        tracing.start_metrics_server(args.metrics_port)
+    if args.profile:
+        import profiling
+        modes = [m.strip() for m in args.profile_modes.split(",")]
+        invalid = set(modes) - set(profiling.MODES)
+        if invalid:
+            parser.error(f"unknown --profile-modes mode(s): {', '.join(sorted(invalid))}")
+        profiling.start(args.command, modes)
+    try:
+        args.func(args)
+    finally:
+        if args.profile:
+            profiling.stop()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
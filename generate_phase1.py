@@ -1,9 +1,11 @@
 import os
-import requests
 import json
 import base64
 import time
 import sys
+import pricing
+import response_archive
+from evaluate_models import PHASE1_MODEL_PREFIX
 
 # Configuration
 # Configuration
@@ -15,6 +17,10 @@ API_KEY = "YOUR_OPENROUTER_API_KEY_HERE"
 # Fallback to environment variable if not set above
 if API_KEY == "YOUR_OPENROUTER_API_KEY_HERE":
     API_KEY = os.environ.get("OPENROUTER_API_KEY")
+
+# Same endpoint override as batch_generate_3d.py (OPENROUTER_API_URL)
+API_URL = os.environ.get("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+
 INPUT_IMAGE_PATH = os.path.join("input", "floor_plan.jpg")
 OUTPUT_DIR = "generation_outputs"
 
@@ -69,6 +75,8 @@ def encode_image(image_path):
         return base64.b64encode(image_file.read()).decode('utf-8')
 
 def generate_3d(model, image_base64):
+    import requests
+
     headers = {
         "Authorization": f"Bearer {API_KEY}",
         "HTTP-Referer": "https://antigravity.dev", # Optional
@@ -92,12 +100,13 @@ def generate_3d(model, image_base64):
                 ]
             }
         ],
+        "usage": {"include": True},
         **PARAMS
     }
     
     start_time = time.time()
     try:
-        response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data)
+        response = requests.post(API_URL, headers=headers, json=data)
         end_time = time.time()
         return response, end_time - start_time
     except Exception as e:
@@ -109,7 +118,7 @@ def validate_and_save(model, content, usage, latency):
     model_output_dir = os.path.join(OUTPUT_DIR, sanitized_model_name)
     os.makedirs(model_output_dir, exist_ok=True)
 
-    # Save Full Raw Response (for debugging)
+    # Message text, for debugging; the whole response JSON goes to response_archive
     with open(os.path.join(model_output_dir, "full_response.txt"), "w", encoding='utf-8') as f:
         f.write(content)
 
@@ -155,13 +164,16 @@ def validate_and_save(model, content, usage, latency):
         render_success = False
         runtime_errors.append("Code too short")
 
+    # Evaluations know rendered Phase 1 scenes as threejs_<model dir>
+    cost = pricing.record_usage("phase1", model, usage, subject=PHASE1_MODEL_PREFIX + sanitized_model_name)
+
     # Metadata
     metadata = {
         "model_name": model,
         "tokens_in": usage.get("prompt_tokens", 0),
         "tokens_out": usage.get("completion_tokens", 0),
         "latency": latency,
-        "cost_estimate": 0, # To be implemented
+        "cost_estimate": round(cost, 6),
         "render_success": render_success,
         "runtime_errors": runtime_errors,
         "timestamp": time.time()
@@ -172,7 +184,7 @@ def validate_and_save(model, content, usage, latency):
         json.dump(metadata, f, indent=4)
 
     print(f"[{model}] Saved to {raw_output_path}")
-    print(f"[{model}] Latency: {latency:.2f}s | Tokens Out: {metadata['tokens_out']}")
+    print(f"[{model}] Latency: {latency:.2f}s | Tokens Out: {metadata['tokens_out']} | Cost: ${cost:.4f}")
 
 def main():
     print("🚀 PHASE 1 — GENERATION PIPELINE SETUP")
@@ -199,6 +211,7 @@ def main():
         
         if response and response.status_code == 200:
             result = response.json()
+            response_archive.archive_response("phase1", model, result, subject=model.split("/")[-1], latency=latency)
             if 'choices' in result and len(result['choices']) > 0:
                 content = result['choices'][0]['message']['content']
                 usage = result.get('usage', {})
@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+# Content-addressed store of generated images. A result is keyed by everything
+# that determines it (input bytes, model, prompt text, request params), so
+# changing the prompt or input misses the cache and switching back hits it
+# again. Run directories only hold aliases (hard links, else symlinks) into
+# the store. Hard links come first because run directories like batch_outputs/
+# are committed, and a symlink into .cache/ would not survive a clone.
+CACHE_DIR = os.path.join(".cache", "generations")
+INDEX_FILENAME = "index.json"
+
+# LRU eviction kicks in once stored objects exceed this many bytes
+MAX_CACHE_BYTES = 5 * 1024 ** 3
+
+_lock = threading.Lock()
+_index = None
+_input_hashes = {}
+
+def file_sha256(path):
+    stat = os.stat(path)
+    cache_key = (path, stat.st_size, stat.st_mtime_ns)
+    if cache_key not in _input_hashes:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        _input_hashes[cache_key] = digest.hexdigest()
+    return _input_hashes[cache_key]
+
+def generation_key(input_path, model, prompt, params):
+    parts = {
+        "input": file_sha256(input_path),
+        "model": model,
+        "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+        "params": params
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+def object_path(key):
+    return os.path.join(CACHE_DIR, "objects", key[:2], f"{key}.png")
+
+def _load_index():
+    global _index
+    if _index is None:
+        path = os.path.join(CACHE_DIR, INDEX_FILENAME)
+        _index = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    _index = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Generation cache index unreadable, starting fresh: {e}")
+    return _index
+
+def _save_index():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, INDEX_FILENAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(_index, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def lookup(key):
+    with _lock:
+        index = _load_index()
+        entry = index.get(key)
+        path = object_path(key)
+        if entry is None or not os.path.exists(path):
+            index.pop(key, None)
+            return None
+        entry["last_access"] = time.time()
+        _save_index()
+        return path
+
+def store(key, data, meta=None):
+    # Always a file of its own: sharing an inode with e.g. a response archive
+    # blob would keep eviction from freeing anything and make is_managed()
+    # true for files outside the store
+    path = object_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+    with _lock:
+        index = _load_index()
+        index[key] = dict(meta or {}, size=len(data), created=time.time(), last_access=time.time())
+        _evict(index, keep=key)
+        _save_index()
+    return path
+
+def _evict(index, keep):
+    total = sum(entry["size"] for entry in index.values())
+    if total <= MAX_CACHE_BYTES:
+        return
+    for key in sorted(index, key=lambda k: index[k]["last_access"]):
+        if total <= MAX_CACHE_BYTES:
+            break
+        if key == keep:
+            continue
+        total -= index[key]["size"]
+        del index[key]
+        try:
+            os.remove(object_path(key))
+        except FileNotFoundError:
+            pass
+
+def link(target_path, alias_path):
+    # Human-readable name in the run directory -> cached object, falling back to a
+    # copy where neither kind of link is possible (e.g. across filesystems on Windows).
+    if os.path.lexists(alias_path):
+        os.remove(alias_path)
+    try:
+        os.link(target_path, alias_path)
+        return
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.relpath(target_path, os.path.dirname(alias_path) or "."), alias_path)
+    except (OSError, NotImplementedError):
+        shutil.copy2(target_path, alias_path)
+
+def is_alias(alias_path, key):
+    path = object_path(key)
+    return os.path.exists(alias_path) and os.path.exists(path) and os.path.samefile(alias_path, path)
+
+def is_managed(alias_path):
+    # Aliases are links into the store; plain files predate the cache
+    return os.path.islink(alias_path) or (os.path.exists(alias_path) and os.stat(alias_path).st_nlink > 1)
@@ -0,0 +1,197 @@
+import time
+import socket
+import threading
+import pricing
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Hedged requests: if the first attempt hasn't answered by the model's observed
+# p90 latency, send one duplicate and take whichever succeeds first. Only the
+# slowest ~10% of calls are duplicated, and a per-run budget caps the extra spend.
+
+class HedgeBudget:
+    def __init__(self, max_extra_requests, concurrency):
+        self.max_extra_requests = max_extra_requests
+        # Attempts run here rather than in the caller's worker pool. A losing
+        # primary keeps its thread until it answers or times out, but each of
+        # those follows a hedge that used up one extra request, so with these
+        # sizes neither a primary nor a hedge ever waits behind another call.
+        self.primaries = ThreadPoolExecutor(max_workers=concurrency + max_extra_requests,
+                                            thread_name_prefix="hedge_primary")
+        self.hedges = ThreadPoolExecutor(max_workers=max(max_extra_requests, 1), thread_name_prefix="hedge")
+        self.extra_requests = 0
+        self.hedges_won = 0
+        self.saved_seconds = 0.0
+        self.extra_usage = []  # usage blocks of losing requests that completed anyway
+        self.cancelled = 0  # losing requests whose connection was closed mid-flight
+        self.extra_cost = 0.0
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            if self.extra_requests >= self.max_extra_requests:
+                return False
+            self.extra_requests += 1
+            return True
+
+    def record_win(self, saved_seconds):
+        with self._lock:
+            self.hedges_won += 1
+            self.saved_seconds += max(saved_seconds, 0.0)
+
+    def record_cancelled(self):
+        with self._lock:
+            self.cancelled += 1
+
+    def record_loser_usage(self, usage, cost):
+        with self._lock:
+            self.extra_usage.append(usage)
+            self.extra_cost += cost
+
+    def report(self):
+        print(f"🪃 Hedging: {self.extra_requests}/{self.max_extra_requests} extra requests sent, "
+              f"{self.hedges_won} won, ~{self.saved_seconds:.1f}s of tail latency saved (measured where the loser finished)")
+        if self.cancelled:
+            print(f"   {self.cancelled} losing requests cancelled (their connection closed once the other answered)")
+        if self.extra_usage:
+            tokens = sum(u.get("prompt_tokens", 0) + u.get("completion_tokens", 0) for u in self.extra_usage)
+            print(f"   Extra tokens billed by completed duplicates: {tokens} (${self.extra_cost:.2f})")
+
+    def shutdown(self):
+        # Losing attempts still running are left to finish in the background
+        self.primaries.shutdown(wait=False)
+        self.hedges.shutdown(wait=False)
+
+class Attempt:
+    # One request whose connection can be torn down from another thread: its
+    # sockets are shut down, which wakes the read it is blocked in with an error
+    def __init__(self):
+        self.sockets = []
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+        for sock in list(self.sockets):
+            _shutdown(sock)
+
+def _shutdown(sock):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+_current = threading.local()  # the Attempt running on this thread
+_adapter_class = []
+
+def _tracking_session():
+    # A requests session whose connections register their socket with the
+    # current thread's Attempt (requests itself exposes no handle to abort a call)
+    import requests
+    if not _adapter_class:
+        from requests.adapters import HTTPAdapter
+        from urllib3.connection import HTTPConnection, HTTPSConnection
+        from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+        def tracked(base):
+            class TrackedConnection(base):
+                def connect(self):
+                    super().connect()
+                    attempt = getattr(_current, "attempt", None)
+                    if attempt is not None:
+                        attempt.sockets.append(self.sock)
+                        if attempt.cancelled.is_set():
+                            _shutdown(self.sock)
+            return TrackedConnection
+
+        class TrackedPool(HTTPConnectionPool):
+            ConnectionCls = tracked(HTTPConnection)
+
+        class TrackedHTTPSPool(HTTPSConnectionPool):
+            ConnectionCls = tracked(HTTPSConnection)
+
+        class TrackedAdapter(HTTPAdapter):
+            def init_poolmanager(self, *args, **kwargs):
+                super().init_poolmanager(*args, **kwargs)
+                self.poolmanager.pool_classes_by_scheme = {"http": TrackedPool, "https": TrackedHTTPSPool}
+
+        _adapter_class.append(TrackedAdapter)
+    session = requests.Session()
+    adapter = _adapter_class[0]()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _attempt(attempt, url, headers, body, timeout):
+    _current.attempt = attempt
+    session = _tracking_session()
+    start_time = time.time()
+    try:
+        response = session.post(url, headers=headers, data=body, timeout=timeout)
+        return response, time.time() - start_time
+    finally:
+        _current.attempt = None
+        session.close()
+
+def hedged_post(url, headers, body, timeout, hedge_after, budget):
+    # Returns the first successful (HTTP 200) response, or the last failure.
+    # Exceptions from both attempts propagate like requests.post would. body is
+    # a request_body.JSONStream, which both attempts can iterate independently.
+    start_time = time.time()
+    model = body.model
+    attempts = {"primary": Attempt(), "hedge": Attempt()}
+    primary = budget.primaries.submit(_attempt, attempts["primary"], url, headers, body, timeout)
+
+    done, _ = wait([primary], timeout=hedge_after)
+    if done or hedge_after is None or not budget.take():
+        return primary.result()[0]
+
+    hedge = budget.hedges.submit(_attempt, attempts["hedge"], url, headers, body, timeout)
+    pending = {primary, hedge}
+    last_error = None
+    last_response = None
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                response, _ = future.result()
+            except Exception as e:
+                last_error = e
+                continue
+            if response.status_code != 200:
+                last_response = response
+                continue
+
+            # Close the loser's connection so it stops holding a worker (and,
+            # where the provider aborts on disconnect, stops generating)
+            loser, winner_elapsed = (primary, time.time() - start_time) if future is hedge else (hedge, None)
+            loser_attempt = attempts["primary" if loser is primary else "hedge"]
+            loser_attempt.cancel()
+            loser.add_done_callback(lambda f: _settle_loser(f, loser_attempt, budget, winner_elapsed, model))
+            return response
+
+    if last_response is not None:
+        return last_response
+    raise last_error
+
+def _settle_loser(future, attempt, budget, winner_elapsed, model):
+    # A loser that answered before it could be cancelled is billed like any
+    # other call. When the hedge won, the primary's latency tells how much tail
+    # time the duplicate saved; a cancelled primary was still running at the
+    # win, so it counts as a win without a known saving.
+    try:
+        response, latency = future.result()
+    except Exception:
+        if attempt.cancelled.is_set():
+            budget.record_cancelled()
+        if winner_elapsed is not None:
+            budget.record_win(0.0)
+        return
+    try:
+        usage = response.json().get("usage", {})
+        # Counts against the run's spending cap
+        budget.record_loser_usage(usage, pricing.record_usage("generate", model, usage, hedge=True))
+    except Exception:
+        pass
+    response.close()
+    if winner_elapsed is not None:
+        budget.record_win(latency - winner_elapsed)
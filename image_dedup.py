@@ -0,0 +1,248 @@
+import os
+import json
+import argparse
+import threading
+import input_store
+
+# Perceptual-hash index of generated images. Providers sometimes return the
+# same picture for related models (preview vs. non-preview variants) or hand
+# back the input plan unchanged; images whose 256-bit difference hashes (dHash)
+# are within MAX_DISTANCE bits of each other are treated as duplicates, so
+# evaluate_models.py can copy an existing evaluation instead of paying for new
+# vision calls. Lookups go through a BK-tree, so finding all neighbours of an
+# image doesn't compare it against every other hash.
+#   python image_dedup.py                 # cluster report for batch_outputs/
+#   python image_dedup.py --max-distance 20   # looser: of 256 bits, default 12
+INDEX_PATH = os.path.join(".cache", "phash_index.json")
+REPORT_PATH = "dedup_report.json"
+
+GENERATED_DIR = "batch_outputs"
+INPUT_DIR = "input"
+
+# dHash compares HASH_SIZE + 1 columns per row of a HASH_SIZE-row thumbnail.
+# The common 8x8 hash is too coarse here: renders of one plan share layout
+# and background, and distinct ones came within 4 of 64 bits.
+HASH_SIZE = 16
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+# Differing bits (of HASH_BITS) still counted as the same image. Across
+# batch_outputs/, a JPEG q60 re-encode at 3/4 size stays within 11 bits, while
+# distinct renders of the same plan are 19+ apart (99% are 60+).
+MAX_DISTANCE = 12
+
+def dhash(image_path):
+    from PIL import Image
+    img = input_store.open_rgb(image_path)
+    pixels = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def hex_hash(value):
+    return f"{value:0{HASH_BITS // 4}x}"
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    # Burkhard-Keller tree over Hamming distance: every child edge is labelled
+    # with its distance to the parent, so a radius search only descends into
+    # edges within [d - radius, d + radius] by the triangle inequality.
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        node = (value, [item], {})
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            if distance == 0:
+                current[1].append(item)
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, radius):
+        # [(distance, item)] for everything within radius of value
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                found.extend((distance, item) for item in items)
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return sorted(found)
+
+    def __len__(self):
+        return self.size
+
+class HashIndex:
+    # dHash per image file, persisted across runs and recomputed only when a
+    # file's size or mtime changes
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.dirty = False
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Perceptual hash index unreadable, rebuilding: {e}")
+
+    def hash_of(self, image_path):
+        stat = os.stat(image_path)
+        key = os.path.abspath(image_path)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns \
+                    and entry.get("bits") == HASH_BITS:
+                return int(entry["dhash"], 16)
+        value = dhash(image_path)
+        with self.lock:
+            self.entries[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "bits": HASH_BITS,
+                                 "dhash": hex_hash(value)}
+            self.dirty = True
+        return value
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(self.path + ".tmp", self.path)
+            self.dirty = False
+
+def hash_files(paths, index=None):
+    # {path: dHash}, skipping files PIL can't read
+    index = index or HashIndex()
+    hashes = {}
+    for path in paths:
+        try:
+            hashes[path] = index.hash_of(path)
+        except ImportError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Could not hash {path}: {e}")
+    index.save()
+    return hashes
+
+def find_clusters(hashes, max_distance=MAX_DISTANCE):
+    # Groups of 2+ paths connected by links of at most max_distance bits
+    # (single linkage), each sorted, largest groups first
+    tree = BKTree()
+    for path, value in hashes.items():
+        tree.add(value, path)
+
+    parent = {path: path for path in hashes}
+
+    def root(path):
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    for path, value in hashes.items():
+        for _, other in tree.search(value, max_distance):
+            a, b = root(path), root(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    groups = {}
+    for path in hashes:
+        groups.setdefault(root(path), []).append(path)
+    return sorted((sorted(g) for g in groups.values() if len(g) > 1), key=lambda g: (-len(g), g[0]))
+
+def split_output_name(filename, input_names):
+    # "floor_plan10_openai_gpt-5-image.png" -> ("floor_plan10", "openai_gpt-5-image"),
+    # preferring the longest input name so floor_plan1 doesn't claim floor_plan10_*
+    stem = os.path.splitext(filename)[0]
+    for name in sorted(input_names, key=len, reverse=True):
+        if stem.startswith(name + "_"):
+            return name, stem[len(name) + 1:]
+    return None, stem
+
+def build_report(max_distance=MAX_DISTANCE):
+    inputs = [os.path.join(INPUT_DIR, f) for f in input_store.list_inputs(INPUT_DIR)]
+    outputs = sorted(os.path.join(GENERATED_DIR, f) for f in os.listdir(GENERATED_DIR) if f.lower().endswith('.png'))
+    index = HashIndex()
+    input_hashes = hash_files(inputs, index)
+    output_hashes = hash_files(outputs, index)
+    input_names = {os.path.splitext(os.path.basename(p))[0] for p in inputs}
+
+    clusters = []
+    for members in find_clusters(output_hashes, max_distance):
+        plans = {split_output_name(os.path.basename(p), input_names)[0] for p in members}
+        clusters.append({
+            "size": len(members),
+            "same_input": len(plans) == 1,
+            "max_distance": max(hamming(output_hashes[a], output_hashes[b]) for a in members for b in members),
+            "members": [{"file": os.path.basename(p), "model": split_output_name(os.path.basename(p), input_names)[1],
+                         "dhash": hex_hash(output_hashes[p])} for p in members]
+        })
+
+    # Outputs that are (nearly) their own input plan, i.e. no 3D conversion happened
+    inputs_by_name = {}
+    for path in input_hashes:
+        inputs_by_name.setdefault(os.path.splitext(os.path.basename(path))[0], []).append(path)
+    echoes = []
+    for path, value in output_hashes.items():
+        plan, model = split_output_name(os.path.basename(path), input_names)
+        for input_path in inputs_by_name.get(plan, []):
+            distance = hamming(value, input_hashes[input_path])
+            if distance <= max_distance:
+                echoes.append({"file": os.path.basename(path), "model": model,
+                               "input": os.path.basename(input_path), "distance": distance})
+                break
+
+    return {"max_distance": max_distance, "images": len(output_hashes), "clusters": clusters, "input_echoes": echoes}
+
+def print_report(report):
+    duplicates = sum(c["size"] - 1 for c in report["clusters"])
+    print(f"🧬 {report['images']} images, {len(report['clusters'])} duplicate clusters "
+          f"({duplicates} redundant copies, ≤{report['max_distance']} bits apart)")
+    for cluster in report["clusters"]:
+        scope = "same plan" if cluster["same_input"] else "⚠️ across plans"
+        print(f"   [{cluster['size']}, ≤{cluster['max_distance']} bits, {scope}]")
+        for member in cluster["members"]:
+            print(f"      {member['file']}")
+    if report["input_echoes"]:
+        print(f"🪞 {len(report['input_echoes'])} outputs are their input plan returned unchanged:")
+        for echo in report["input_echoes"]:
+            print(f"      {echo['file']} ≈ {echo['input']} ({echo['distance']} bits)")
+
+def build_arg_parser(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(description="Report near-duplicate generated images.")
+    parser.add_argument("--max-distance", type=int, default=MAX_DISTANCE, help=f"max differing dHash bits (of {HASH_BITS})")
+    parser.add_argument("--out", default=REPORT_PATH, help="JSON report path")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    report = build_report(args.max_distance)
+    print_report(report)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"📄 Report written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import os
+import json
+import mmap
+import shutil
+import argparse
+import threading
+import generation_cache
+
+# Canonical store of the input floor plans. `python -m floorbench ingest` (and
+# every generate/evaluate run, for new or changed files) decodes each input
+# once into .cache/inputs/<sha>/:
+#   rgb.raw              decoded RGB pixels, memory-mapped by open_rgb()
+#   <size>_q<quality>.jpg  upload JPEGs, STANDARD_VARIANTS up front, others on first use
+#   variants.v<N>        VARIANT_VERSION the JPEGs were made with
+# so encoding an upload never decodes the original (AVIF especially) again.
+# Inputs sharing a basename (floor_plan12.png / floor_plan12.webp) would write
+# the same output files, so only one of them is used; see canonical_inputs().
+STORE_DIR = os.path.join(".cache", "inputs")
+INDEX_FILENAME = "index.json"
+
+INPUT_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.avif')
+
+# (max_size, JPEG quality) made at ingestion: the generate and evaluate defaults
+STANDARD_VARIANTS = ((2048, 85), (1024, 80))
+
+# Which of several same-named inputs is kept: lossless first, AVIF last
+FORMAT_PRIORITY = ('.png', '.webp', '.jpg', '.jpeg', '.avif')
+
+# Encoded from the file itself (see request_body._load_image), never the pixels
+DRAFT_EXTENSIONS = ('.jpg', '.jpeg')
+
+# Bumped when stored variants would no longer match a fresh encode; entries of
+# another version are re-ingested and their variants made again.
+# 2: JPEG inputs downscale with draft() again, as before the store
+VARIANT_VERSION = 2
+
+_lock = threading.Lock()
+_index = None
+_warned = set()
+
+def _load_index():
+    global _index
+    if _index is None:
+        path = os.path.join(STORE_DIR, INDEX_FILENAME)
+        _index = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    _index = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Input store index unreadable, re-ingesting: {e}")
+    return _index
+
+def _save_index():
+    os.makedirs(STORE_DIR, exist_ok=True)
+    path = os.path.join(STORE_DIR, INDEX_FILENAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(_index, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def entry_dir(sha):
+    return os.path.join(STORE_DIR, sha[:2], sha)
+
+def variant_path(sha, max_size, quality):
+    return os.path.join(entry_dir(sha), f"{max_size}_q{quality}.jpg")
+
+def list_inputs(input_dir):
+    return sorted(f for f in os.listdir(input_dir)
+                  if os.path.isfile(os.path.join(input_dir, f)) and f.lower().endswith(INPUT_EXTENSIONS))
+
+def _priority(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return (FORMAT_PRIORITY.index(ext) if ext in FORMAT_PRIORITY else len(FORMAT_PRIORITY), filename)
+
+def collisions(input_dir, filenames=None):
+    # [{stem, kept, skipped, identical}] for basenames shared by several inputs
+    by_stem = {}
+    for filename in filenames if filenames is not None else list_inputs(input_dir):
+        by_stem.setdefault(os.path.splitext(filename)[0], []).append(filename)
+    found = []
+    for stem, group in sorted(by_stem.items()):
+        if len(group) < 2:
+            continue
+        group = sorted(group, key=_priority)
+        hashes = {generation_cache.file_sha256(os.path.join(input_dir, f)) for f in group}
+        found.append({"stem": stem, "kept": group[0], "skipped": group[1:], "identical": len(hashes) == 1})
+    return found
+
+def canonical_inputs(input_dir, filenames=None):
+    # Input filenames with at most one file per basename, warning once about the others
+    filenames = list_inputs(input_dir) if filenames is None else sorted(filenames)
+    skipped = set()
+    for collision in collisions(input_dir, filenames):
+        skipped.update(collision["skipped"])
+        if collision["stem"] not in _warned:
+            _warned.add(collision["stem"])
+            same = "identical copies" if collision["identical"] else "DIFFERENT images"
+            print(f"⚠️ Inputs {', '.join([collision['kept']] + collision['skipped'])} share a basename ({same}); "
+                  f"using {collision['kept']}, rename the others to include them")
+    return [f for f in filenames if f not in skipped]
+
+def lookup(path):
+    # Store entry for an ingested, unchanged file, else None
+    stat = os.stat(path)
+    with _lock:
+        entry = _load_index().get(os.path.abspath(path))
+    if entry and entry["source_size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns \
+            and entry.get("variants") == VARIANT_VERSION and os.path.exists(os.path.join(entry_dir(entry["sha256"]), "rgb.raw")):
+        return entry
+    return None
+
+def ingest_file(path):
+    entry = lookup(path)
+    if entry is None:
+        from PIL import Image
+        stat = os.stat(path)
+        sha = generation_cache.file_sha256(path)
+        raw_path = os.path.join(entry_dir(sha), "rgb.raw")
+        with Image.open(path) as img:
+            rgb = img.convert("RGB")
+        if not os.path.exists(raw_path):
+            # Same content under another name shares the pixels
+            os.makedirs(entry_dir(sha), exist_ok=True)
+            with open(raw_path + ".tmp", "wb") as f:
+                f.write(rgb.tobytes())
+            os.replace(raw_path + ".tmp", raw_path)
+        marker = os.path.join(entry_dir(sha), f"variants.v{VARIANT_VERSION}")
+        if not os.path.exists(marker):
+            for name in os.listdir(entry_dir(sha)):
+                if name.endswith(".jpg") or name.startswith("variants.v"):
+                    os.remove(os.path.join(entry_dir(sha), name))
+            open(marker, "w").close()
+        entry = {"sha256": sha, "width": rgb.width, "height": rgb.height,
+                 "format": os.path.splitext(path)[1].lower().lstrip("."),
+                 "source_size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "variants": VARIANT_VERSION}
+        with _lock:
+            _load_index()[os.path.abspath(path)] = entry
+            _save_index()
+
+    # Encoded through request_body so the stored bytes are exactly what it uploads
+    import request_body
+    for max_size, quality in STANDARD_VARIANTS:
+        if not os.path.exists(variant_path(entry["sha256"], max_size, quality)):
+            request_body.encode_jpeg(path, max_size, quality)
+    return entry
+
+def ingest(input_dir):
+    # Ingests every input; returns {filename: entry}
+    entries = {}
+    for filename in list_inputs(input_dir):
+        try:
+            entries[filename] = ingest_file(os.path.join(input_dir, filename))
+        except Exception as e:
+            print(f"❌ Could not ingest {filename}: {e}")
+    prune()
+    return entries
+
+def prune():
+    # Drops entries of deleted inputs and pixel/variant dirs nothing refers to
+    with _lock:
+        index = _load_index()
+        for path in [p for p in index if not os.path.exists(p)]:
+            del index[path]
+        _save_index()
+        referenced = {entry["sha256"] for entry in index.values()}
+    for prefix in os.listdir(STORE_DIR):
+        prefix_dir = os.path.join(STORE_DIR, prefix)
+        if not os.path.isdir(prefix_dir):
+            continue
+        for sha in os.listdir(prefix_dir):
+            if sha not in referenced:
+                shutil.rmtree(os.path.join(prefix_dir, sha), ignore_errors=True)
+
+def open_rgb(path):
+    # RGB PIL image: a read-only view of the store's memory map for ingested
+    # inputs, else the file decoded as before
+    from PIL import Image
+    entry = lookup(path)
+    if entry is None:
+        img = Image.open(path)
+        return img if img.mode == 'RGB' else img.convert('RGB')
+    with open(os.path.join(entry_dir(entry["sha256"]), "rgb.raw"), "rb") as f:
+        pixels = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return Image.frombuffer("RGB", (entry["width"], entry["height"]), pixels, "raw", "RGB", 0, 1)
+
+def read_variant(path, max_size, quality):
+    entry = lookup(path)
+    if entry is None:
+        return None
+    variant = variant_path(entry["sha256"], max_size, quality)
+    if not os.path.exists(variant):
+        return None
+    with open(variant, "rb") as f:
+        return f.read()
+
+def save_variant(path, max_size, quality, data):
+    # No-op for files outside the store (generated images, unknown inputs)
+    entry = lookup(path)
+    if entry is None:
+        return
+    variant = variant_path(entry["sha256"], max_size, quality)
+    tmp_path = f"{variant}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, variant)
+
+def print_store(input_dir, entries):
+    print(f"📥 {len(entries)} inputs in {STORE_DIR}/")
+    for filename, entry in sorted(entries.items()):
+        variants = sorted(f for f in os.listdir(entry_dir(entry["sha256"])) if f.endswith(".jpg"))
+        print(f"   {filename:<22} {entry['width']:>5}x{entry['height']:<5} {entry['format']:<5} "
+              f"{entry['sha256'][:12]}  {', '.join(os.path.splitext(v)[0] for v in variants)}")
+    found = collisions(input_dir)
+    for collision in found:
+        same = "identical" if collision["identical"] else "different images"
+        print(f"⚠️ Basename collision '{collision['stem']}' ({same}): using {collision['kept']}, "
+              f"skipping {', '.join(collision['skipped'])}")
+    if not found:
+        print("✅ No basename collisions")
+
+def build_arg_parser(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(description="Decode input floor plans once into the canonical store.")
+    parser.add_argument("--input-dir", default="input")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    print_store(args.input_dir, ingest(args.input_dir))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import glob
+import zlib
+import base64
+import random
+import struct
+import argparse
+import threading
+import hashlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local stand-in for OpenRouter's /api/v1/chat/completions, for measuring the
+# pipeline without API spend or provider noise:
+#   python mock_openrouter.py --port 8765 --latency-median 2 --error-rate-429 0.05
+#   OPENROUTER_API_URL=http://localhost:8765/api/v1/chat/completions OPENROUTER_API_KEY=mock python batch_generate_3d.py
+# Image requests are answered in each of the response shapes process_file_model
+# parses; evaluation requests (response_format json_object) get rubric JSON.
+DEFAULT_PORT = 8765
+
+# Image-generation response shapes, see process_file_model in batch_generate_3d.py
+SHAPES = ("images", "content_list", "output_image", "data_b64", "markdown_url")
+
+DEFAULT_CONFIG = {
+    "latency_median": 1.0,   # seconds, lognormal
+    "latency_sigma": 0.5,
+    "error_rate_429": 0.0,
+    "error_rate_5xx": 0.0,
+    "image_size": 1024,
+    "shape": None,           # None: pick per model, so every parser path is exercised
+    "replay_dir": None,      # recorded response bodies (*.json) to serve instead of synthetic ones
+    "models": {}             # per-model overrides of any of the keys above
+}
+
+_png_cache = {}
+_png_lock = threading.Lock()
+
+def make_png(size):
+    # Gradient RGB PNG written with zlib alone, so the mock needs no PIL
+    with _png_lock:
+        if size not in _png_cache:
+            row_pattern = bytes((x * 255 // max(size - 1, 1)) for x in range(size))
+            rows = []
+            for y in range(size):
+                shade = y * 255 // max(size - 1, 1)
+                row = bytearray(size * 3)
+                row[0::3] = row_pattern
+                row[1::3] = bytes([shade]) * size
+                row[2::3] = bytes([128]) * size
+                rows.append(b"\x00" + bytes(row))
+
+            def chunk(kind, data):
+                return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+            header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+            _png_cache[size] = (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+                                + chunk(b"IDAT", zlib.compress(b"".join(rows), 1)) + chunk(b"IEND", b""))
+        return _png_cache[size]
+
+def load_replays(replay_dir):
+    replays = {}
+    if not replay_dir:
+        return replays
+    for path in sorted(glob.glob(os.path.join(replay_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            body = json.load(f)
+        replays.setdefault(body.get("model", "*"), []).append(body)
+    return replays
+
+def model_setting(config, model, key):
+    return config["models"].get(model, {}).get(key, config[key])
+
+def model_shape(config, model):
+    shape = model_setting(config, model, "shape")
+    if shape:
+        return shape
+    return SHAPES[int(hashlib.md5(model.encode("utf-8")).hexdigest(), 16) % len(SHAPES)]
+
+def usage_for(request_bytes, completion_tokens):
+    # Roughly what OpenRouter reports: ~4 bytes of request per prompt token
+    return {"prompt_tokens": request_bytes // 4, "completion_tokens": completion_tokens,
+            "total_tokens": request_bytes // 4 + completion_tokens, "cost": 0.0}
+
+def image_response(model, shape, size, base_url):
+    b64 = base64.b64encode(make_png(size)).decode("ascii")
+    data_url = f"data:image/png;base64,{b64}"
+    message = {"role": "assistant", "content": ""}
+    result = {"id": f"mock-{time.time_ns()}", "model": model, "choices": [{"message": message}]}
+    if shape == "images":
+        message["images"] = [{"type": "image_url", "image_url": {"url": data_url}}]
+    elif shape == "content_list":
+        message["content"] = [{"type": "image_url", "image_url": {"url": data_url}}]
+    elif shape == "output_image":
+        message["content"] = [{"type": "output_image", "b64_json": b64}]
+    elif shape == "data_b64":
+        message["content"] = None
+        result["data"] = [{"b64_json": b64}]
+    else:
+        message["content"] = f"Here is the render: ![render]({base_url}/images/{size}.png)"
+    return result
+
+def evaluation_response(model, rng):
+    total = rng.randint(20, 95)
+    scores = {"3d_conversion_fundamentals": (35, 0.35), "geometric_accuracy": (30, 0.3),
+              "interior_elements": (15, 0.15), "visual_clarity": (20, 0.2)}
+    content = {
+        "is_valid_3d_conversion": total >= 30,
+        "scores": {k: {"score": round(total * share), "max": m, "notes": "mock"} for k, (m, share) in scores.items()},
+        "detected_errors": [],
+        "total_score": total,
+        "verdict": "GOOD" if total >= 75 else "PASS" if total >= 50 else "FAIL",
+        "summary": "Mock evaluation."
+    }
+    return {"id": f"mock-{time.time_ns()}", "model": model,
+            "choices": [{"message": {"role": "assistant", "content": json.dumps(content)}}]}
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = DEFAULT_CONFIG
+    replays = {}
+    rng = random.Random()
+    rng_lock = threading.Lock()
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        # Targets of the markdown_url shape
+        if self.path.startswith("/images/") and self.path.endswith(".png"):
+            size = int(self.path[len("/images/"):-len(".png")])
+            payload = make_png(size)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        self.send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        if self.path.rstrip("/") != "/api/v1/chat/completions":
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+        try:
+            request = json.loads(raw)
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": {"message": "invalid JSON body"}})
+            return
+
+        config = self.config
+        model = request.get("model", "")
+        with self.rng_lock:
+            latency = self.rng.lognormvariate(0, model_setting(config, model, "latency_sigma")) \
+                * model_setting(config, model, "latency_median")
+            roll = self.rng.random()
+            eval_rng = random.Random(self.rng.random())
+        time.sleep(latency)
+
+        rate_429 = model_setting(config, model, "error_rate_429")
+        if roll < rate_429:
+            self.send_json(429, {"error": {"message": "Rate limit exceeded (mock)", "code": 429}})
+            return
+        if roll < rate_429 + model_setting(config, model, "error_rate_5xx"):
+            self.send_json(502, {"error": {"message": "Provider returned error (mock)", "code": 502}})
+            return
+
+        recorded = self.replays.get(model) or self.replays.get("*")
+        if recorded:
+            body = dict(recorded[int(roll * 1e6) % len(recorded)])
+        elif request.get("response_format"):
+            body = evaluation_response(model, eval_rng)
+        else:
+            base_url = f"http://{self.headers.get('Host', 'localhost')}"
+            body = image_response(model, model_shape(config, model), model_setting(config, model, "image_size"), base_url)
+        body.setdefault("usage", usage_for(len(raw), 1290 if not request.get("response_format") else 600))
+        self.send_json(200, body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start(port=DEFAULT_PORT, config=None, seed=None):
+    # Runs the mock on a daemon thread; returns the server (call .shutdown()).
+    merged = dict(DEFAULT_CONFIG, **(config or {}))
+    handler = type("ConfiguredMockHandler", (MockHandler,), {
+        "config": merged,
+        "replays": load_replays(merged["replay_dir"]),
+        "rng": random.Random(seed)
+    })
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    httpd.daemon_threads = True
+    threading.Thread(name="mock_openrouter", target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+def api_url(httpd):
+    return f"http://127.0.0.1:{httpd.server_address[1]}/api/v1/chat/completions"
+
+def build_arg_parser(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(description="Offline mock of OpenRouter chat completions.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--config", help="JSON file with any DEFAULT_CONFIG keys, incl. per-model overrides")
+    parser.add_argument("--latency-median", type=float)
+    parser.add_argument("--latency-sigma", type=float)
+    parser.add_argument("--error-rate-429", type=float)
+    parser.add_argument("--error-rate-5xx", type=float)
+    parser.add_argument("--image-size", type=int)
+    parser.add_argument("--shape", choices=SHAPES)
+    parser.add_argument("--replay-dir", help="directory of recorded response bodies (*.json) to replay")
+    parser.add_argument("--seed", type=int)
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    config = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config.update(json.load(f))
+    for key in ("latency_median", "latency_sigma", "error_rate_429", "error_rate_5xx", "image_size", "shape", "replay_dir"):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+
+    httpd = start(args.port, config, args.seed)
+    print(f"🧪 Mock OpenRouter at {api_url(httpd)}")
+    print(f"   export OPENROUTER_API_URL={api_url(httpd)} OPENROUTER_API_KEY=mock")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        httpd.shutdown()
+
+if __name__ == "__main__":
+    main()
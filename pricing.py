@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import threading
+from statistics import median
+import tracing
+
+# USD per million tokens (prompt, completion) and per generated image, from the
+# OpenRouter model pages. Check https://openrouter.ai/models when adding a model;
+# responses that carry usage.cost (requested with "usage": {"include": true})
+# are billed at that figure instead of the table.
+PRICES = {
+    "sourceful/riverflow-v2-pro": {"prompt": 0.0, "completion": 0.0, "image": 0.15},
+    "sourceful/riverflow-v2-fast": {"prompt": 0.0, "completion": 0.0, "image": 0.02},
+    "sourceful/riverflow-v2-max-preview": {"prompt": 0.0, "completion": 0.0, "image": 0.075},
+    "sourceful/riverflow-v2-standard-preview": {"prompt": 0.0, "completion": 0.0, "image": 0.035},
+    "sourceful/riverflow-v2-fast-preview": {"prompt": 0.0, "completion": 0.0, "image": 0.03},
+    "black-forest-labs/flux.2-klein-4b": {"prompt": 0.0, "completion": 0.0, "image": 0.014},
+    "black-forest-labs/flux.2-max": {"prompt": 0.0, "completion": 0.0, "image": 0.07},
+    "black-forest-labs/flux.2-flex": {"prompt": 0.0, "completion": 0.0, "image": 0.06},
+    "black-forest-labs/flux.2-pro": {"prompt": 0.0, "completion": 0.0, "image": 0.03},
+    "bytedance-seed/seedream-4.5": {"prompt": 0.0, "completion": 0.0, "image": 0.04},
+    "google/gemini-3-pro-image-preview": {"prompt": 2.0, "completion": 120.0},
+    "google/gemini-2.5-flash-image": {"prompt": 0.3, "completion": 30.0},
+    "openai/gpt-5-image-mini": {"prompt": 2.5, "completion": 8.0},
+    "openai/gpt-5-image": {"prompt": 10.0, "completion": 40.0},
+    "google/gemini-3.1-pro-preview": {"prompt": 2.0, "completion": 12.0},
+    "google/gemini-3-flash-preview": {"prompt": 0.5, "completion": 3.0},
+    "qwen/qwen3.5-397b-a17b": {"prompt": 0.6, "completion": 3.6},
+    "moonshotai/kimi-k2.5": {"prompt": 0.6, "completion": 3.0},
+    "openai/gpt-5.2-codex": {"prompt": 1.75, "completion": 14.0},
+    "openai/gpt-5.2": {"prompt": 1.75, "completion": 14.0},
+    "allenai/molmo-2-8b": {"prompt": 0.2, "completion": 0.2},
+}
+
+# Every billed call, one JSON object per line
+USAGE_PATH = os.path.join(".cache", "usage.jsonl")
+
+# Planner token guesses for (stage, model) pairs with no recorded usage yet
+DEFAULT_TOKENS = {
+    "generate": (1500, 1300),
+    "evaluate": (2500, 900),
+    "phase1": (1500, 6000)
+}
+
+COST_REPORT_PATH = "cost_report.json"
+
+_lock = threading.Lock()
+_usage = None
+
+# Set by a run with a hard budget (see Budget); record_usage charges it
+budget = None
+
+def call_cost(model, usage):
+    if usage.get("cost") is not None:
+        return float(usage["cost"])
+    price = PRICES.get(model)
+    if price is None:
+        return 0.0
+    cost = usage.get("prompt_tokens", 0) * price["prompt"] / 1e6
+    cost += usage.get("completion_tokens", 0) * price["completion"] / 1e6
+    return cost + price.get("image", 0.0) * usage.get("images", 1 if "image" in price else 0)
+
+def _load_usage():
+    global _usage
+    if _usage is None:
+        _usage = []
+        if os.path.exists(USAGE_PATH):
+            with open(USAGE_PATH, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        _usage.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+    return _usage
+
+def record_usage(stage, model, usage, subject=None, hedge=False):
+    # subject: the name evaluations know the output by (evaluated_model), for cost_report()
+    cost = call_cost(model, usage)
+    record = {
+        "stage": stage,
+        "model": model,
+        "subject": subject,
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "cost": round(cost, 6),
+        "hedge": hedge,
+        "ts": time.time()
+    }
+    with _lock:
+        _load_usage().append(record)
+        os.makedirs(os.path.dirname(USAGE_PATH), exist_ok=True)
+        with open(USAGE_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    if budget is not None:
+        budget.charge(cost)
+    tracing.count("pipeline_cost_usd_total", cost, stage=stage, model=model)
+    tracing.count("pipeline_tokens_total", record["prompt_tokens"], stage=stage, model=model, kind="prompt")
+    tracing.count("pipeline_tokens_total", record["completion_tokens"], stage=stage, model=model, kind="completion")
+    return cost
+
+def usage_records():
+    # Snapshot of every recorded call, oldest first; this process appends to the end
+    with _lock:
+        return list(_load_usage())
+
+def estimate_call(stage, model):
+    # (prompt tokens, completion tokens, dollars) from the median of recent calls
+    with _lock:
+        samples = [r for r in _load_usage() if r["stage"] == stage and r["model"] == model and not r["hedge"]][-50:]
+    if samples:
+        tokens_in = median(r["prompt_tokens"] for r in samples)
+        tokens_out = median(r["completion_tokens"] for r in samples)
+        return tokens_in, tokens_out, median(r["cost"] for r in samples)
+    tokens_in, tokens_out = DEFAULT_TOKENS.get(stage, DEFAULT_TOKENS["generate"])
+    return tokens_in, tokens_out, call_cost(model, {"prompt_tokens": tokens_in, "completion_tokens": tokens_out})
+
+def print_estimate(stage, tasks, model_of):
+    per_model = {}
+    for task in tasks:
+        model = model_of(task)
+        tokens_in, tokens_out, cost = estimate_call(stage, model)
+        entry = per_model.setdefault(model, [0, 0, 0, 0.0])
+        entry[0] += 1
+        entry[1] += tokens_in
+        entry[2] += tokens_out
+        entry[3] += cost
+    total = sum(e[3] for e in per_model.values())
+    print(f"💵 Estimated {stage} cost: ${total:.2f} for {len(tasks)} calls "
+          f"({sum(e[1] for e in per_model.values()):,.0f} tokens in, {sum(e[2] for e in per_model.values()):,.0f} out)")
+    for model, (n, tokens_in, tokens_out, cost) in sorted(per_model.items(), key=lambda kv: -kv[1][3]):
+        print(f"   {model:<42} {n:>4} calls  ${cost:>7.2f}")
+    return total
+
+def fit_budget(stage, tasks, model_of, limit):
+    # Keeps the cheapest cells that fit under the budget; the most expensive
+    # ones are deferred to a later run rather than half the matrix running dry.
+    costed = sorted(tasks, key=lambda t: estimate_call(stage, model_of(t))[2])
+    kept, deferred, total = [], [], 0.0
+    for task in costed:
+        cost = estimate_call(stage, model_of(task))[2]
+        if total + cost <= limit:
+            kept.append(task)
+            total += cost
+        else:
+            deferred.append(task)
+    if deferred:
+        print(f"⏸️ Budget ${limit:.2f}: deferring {len(deferred)} most expensive cells "
+              f"(running {len(kept)}, estimated ${total:.2f})")
+    return kept, deferred
+
+class Budget:
+    # Hard cap enforced while running: each call reserves its estimate before
+    # it is sent, and the reservation is swapped for the billed cost after.
+    def __init__(self, limit):
+        self.limit = limit
+        self.spent = 0.0
+        self.reserved = 0.0
+        self.refused = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        with self._lock:
+            if self.spent + self.reserved + amount > self.limit:
+                self.refused += 1
+                return False
+            self.reserved += amount
+            return True
+
+    def release(self, amount):
+        with self._lock:
+            self.reserved -= amount
+
+    def charge(self, cost):
+        with self._lock:
+            self.spent += cost
+
+    def report(self):
+        print(f"💵 Spent ${self.spent:.2f} of ${self.limit:.2f} budget"
+              + (f", {self.refused} calls deferred at the cap" if self.refused else ""))
+
+def budgeted(worker, stage, model_of, pending):
+    # Wraps a scheduler worker: cells that would break the budget are skipped
+    # (reported as failed, so they run again next time) instead of sent.
+    def run(*task):
+        if budget is None or not pending(task):
+            return worker(*task)
+        estimate = estimate_call(stage, model_of(task))[2]
+        if not budget.reserve(estimate):
+            print(f"⏸️ Budget reached, deferring {model_of(task)} cell")
+            return False
+        try:
+            return worker(*task)
+        finally:
+            budget.release(estimate)
+    return run
+
+def cost_report(dashboard_evaluations, path=COST_REPORT_PATH):
+    # Cost per point of score for each generated model: average generation cost
+    # over average total_score across every evaluation of that model's outputs.
+    with _lock:
+        records = list(_load_usage())
+
+    generation = {}
+    evaluation = {}
+    for r in records:
+        if r["stage"] == "evaluate":
+            entry = evaluation.setdefault(r["model"], {"calls": 0, "cost": 0.0})
+        elif r.get("subject"):
+            entry = generation.setdefault(r["subject"], {"model": r["model"], "calls": 0, "cost": 0.0})
+        else:
+            continue
+        entry["calls"] += 0 if r["hedge"] else 1
+        entry["cost"] += r["cost"]
+
+    scores = {}
+    for item in dashboard_evaluations:
+        if isinstance(item.get("total_score"), (int, float)):
+            scores.setdefault(item.get("evaluated_model", ""), []).append(item["total_score"])
+
+    rows = []
+    for subject, entry in generation.items():
+        subject_scores = scores.get(subject, [])
+        avg_cost = entry["cost"] / entry["calls"] if entry["calls"] else entry["cost"]
+        avg_score = sum(subject_scores) / len(subject_scores) if subject_scores else None
+        rows.append({
+            "evaluated_model": subject,
+            "model": entry["model"],
+            "generations": entry["calls"],
+            "generation_cost": round(entry["cost"], 4),
+            "avg_cost": round(avg_cost, 4),
+            "avg_score": round(avg_score, 2) if avg_score is not None else None,
+            "cost_per_point": round(avg_cost / avg_score, 5) if avg_score else None
+        })
+    rows.sort(key=lambda r: (r["cost_per_point"] is None, r["cost_per_point"] or 0))
+
+    report = {
+        "generated": rows,
+        "evaluators": {m: dict(e, cost=round(e["cost"], 4)) for m, e in sorted(evaluation.items())},
+        "total_cost": round(sum(r["cost"] for r in records), 4),
+        "timestamp": time.time()
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+
+    print(f"\n💵 Cost per point of score (total spend ${report['total_cost']:.2f})")
+    for row in rows:
+        score = f"{row['avg_score']:>6.1f}" if row["avg_score"] is not None else "     -"
+        per_point = f"${row['cost_per_point']:.4f}" if row["cost_per_point"] is not None else "-"
+        print(f"   {row['evaluated_model']:<48} ${row['avg_cost']:>6.3f}/image  score {score}  {per_point}/point")
+    for model, entry in report["evaluators"].items():
+        print(f"   evaluator {model:<38} {entry['calls']:>4} calls  ${entry['cost']:.2f}")
+    print(f"   Written to {path}")
+    return report
@@ -1,22 +1,132 @@
 import os
 import re
+import io
+import tarfile
+import json
+import shutil
+import hashlib
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 OUTPUT_DIR = "generation_outputs"
 
+# Hash manifest of what each index.html was built from, and the list of pages
+# the last run actually changed (read by render_harness.py --changed-only)
+MANIFEST_FILENAME = ".process_manifest.json"
+CHANGED_PAGES_FILENAME = "changed_pages.json"
+
+# What render_harness.py captured from a page; dropped with index.html when the
+# page turns invalid, so its last valid views are not scored as current output
+RENDERED_FILES = ("render_report.json", "screenshot.png")
+RENDERED_DIRS = ("views",)
+
+MAX_WORKERS = 8
+
 # Standardize to a known working version
 THREE_VERSION = "0.160.0"
 
+# Three.js is vendored once and served by render_harness.py from the repo
+# root, so pages load offline and screenshots never wait on a CDN.
+VENDOR_DIR = os.path.join("vendor", f"three@{THREE_VERSION}")
+VENDOR_URL = f"/vendor/three@{THREE_VERSION}"
+THREE_TARBALL_URL = f"https://registry.npmjs.org/three/-/three-{THREE_VERSION}.tgz"
+
+# Fixed views the render harness captures for the evaluator: camera direction
+# (pointing from the scene centre towards the camera) and its up vector
+CAMERA_PRESETS = {
+    "isometric": {"direction": [1, 1, 1], "up": [0, 1, 0]},
+    "top_down": {"direction": [0, 1, 0], "up": [0, 0, -1]},
+    "elevation_front": {"direction": [0, 0.2, 1], "up": [0, 1, 0]},
+    "elevation_side": {"direction": [1, 0.2, 0], "up": [0, 1, 0]}
+}
+
+# window.__captureViews() renders the scene once per preset with a framed clone
+# of the scene's camera and returns PNG data URLs. It only uses objects the page
+# already created (found via render_harness.py's __renderProbe), so it needs no
+# imports and works for module, global and full-HTML pages alike.
+CAMERA_PRESET_HOOK = """<script>
+window.__cameraPresets = __PRESETS__;
+window.__captureViews = function () {
+    var probe = window.__renderProbe;
+    if (!probe || !probe.renderer || !probe.scene || !probe.camera) return null;
+    var renderer = probe.renderer, scene = probe.scene, mainCamera = probe.camera;
+
+    scene.updateMatrixWorld(true);
+    var box = null;
+    scene.traverse(function (o) {
+        if (!o.isMesh || !o.visible || !o.geometry) return;
+        if (!o.geometry.boundingBox) o.geometry.computeBoundingBox();
+        var b = o.geometry.boundingBox.clone().applyMatrix4(o.matrixWorld);
+        if (box) box.union(b); else box = b;
+    });
+    if (!box || box.isEmpty()) return null;
+
+    var center = box.getCenter(mainCamera.position.clone());
+    var radius = box.getSize(mainCamera.position.clone()).length() / 2 || 1;
+    var aspect = renderer.domElement.width / renderer.domElement.height;
+
+    var views = {};
+    Object.keys(window.__cameraPresets).forEach(function (name) {
+        var preset = window.__cameraPresets[name];
+        var cam = mainCamera.clone();
+        var dir = center.clone().set(preset.direction[0], preset.direction[1], preset.direction[2]).normalize();
+        var dist;
+        if (cam.isOrthographicCamera) {
+            dist = radius * 4;
+            var half = radius * 1.1;
+            cam.left = -half * Math.max(aspect, 1); cam.right = half * Math.max(aspect, 1);
+            cam.top = half / Math.min(aspect, 1); cam.bottom = -half / Math.min(aspect, 1);
+            cam.zoom = 1;
+        } else {
+            cam.aspect = aspect;
+            var vfov = cam.fov * Math.PI / 180;
+            var hfov = 2 * Math.atan(Math.tan(vfov / 2) * aspect);
+            dist = radius * 1.1 / Math.sin(Math.min(vfov, hfov) / 2);
+        }
+        cam.near = dist / 100;
+        cam.far = dist * 10;
+        cam.position.copy(center).addScaledVector(dir, dist);
+        cam.up.set(preset.up[0], preset.up[1], preset.up[2]);
+        cam.lookAt(center);
+        cam.updateProjectionMatrix();
+        cam.updateMatrixWorld(true);
+        renderer.render(scene, cam);
+        // Read back in the same task, so preserveDrawingBuffer isn't needed
+        views[name] = renderer.domElement.toDataURL('image/png');
+    });
+    renderer.render(scene, mainCamera);
+    return views;
+};
+</script>""".replace("__PRESETS__", json.dumps(CAMERA_PRESETS))
+
 HTML_TEMPLATE_GLOBAL = """<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <title>3D Preview</title>
     <style>body {{ margin: 0; overflow: hidden; }}</style>
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/three.js/r128/three.min.js"></script>
-    <script src="https://cdn.jsdelivr.net/npm/three@0.128.0/examples/js/controls/OrbitControls.js"></script>
+    {camera_hook}
+    <script type="importmap">
+      {{
+        "imports": {{
+          "three": "{vendor}/build/three.module.js",
+          "three/addons/": "{vendor}/examples/jsm/"
+        }}
+      }}
+    </script>
 </head>
 <body>
-    <script>
+    <script type="module">
+    // Global-style code expects window.THREE (incl. THREE.OrbitControls), so expose
+    // the pinned module build and then run the code as a classic script.
+    import * as THREE from 'three';
+    import {{ OrbitControls }} from 'three/addons/controls/OrbitControls.js';
+    window.THREE = Object.assign({{}}, THREE, {{ OrbitControls }});
+    const script = document.createElement('script');
+    script.textContent = document.getElementById('generated-code').textContent;
+    document.body.appendChild(script);
+    </script>
+    <script type="text/plain" id="generated-code">
     // --- GENERATED CODE START ---
     {code}
     // --- GENERATED CODE END ---
@@ -30,11 +140,12 @@ HTML_TEMPLATE_MODULE = """<!DOCTYPE html>
     <meta charset="UTF-8">
     <title>3D Preview</title>
     <style>body {{ margin: 0; overflow: hidden; }}</style>
+    {camera_hook}
     <script type="importmap">
       {{
         "imports": {{
-          "three": "https://unpkg.com/three@{version}/build/three.module.js",
-          "three/addons/": "https://unpkg.com/three@{version}/examples/jsm/"
+          "three": "{vendor}/build/three.module.js",
+          "three/addons/": "{vendor}/examples/jsm/"
         }}
       }}
     </script>
@@ -48,6 +159,68 @@ HTML_TEMPLATE_MODULE = """<!DOCTYPE html>
 </body>
 </html>"""
 
+# CDN locations of the ES module build and addons (any version) -> vendored copy
+CDN_MODULE_RE = re.compile(
+    r"https?://(?:unpkg\.com|cdn\.jsdelivr\.net/npm|cdn\.skypack\.dev|esm\.sh)/three(?:@[\w.\-]+)?/"
+    r"(build/three\.module(?:\.min)?\.js|examples/jsm/[\w/.\-]+)"
+)
+# CDN locations of the classic global build -> vendored global build
+CDN_GLOBAL_RE = re.compile(
+    r"https?://(?:cdnjs\.cloudflare\.com/ajax/libs/three\.js/[\w.]+/three(?:\.min)?\.js"
+    r"|(?:unpkg\.com|cdn\.jsdelivr\.net/npm)/three(?:@[\w.\-]+)?/build/three(?:\.min)?\.js)"
+)
+
+def vendor_three():
+    if os.path.exists(os.path.join(VENDOR_DIR, "build", "three.module.js")):
+        return True
+
+    print(f"📦 Vendoring three@{THREE_VERSION} into {VENDOR_DIR} (one-time download)...")
+    try:
+        with urllib.request.urlopen(THREE_TARBALL_URL, timeout=60) as response:
+            tarball = response.read()
+    except Exception as e:
+        print(f"❌ Could not download {THREE_TARBALL_URL}: {e}")
+        return False
+
+    with tarfile.open(fileobj=io.BytesIO(tarball), mode="r:gz") as tar:
+        for member in tar.getmembers():
+            if not member.isfile():
+                continue
+            rel_path = member.name.split("/", 1)[-1]
+            if not (rel_path.startswith("build/") or rel_path.startswith("examples/jsm/")):
+                continue
+            if ".." in rel_path.split("/"):
+                continue
+            target = os.path.join(VENDOR_DIR, *rel_path.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(tar.extractfile(member).read())
+
+    # r160 no longer ships build/three.min.js; wrap the CommonJS build so
+    # full-HTML outputs with <script src=".../three.min.js"> still get window.THREE.
+    with open(os.path.join(VENDOR_DIR, "build", "three.cjs"), "r", encoding="utf-8") as f:
+        cjs = f.read()
+    with open(os.path.join(VENDOR_DIR, "build", "three.global.js"), "w", encoding="utf-8") as f:
+        f.write("(function () {\nvar module = { exports: {} }; var exports = module.exports;\n")
+        f.write(cjs)
+        f.write("\nwindow.THREE = module.exports;\n})();\n")
+
+    return True
+
+def localize_three_urls(text):
+    text = CDN_MODULE_RE.sub(lambda m: f"{VENDOR_URL}/{m.group(1)}", text)
+    text = CDN_GLOBAL_RE.sub(f"{VENDOR_URL}/build/three.global.js", text)
+    return text
+
+def inject_camera_hook(html):
+    match = re.search(r"</head>", html, re.IGNORECASE)
+    if not match:
+        match = re.search(r"<body[^>]*>", html, re.IGNORECASE)
+        if not match:
+            return CAMERA_PRESET_HOOK + html
+        return html[:match.end()] + CAMERA_PRESET_HOOK + html[match.end():]
+    return html[:match.start()] + CAMERA_PRESET_HOOK + html[match.start():]
+
 def normalize_imports(code):
     # 1. Replace direct Three.js URL imports with 'three'
     # Detects: from '.../three.module.js' -> from 'three'
@@ -57,6 +230,9 @@ def normalize_imports(code):
     # Detects: from '.../OrbitControls.js' -> from 'three/addons/controls/OrbitControls.js'
     code = re.sub(r"from\s+['\"].*?OrbitControls\.js['\"]", "from 'three/addons/controls/OrbitControls.js'", code)
 
+    # 2b. Any other addon path (CDN or bare 'three/examples/jsm/...') -> 'three/addons/...'
+    code = re.sub(r"from\s+(['\"])[^'\"]*?examples/jsm/([^'\"]+)\1", r"from 'three/addons/\2'", code)
+
     # 3. Replace generic CDN imports that might mismatch
     # Detects: from 'https://unpkg.com/three...' -> from 'three' (aggressive, but safe with importmap)
     # Be careful not to break specific file imports, so only target 'three' package root
@@ -64,10 +240,25 @@ def normalize_imports(code):
     
     return code
 
-def process_model_output(model_name):
+_validator = []
+
+def load_validator():
+    # validate_js needs tree-sitter; without it pages are built unchecked
+    # instead of failing the whole run (warned once)
+    if not _validator:
+        try:
+            import validate_js
+        except ImportError as e:
+            print(f"⚠️  {e.name} is not installed, skipping static JS validation")
+            validate_js = None
+        _validator.append(validate_js)
+    return _validator[0]
+
+def process_model_output(model_name, validation_cache=None):
     model_dir = os.path.join(OUTPUT_DIR, model_name)
     raw_path = os.path.join(model_dir, "raw_output.js")
     out_path = os.path.join(model_dir, "index.html")
+    validation_path = os.path.join(model_dir, "validation.json")
 
     if not os.path.exists(raw_path):
         return False, "No output file"
@@ -84,46 +275,139 @@ def process_model_output(model_name):
                 is_valid = False
 
     if not is_valid:
-        if os.path.exists(out_path):
-            os.remove(out_path)
+        remove_page(model_dir)
         return False, "Invalid Code / Text Only"
 
     # Heuristic: Is it full HTML?
     if "<html" in code.lower() or "<!doctype" in code.lower():
         # Even for full HTML, we might need to fix imports if they are broken
-        # But parsing HTML adds complexity. Let's assume full HTML is self-contained.
-        final_html = code
+        # But parsing HTML adds complexity. Only point its CDN URLs at the vendored copy.
+        code = localize_three_urls(code)
+        final_html = inject_camera_hook(code)
     elif "import " in code:
         # ES Module
         code = normalize_imports(code)
-        final_html = HTML_TEMPLATE_MODULE.format(version=THREE_VERSION, code=code)
+        final_html = HTML_TEMPLATE_MODULE.format(vendor=VENDOR_URL, camera_hook=CAMERA_PRESET_HOOK, code=code)
     else:
         # Global
-        final_html = HTML_TEMPLATE_GLOBAL.format(code=code)
+        final_html = HTML_TEMPLATE_GLOBAL.format(vendor=VENDOR_URL, camera_hook=CAMERA_PRESET_HOOK, code=code)
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write(final_html)
+    # Static check of exactly what the page will run, so broken code never
+    # costs a browser load
+    validate_js = load_validator()
+    if validate_js:
+        if validation_cache is None:
+            validation_cache = {}
+        validation = validate_js.validate_cached(code, VENDOR_DIR, VENDOR_URL, validation_cache)
+        with open(validation_path, "w", encoding="utf-8") as f:
+            json.dump(validation, f, indent=4)
+
+        if not validation["valid"]:
+            remove_page(model_dir)
+            return False, f"Static validation failed: {validation['errors'][0]}"
+
+    # Leave identical pages untouched so their mtime (and screenshot) stays valid
+    if file_hash(out_path) != hashlib.sha256(final_html.encode("utf-8")).hexdigest():
+        with open(out_path, "w", encoding="utf-8", newline="") as f:
+            f.write(final_html)
     
     return True, out_path
 
+def remove_page(model_dir):
+    for name in ("index.html",) + RENDERED_FILES:
+        if os.path.exists(os.path.join(model_dir, name)):
+            os.remove(os.path.join(model_dir, name))
+    for name in RENDERED_DIRS:
+        shutil.rmtree(os.path.join(model_dir, name), ignore_errors=True)
+
+def file_hash(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def build_fingerprint():
+    # Anything besides raw_output.js that changes the generated page
+    digest = hashlib.sha256()
+    validate_js = load_validator()
+    # Unchecked pages are built again once the validator is available
+    validator_version = validate_js.VALIDATOR_VERSION if validate_js else "unvalidated"
+    for part in (THREE_VERSION, HTML_TEMPLATE_GLOBAL, HTML_TEMPLATE_MODULE, CAMERA_PRESET_HOOK, validator_version,
+                 str(os.path.exists(os.path.join(VENDOR_DIR, "build", "three.module.js")))):
+        digest.update(part.encode("utf-8"))
+    return digest.hexdigest()
+
+def load_manifest():
+    path = os.path.join(OUTPUT_DIR, MANIFEST_FILENAME)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable manifest {path}: {e}")
+    return {}
+
+def build_model(model_name, manifest_entry, fingerprint, validation_cache):
+    model_dir = os.path.join(OUTPUT_DIR, model_name)
+    out_path = os.path.join(model_dir, "index.html")
+
+    raw_hash = file_hash(os.path.join(model_dir, "raw_output.js"))
+    source_hash = hashlib.sha256(f"{raw_hash}:{fingerprint}".encode("utf-8")).hexdigest()
+    html_before = file_hash(out_path)
+
+    if (manifest_entry and manifest_entry["source_hash"] == source_hash
+            and manifest_entry["html_hash"] == html_before):
+        return model_name, manifest_entry, False
+
+    success, msg = process_model_output(model_name, validation_cache)
+    html_after = file_hash(out_path)
+    entry = {"source_hash": source_hash, "html_hash": html_after, "ready": success, "message": msg}
+    return model_name, entry, html_after != html_before
+
 def main():
     print("🚀 Processing outputs into HTML (Fixing Imports)...")
     if not os.path.exists(OUTPUT_DIR):
         print("No output directory found.")
         return
 
-    processed_count = 0
-    for model_name in os.listdir(OUTPUT_DIR):
-        path = os.path.join(OUTPUT_DIR, model_name)
-        if os.path.isdir(path):
-            success, msg = process_model_output(model_name)
-            if success:
-                print(f"✅ {model_name}: Ready")
-                processed_count += 1
+    if not vendor_three():
+        print("⚠️  Three.js is not vendored; pages will not render until vendor/ is populated.")
+
+    validate_js = load_validator()
+    validation_cache = validate_js.load_cache(OUTPUT_DIR) if validate_js else {}
+    manifest = load_manifest()
+    fingerprint = build_fingerprint()
+
+    model_names = sorted(m for m in os.listdir(OUTPUT_DIR) if os.path.isdir(os.path.join(OUTPUT_DIR, m)))
+
+    new_manifest = {}
+    changed = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(build_model, m, manifest.get(m), fingerprint, validation_cache) for m in model_names]
+
+        for future in as_completed(futures):
+            model_name, entry, html_changed = future.result()
+            new_manifest[model_name] = entry
+            if html_changed:
+                changed.append(model_name)
+
+            if entry["ready"]:
+                print(f"✅ {model_name}: Ready{' (updated)' if html_changed else ''}")
             else:
-                print(f"⚠️  {model_name}: Skipped ({msg})")
-    
-    print(f"\nDone. {processed_count} files ready.")
+                print(f"⚠️  {model_name}: Skipped ({entry['message']})")
+
+    removed = sorted(m for m in manifest if m not in new_manifest)
+    changed.sort()
+
+    with open(os.path.join(OUTPUT_DIR, MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(new_manifest, f, indent=1, sort_keys=True)
+    with open(os.path.join(OUTPUT_DIR, CHANGED_PAGES_FILENAME), "w", encoding="utf-8") as f:
+        json.dump({"changed": changed, "removed": removed}, f, indent=4)
+    if validate_js:
+        validate_js.save_cache(OUTPUT_DIR, validation_cache)
+
+    ready_count = sum(1 for entry in new_manifest.values() if entry["ready"])
+    print(f"\nDone. {ready_count} files ready, {len(changed)} changed, {len(removed)} removed.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,231 @@
+import os
+import sys
+import time
+import cProfile
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+import tracing
+
+# Per-stage profiling for `floorbench --profile <command>`. It attaches to the
+# tracing spans the pipeline already opens (generate.encode, evaluate.request,
+# aggregate, ...), so no stage code changes to find a bottleneck:
+#   - a sampling profiler walks every thread's stack each SAMPLE_INTERVAL and
+#     files the sample under that thread's innermost span. Output is collapsed
+#     stacks per stage (flamegraph.pl, speedscope, inferno), including time
+#     spent waiting in socket reads.
+#   - optionally cProfile around the stages in CPROFILE_STAGES, merged into
+#     one .prof per stage (snakeviz, gprof2dot).
+#   - tracemalloc snapshots around the first spans of each stage, for a report
+#     of top allocating lines per stage and overall. tracemalloc slows every
+#     allocation down, so leave "memory" out of --profile when timing matters.
+PROFILE_DIR = "profiles"
+
+MODES = ("sample", "cprofile", "memory")
+DEFAULT_MODES = ("sample", "memory")
+
+SAMPLE_INTERVAL = 0.005
+
+# Spans (or span name suffixes) cProfile wraps. Only one cProfile can run per
+# thread, so these are leaf stages plus the aggregate pass as a whole.
+CPROFILE_STAGES = ("encode", "request", "parse", "parse_scores", "write", "fetch_image",
+                   "aggregate", "navigate", "profile", "views", "screenshot")
+
+# Spans per stage name that get before/after tracemalloc snapshots
+SNAPSHOTS_PER_STAGE = 3
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 15
+
+# The profiler's own bookkeeping, kept out of the allocation report
+ALLOCATION_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, pstats.__file__),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+class Profiler:
+    def __init__(self, name, modes=DEFAULT_MODES):
+        self.output_dir = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{name}")
+        self.use_sampling = "sample" in modes
+        self.use_cprofile = "cprofile" in modes
+        self.use_memory = "memory" in modes
+        self.active = {}  # thread id -> stack of span names
+        self.samples = {}  # stage -> {collapsed stack: count}
+        self.stats = {}  # stage -> pstats.Stats
+        self.allocations = {}  # stage -> [snapshot diff statistics]
+        self.snapshot_counts = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(name="profiler_sampler", target=self._sample_loop, daemon=True)
+
+    def start(self):
+        if self.use_memory:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        tracing.add_span_hook(self.span_hook)
+        self.started = time.time()
+        if self.use_sampling:
+            self.sampler.start()
+        print(f"🔬 Profiling to {self.output_dir}/")
+
+    @contextmanager
+    def span_hook(self, name, attrs):
+        thread_id = threading.get_ident()
+        # Snapshots are taken outside the span so their cost isn't billed to it
+        before = self._take_snapshot(name)
+        with self.lock:
+            self.active.setdefault(thread_id, []).append(name)
+        profile = self._start_cprofile(name)
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                self.local.profiling = False
+                with self.lock:
+                    if name in self.stats:
+                        self.stats[name].add(profile)
+                    else:
+                        self.stats[name] = pstats.Stats(profile)
+            with self.lock:
+                stack = self.active.get(thread_id)
+                if stack:
+                    stack.pop()
+                if not stack:
+                    self.active.pop(thread_id, None)
+            if before is not None:
+                self._record_allocations(name, before)
+
+    def _start_cprofile(self, name):
+        if not self.use_cprofile or getattr(self.local, "profiling", False):
+            return None
+        if name not in CPROFILE_STAGES and name.rsplit(".", 1)[-1] not in CPROFILE_STAGES:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process; the sampler still covers this span
+            return None
+        self.local.profiling = True
+        return profile
+
+    def _take_snapshot(self, name):
+        if not self.use_memory:
+            return None
+        with self.lock:
+            taken = self.snapshot_counts.get(name, 0)
+            if taken >= SNAPSHOTS_PER_STAGE:
+                return None
+            self.snapshot_counts[name] = taken + 1
+        with self._unsampled():
+            return tracemalloc.take_snapshot().filter_traces(ALLOCATION_FILTERS)
+
+    def _record_allocations(self, name, before):
+        with self._unsampled():
+            after = tracemalloc.take_snapshot().filter_traces(ALLOCATION_FILTERS)
+            diff = after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]
+        with self.lock:
+            self.allocations.setdefault(name, []).append(diff)
+
+    @contextmanager
+    def _unsampled(self):
+        # The sampler skips threads whose innermost entry is None, so the
+        # profiler's own snapshot work isn't billed to the enclosing stage
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.active.setdefault(thread_id, []).append(None)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active[thread_id].pop()
+                if not self.active[thread_id]:
+                    del self.active[thread_id]
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            with self.lock:
+                stages = {tid: stack[-1] for tid, stack in self.active.items() if stack and stack[-1]}
+            for thread_id, stage in stages.items():
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own_id:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                collapsed = ";".join(reversed(names))
+                with self.lock:
+                    counts = self.samples.setdefault(stage, {})
+                    counts[collapsed] = counts.get(collapsed, 0) + 1
+
+    def stop(self):
+        self.stopped.set()
+        if self.use_sampling:
+            self.sampler.join()
+        tracing.remove_span_hook(self.span_hook)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        summary = []
+        for stage, counts in sorted(self.samples.items(), key=lambda kv: -sum(kv[1].values())):
+            with open(os.path.join(self.output_dir, f"{stage}.collapsed"), "w", encoding="utf-8") as f:
+                for stack, n in sorted(counts.items()):
+                    f.write(f"{stack} {n}\n")
+            summary.append((stage, sum(counts.values()), self._top_leaves(counts)))
+
+        for stage, stats in self.stats.items():
+            stats.dump_stats(os.path.join(self.output_dir, f"{stage}.prof"))
+
+        if self.use_memory:
+            self._write_allocations()
+            tracemalloc.stop()
+
+        print(f"\n🔬 Profile of {time.time() - self.started:.1f}s written to {self.output_dir}/")
+        total = sum(n for _, n, _ in summary) or 1
+        for stage, n, leaves in summary:
+            print(f"   {stage:<24} {n * SAMPLE_INTERVAL:>7.2f}s sampled ({100 * n / total:>4.1f}%)  hottest: {leaves}")
+
+    def _top_leaves(self, counts, limit=2):
+        leaves = {}
+        for stack, n in counts.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + n
+        return ", ".join(leaf for leaf, _ in sorted(leaves.items(), key=lambda kv: -kv[1])[:limit])
+
+    def _write_allocations(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces(ALLOCATION_FILTERS)
+        current, peak = tracemalloc.get_traced_memory()
+        with open(os.path.join(self.output_dir, "allocations.txt"), "w", encoding="utf-8") as f:
+            f.write(f"Traced memory: current {current / 1024 ** 2:.1f} MB, peak {peak / 1024 ** 2:.1f} MB\n\n")
+            f.write("Top allocations still live at the end of the run:\n")
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                f.write(f"  {stat}\n")
+            for stage, diffs in sorted(self.allocations.items()):
+                f.write(f"\n[{stage}] allocated while the first {len(diffs)} spans ran (all threads):\n")
+                merged = {}
+                for diff in diffs:
+                    for stat in diff:
+                        key = str(stat.traceback[0]) if stat.traceback else "?"
+                        merged[key] = merged.get(key, 0) + stat.size_diff
+                for location, size in sorted(merged.items(), key=lambda kv: -kv[1])[:TOP_ALLOCATIONS]:
+                    f.write(f"  {location}: {size / 1024:+.1f} KB\n")
+
+_profiler = None
+
+def start(name, modes=DEFAULT_MODES):
+    global _profiler
+    _profiler = Profiler(name, modes)
+    _profiler.start()
+    return _profiler
+
+def stop():
+    global _profiler
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
@@ -0,0 +1,496 @@
+import os
+import json
+import time
+import base64
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import tracing
+import scheduler
+
+# selenium / webdriver_manager are imported in get_driver(), so planning and
+# --help don't pay for them.
+
+SERVER_PORT = 8000
+OUTPUT_DIR = "generation_outputs"
+REPORT_FILENAME = "render_report.json"
+SCREENSHOT_FILENAME = "screenshot.png"
+CHANGED_PAGES_FILENAME = "changed_pages.json"
+VIEWS_DIRNAME = "views"
+
+# webdriver_manager resolves (and may download) a driver on every install()
+# call; the resolved path is remembered here and reused while it still exists.
+DRIVER_CACHE_PATH = os.path.join(".cache", "webdriver_paths.json")
+
+# Time given to Three.js to build the scene and draw a few frames
+RENDER_WAIT = 5
+
+# Frame-time sampling after RENDER_WAIT; scenes without an animation loop
+# simply report fewer (or zero) sampled frames once the timeout expires.
+PROFILE_FRAMES = 120
+PROFILE_TIMEOUT = 10
+
+# Installed before any page script runs, so errors thrown while the
+# generated code is evaluated are captured too (console logs alone miss
+# the column/source of uncaught exceptions and all unhandled rejections).
+ERROR_HOOK_JS = """
+window.__renderErrors = [];
+window.addEventListener('error', function (e) {
+    window.__renderErrors.push({
+        type: 'error',
+        message: String(e.message),
+        source: e.filename || '',
+        line: e.lineno || 0,
+        column: e.colno || 0
+    });
+});
+window.addEventListener('unhandledrejection', function (e) {
+    var reason = e.reason;
+    window.__renderErrors.push({
+        type: 'unhandledrejection',
+        message: String(reason && reason.stack ? reason.stack : reason)
+    });
+});
+"""
+
+# three.js announces every WebGLRenderer and Scene it constructs to
+# window.__THREE_DEVTOOLS__ (the browser devtools extension hook). Registering
+# it up front gives us the renderer without touching the generated code; its
+# render() is wrapped per instance to timestamp frames.
+PROFILE_HOOK_JS = """
+window.__renderProbe = { renderer: null, scene: null, camera: null, frameTimes: [] };
+window.__THREE_DEVTOOLS__ = new EventTarget();
+window.__THREE_DEVTOOLS__.addEventListener('observe', function (e) {
+    var probe = window.__renderProbe;
+    var obj = e.detail;
+    if (obj && obj.isScene && !probe.scene) {
+        probe.scene = obj;
+    }
+    if (obj && obj.isWebGLRenderer && !probe.renderer) {
+        probe.renderer = obj;
+        var render = obj.render;
+        obj.render = function (scene, camera) {
+            probe.scene = scene;
+            probe.camera = camera;
+            probe.frameTimes.push(performance.now());
+            if (probe.frameTimes.length > 5000) probe.frameTimes.shift();
+            return render.apply(this, arguments);
+        };
+    }
+});
+"""
+
+PROFILE_COLLECT_JS = """
+var frames = arguments[0];
+var timeoutMs = arguments[1];
+var done = arguments[arguments.length - 1];
+var probe = window.__renderProbe;
+if (!probe || !probe.renderer) { done(null); return; }
+
+var startCount = probe.frameTimes.length;
+var startTime = performance.now();
+
+function finish() {
+    var times = probe.frameTimes.slice(Math.max(startCount - 1, 0));
+    var deltas = [];
+    for (var i = 1; i < times.length; i++) deltas.push(times[i] - times[i - 1]);
+
+    var info = probe.renderer.info;
+    var scene = { objects: 0, meshes: 0, lights: 0, vertices: 0 };
+    if (probe.scene) {
+        probe.scene.traverse(function (o) {
+            scene.objects++;
+            if (o.isMesh) {
+                scene.meshes++;
+                var pos = o.geometry && o.geometry.attributes && o.geometry.attributes.position;
+                if (pos) scene.vertices += pos.count;
+            }
+            if (o.isLight) scene.lights++;
+        });
+    }
+    var memory = performance.memory || {};
+    done({
+        frame_deltas_ms: deltas,
+        render: {
+            draw_calls: info.render.calls,
+            triangles: info.render.triangles,
+            points: info.render.points,
+            lines: info.render.lines
+        },
+        memory: {
+            geometries: info.memory.geometries,
+            textures: info.memory.textures,
+            programs: info.programs ? info.programs.length : null
+        },
+        js_heap: {
+            used_bytes: memory.usedJSHeapSize || null,
+            total_bytes: memory.totalJSHeapSize || null
+        },
+        scene_graph: scene
+    });
+}
+
+(function wait() {
+    if (probe.frameTimes.length - startCount >= frames || performance.now() - startTime > timeoutMs) {
+        finish();
+    } else {
+        setTimeout(wait, 50);
+    }
+})();
+"""
+
+COLLECT_JS = """
+var nav = performance.getEntriesByType('navigation')[0];
+var timing = nav ? {
+    dom_content_loaded_ms: nav.domContentLoadedEventEnd,
+    load_ms: nav.loadEventEnd,
+    transfer_bytes: nav.transferSize
+} : {};
+
+var probe = document.createElement('canvas');
+var available = !!(probe.getContext('webgl2') || probe.getContext('webgl'));
+var contexts = [];
+document.querySelectorAll('canvas').forEach(function (c) {
+    var type = 'webgl2';
+    var ctx = c.getContext('webgl2');
+    if (!ctx) { type = 'webgl'; ctx = c.getContext('webgl'); }
+    contexts.push({
+        type: ctx ? type : null,
+        lost: ctx ? ctx.isContextLost() : null,
+        width: c.width,
+        height: c.height
+    });
+});
+
+return {
+    timing: timing,
+    errors: window.__renderErrors || [],
+    webgl: {
+        available: available,
+        canvas_count: contexts.length,
+        contexts: contexts,
+        active: contexts.some(function (c) { return c.type && !c.lost; })
+    }
+};
+"""
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    server_address = ('', SERVER_PORT)
+    httpd = ThreadingHTTPServer(server_address, QuietHandler)
+    thread = threading.Thread(name='render_server', target=httpd.serve_forever, daemon=True)
+    thread.start()
+    print(f"Server started at http://localhost:{SERVER_PORT}")
+    return httpd
+
+def load_driver_cache():
+    if os.path.exists(DRIVER_CACHE_PATH):
+        try:
+            with open(DRIVER_CACHE_PATH, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return {}
+
+def resolve_driver_path(browser, install):
+    cache = load_driver_cache()
+    path = cache.get(browser)
+    if path and os.path.exists(path):
+        return path
+
+    path = install()
+    cache[browser] = path
+    os.makedirs(os.path.dirname(DRIVER_CACHE_PATH), exist_ok=True)
+    with open(DRIVER_CACHE_PATH, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=4)
+    return path
+
+def get_driver():
+    from selenium import webdriver
+
+    try:
+        from selenium.webdriver.chrome.options import Options as ChromeOptions
+        from selenium.webdriver.chrome.service import Service as ChromeService
+        print("Trying to initialize Chrome...")
+        options = ChromeOptions()
+        options.add_argument("--headless")
+        options.add_argument("--window-size=1920,1080")
+        options.add_argument("--disable-gpu")
+        options.set_capability('goog:loggingPrefs', {'browser': 'ALL'})
+
+        def install_chrome():
+            from webdriver_manager.chrome import ChromeDriverManager
+            return ChromeDriverManager().install()
+
+        service = ChromeService(resolve_driver_path("chrome", install_chrome))
+        driver = webdriver.Chrome(service=service, options=options)
+        return driver
+    except Exception as e:
+        print(f"Chrome failed: {e}")
+        try:
+            from selenium.webdriver.edge.options import Options as EdgeOptions
+            from selenium.webdriver.edge.service import Service as EdgeService
+            print("Trying to initialize Edge...")
+            options = EdgeOptions()
+            options.add_argument("--headless")
+            options.add_argument("--window-size=1920,1080")
+            options.add_argument("--disable-gpu")
+            options.set_capability('ms:loggingPrefs', {'browser': 'ALL'})
+
+            def install_edge():
+                from webdriver_manager.microsoft import EdgeChromiumDriverManager
+                return EdgeChromiumDriverManager().install()
+
+            service = EdgeService(resolve_driver_path("edge", install_edge))
+            driver = webdriver.Edge(service=service, options=options)
+            return driver
+        except Exception as e2:
+            print(f"Edge failed: {e2}")
+            return None
+
+def install_page_hooks(driver):
+    # Both Chrome and Edge are Chromium drivers and accept CDP commands
+    try:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": ERROR_HOOK_JS + PROFILE_HOOK_JS})
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not install page hooks, no exception capture or profiling: {e}")
+        return False
+
+def read_console_logs(driver):
+    try:
+        return driver.get_log('browser')
+    except Exception:
+        return []
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return round(ordered[index], 3)
+
+def collect_profile(driver):
+    driver.set_script_timeout(PROFILE_TIMEOUT + 5)
+    raw = driver.execute_async_script(PROFILE_COLLECT_JS, PROFILE_FRAMES, PROFILE_TIMEOUT * 1000)
+    if not raw:
+        return None
+
+    deltas = raw.pop("frame_deltas_ms")
+    raw["frames"] = {
+        "sampled": len(deltas),
+        "p50_ms": percentile(deltas, 50),
+        "p95_ms": percentile(deltas, 95),
+        "p99_ms": percentile(deltas, 99),
+        "max_ms": round(max(deltas), 3) if deltas else None,
+        "fps": round(1000 * len(deltas) / sum(deltas), 1) if deltas and sum(deltas) > 0 else None
+    }
+    return raw
+
+def save_profile_metadata(model_dir, profile):
+    # Merged into the generation metadata so efficiency sits next to tokens/latency
+    metadata_path = os.path.join(model_dir, "metadata.json")
+    metadata = {}
+    if os.path.exists(metadata_path):
+        try:
+            with open(metadata_path, "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Could not read {metadata_path}, rewriting it: {e}")
+
+    metadata["render_profile"] = profile
+    with open(metadata_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=4)
+    os.replace(metadata_path + ".tmp", metadata_path)
+
+def capture_views(driver, model_dir):
+    # Camera presets come from the hook process_outputs.py injects into each page
+    views = driver.execute_script("return window.__captureViews ? window.__captureViews() : null;")
+    if not views:
+        return []
+
+    views_dir = os.path.join(model_dir, VIEWS_DIRNAME)
+    os.makedirs(views_dir, exist_ok=True)
+    saved = []
+    for name, data_url in sorted(views.items()):
+        if not data_url or "," not in data_url:
+            continue
+        with open(os.path.join(views_dir, f"{name}.png"), "wb") as f:
+            f.write(base64.b64decode(data_url.split(",", 1)[1]))
+        saved.append(name)
+    return saved
+
+def render_page(driver, model_name):
+    model_dir = os.path.join(OUTPUT_DIR, model_name)
+    url = f"http://localhost:{SERVER_PORT}/{OUTPUT_DIR}/{model_name}/index.html"
+
+    report = {
+        "model": model_name,
+        "url": url,
+        "status": "ok",
+        "console_errors": [],
+        "console_warnings": 0,
+        "uncaught_exceptions": [],
+        "timing": {},
+        "webgl": {},
+        "profile": None,
+        "screenshot": None,
+        "views": [],
+        "timestamp": time.time()
+    }
+
+    # Drop log entries left over from the previous page
+    read_console_logs(driver)
+
+    start_time = time.time()
+    try:
+        with tracing.span("render.navigate", model=model_name):
+            driver.get(url)
+        report["timing"]["navigation_s"] = round(time.time() - start_time, 3)
+
+        # Wait for Three.js to render
+        time.sleep(RENDER_WAIT)
+
+        collected = driver.execute_script(COLLECT_JS)
+        report["timing"].update(collected.get("timing", {}))
+        report["uncaught_exceptions"] = collected.get("errors", [])
+        report["webgl"] = collected.get("webgl", {})
+
+        with tracing.span("render.profile", model=model_name):
+            report["profile"] = collect_profile(driver)
+        with tracing.span("render.views", model=model_name):
+            report["views"] = capture_views(driver, model_dir)
+
+        with tracing.span("render.screenshot", model=model_name):
+            screenshot_path = os.path.join(model_dir, SCREENSHOT_FILENAME)
+            driver.save_screenshot(screenshot_path)
+        report["screenshot"] = SCREENSHOT_FILENAME
+    except Exception as e:
+        report["status"] = "driver_error"
+        report["driver_error"] = str(e)
+
+    logs = read_console_logs(driver)
+    report["console_errors"] = [entry["message"] for entry in logs if entry.get("level") == "SEVERE"]
+    report["console_warnings"] = sum(1 for entry in logs if entry.get("level") == "WARNING")
+
+    if report["status"] == "ok" and (report["console_errors"] or report["uncaught_exceptions"]):
+        report["status"] = "js_error"
+    elif report["status"] == "ok" and not report["webgl"].get("active"):
+        report["status"] = "no_webgl"
+
+    report["timing"]["total_s"] = round(time.time() - start_time, 3)
+
+    # Written last and renamed into place: --changed-only treats a page with a
+    # report as rendered, so an interrupted page is rendered again next time
+    report_path = os.path.join(model_dir, REPORT_FILENAME)
+    with open(report_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    os.replace(report_path + ".tmp", report_path)
+
+    if report["profile"]:
+        save_profile_metadata(model_dir, report["profile"])
+
+    return report
+
+def pages_to_render(changed_only):
+    model_names = sorted(m for m in os.listdir(OUTPUT_DIR) if os.path.exists(os.path.join(OUTPUT_DIR, m, "index.html")))
+    if not changed_only:
+        return model_names
+
+    changed_path = os.path.join(OUTPUT_DIR, CHANGED_PAGES_FILENAME)
+    if not os.path.exists(changed_path):
+        print(f"⚠️ {changed_path} not found, rendering every page.")
+        return model_names
+    with open(changed_path, "r", encoding="utf-8") as f:
+        changed = set(json.load(f).get("changed", []))
+
+    # Pages that were never rendered, or rebuilt since their last render, count
+    # as changed too: changed_pages.json only covers the latest process run
+    return [m for m in model_names if m in changed or is_stale(m)]
+
+def is_stale(model_name):
+    report_path = os.path.join(OUTPUT_DIR, model_name, REPORT_FILENAME)
+    if not os.path.exists(report_path):
+        return True
+    return os.path.getmtime(os.path.join(OUTPUT_DIR, model_name, "index.html")) > os.path.getmtime(report_path)
+
+def build_arg_parser(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(description="Render generated scenes once and collect screenshots + diagnostics.")
+    parser.add_argument("--changed-only", action="store_true",
+                        help=f"only render pages listed in {OUTPUT_DIR}/{CHANGED_PAGES_FILENAME} by process_outputs.py "
+                             f"or rebuilt since their last render")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    if not os.path.exists(OUTPUT_DIR):
+        print(f"Output directory {OUTPUT_DIR} not found.")
+        return
+
+    model_names = pages_to_render(args.changed_only)
+    if not model_names:
+        print("Nothing to render.")
+        return
+
+    httpd = start_server()
+
+    driver = get_driver()
+    if not driver:
+        print("❌ Could not initialize any browser driver (Chrome or Edge). Please ensure a browser is installed.")
+        httpd.shutdown()
+        return
+
+    install_page_hooks(driver)
+    tracing.start_run("render")
+
+    print("📸 Rendering pages (screenshots + diagnostics)...")
+    counts = {}
+    try:
+        scheduler.add_abort_hook(driver.quit)
+        with scheduler.graceful_shutdown():
+            for model_name in model_names:
+                if scheduler.stop_requested():
+                    print(f"🛑 Stopped after {sum(counts.values())} of {len(model_names)} pages; "
+                          f"--changed-only renders the rest")
+                    break
+                print(f"\n--- Rendering {model_name} ---")
+                with tracing.span("render.page", model=model_name) as attrs:
+                    report = render_page(driver, model_name)
+                    attrs["status"] = report["status"]
+                counts[report["status"]] = counts.get(report["status"], 0) + 1
+
+                if report["status"] == "ok":
+                    print(f"✅ Rendered in {report['timing']['total_s']:.2f}s, WebGL active, no JS errors")
+                elif report["status"] == "js_error":
+                    print(f"❌ JS ERRORS FOUND in {model_name}:")
+                    for message in report["console_errors"]:
+                        print(f"   {message}")
+                    for error in report["uncaught_exceptions"]:
+                        print(f"   {error['message']}")
+                elif report["status"] == "no_webgl":
+                    print(f"⚠️ No active WebGL context (scene never created a renderer?)")
+                else:
+                    print(f"❌ Driver fail: {report.get('driver_error')}")
+                profile = report["profile"]
+                if profile:
+                    print(f"   📊 {profile['render']['draw_calls']} draw calls, {profile['render']['triangles']} triangles, "
+                          f"{profile['scene_graph']['objects']} nodes, p95 frame {profile['frames']['p95_ms']} ms")
+                if report["views"]:
+                    print(f"   🎥 Views: {', '.join(report['views'])}")
+    finally:
+        scheduler.remove_abort_hook(driver.quit)
+        driver.quit()
+        httpd.shutdown()
+
+    print("\n🏁 Render pass complete.")
+    for status, count in sorted(counts.items()):
+        print(f"   {status}: {count}")
+    tracing.summarize(tracing.trace_path())
+
+if __name__ == "__main__":
+    main()
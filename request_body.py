@@ -0,0 +1,264 @@
+import io
+import os
+import json
+import uuid
+import base64
+import threading
+from collections import OrderedDict
+import tracing
+import input_store
+
+# Streamed JSON request bodies. A payload holds DataURL objects instead of
+# base64 strings; JSONStream serializes everything else once and base64-encodes
+# each image from its JPEG/WebP bytes in small chunks while requests writes the body
+# to the socket. The only full copy of an image in memory is its encoded bytes,
+# which are also shared between requests through the encode cache below.
+
+# Multiple of 3 so every chunk encodes without base64 padding
+CHUNK_SIZE = 3 * 16 * 1024
+
+# Encoded JPEGs kept in memory. evaluate_models uploads the same input floor
+# plan with every generated image and evaluator, so it is encoded only once.
+JPEG_CACHE_ITEMS = 32
+
+_jpeg_cache = OrderedDict()
+_jpeg_lock = threading.Lock()
+
+# Byte-budget encoding (encode_within). The quality search stops at
+# MIN_QUALITY; below that the image is shrunk by DOWNSCALE_STEP instead, down
+# to MIN_SIDE pixels.
+MIN_QUALITY = 40
+DOWNSCALE_STEP = 0.8
+MIN_SIDE = 256
+
+# Chroma subsampling halves the colour resolution, which smears thin coloured
+# lines (doors, dimension marks) on plans. 4:4:4 is kept unless 4:2:0 reaches
+# more than this many quality points higher within the same budget.
+SUBSAMPLING_MARGIN = 10
+
+# Chosen (size, format, quality, subsampling) per input and budget, so later
+# runs encode once instead of searching again
+DECISIONS_PATH = os.path.join(".cache", "encode_decisions.json")
+
+# Models known to accept image/webp uploads through OpenRouter
+WEBP_MODEL_PREFIXES = ("openai/", "google/")
+
+_decisions = None
+_decisions_lock = threading.Lock()
+
+def _cached(key):
+    with _jpeg_lock:
+        if key in _jpeg_cache:
+            _jpeg_cache.move_to_end(key)
+            return _jpeg_cache[key]
+    return None
+
+def _remember(key, value):
+    with _jpeg_lock:
+        _jpeg_cache[key] = value
+        while len(_jpeg_cache) > JPEG_CACHE_ITEMS:
+            _jpeg_cache.popitem(last=False)
+    return value
+
+def _load_image(image_path, max_size):
+    # JPEGs are opened lazily so thumbnail() can use draft() (reduced-scale DCT
+    # decoding): faster than full-size pixels, and what uploads were always
+    # encoded from. Other ingested inputs come from input_store's decoded pixels.
+    if image_path.lower().endswith(input_store.DRAFT_EXTENSIONS):
+        from PIL import Image
+        img = Image.open(image_path)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+    else:
+        img = input_store.open_rgb(image_path)
+    if img.width > max_size or img.height > max_size:
+        img.thumbnail((max_size, max_size))
+    return img
+
+def _encode(img, fmt, quality, subsampling=None):
+    # subsampling None keeps Pillow's default (4:2:0), i.e. encode_jpeg's output
+    buffer = io.BytesIO()
+    if fmt == "WEBP":
+        img.save(buffer, format="WEBP", quality=quality, method=4)
+    elif subsampling is None:
+        img.save(buffer, format="JPEG", quality=quality)
+    else:
+        img.save(buffer, format="JPEG", quality=quality, subsampling=subsampling)
+    return buffer.getvalue()
+
+def encode_jpeg(image_path, max_size, quality):
+    # RGB JPEG bytes of the image, downscaled to fit max_size
+    stat = os.stat(image_path)
+    key = (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns, max_size, quality)
+    data = _cached(key)
+    if data is None:
+        data = input_store.read_variant(image_path, max_size, quality)
+        if data is None:
+            data = _encode(_load_image(image_path, max_size), "JPEG", quality)
+            input_store.save_variant(image_path, max_size, quality, data)
+        _remember(key, data)
+    return data
+
+def accepts_webp(model):
+    return bool(model) and model.startswith(WEBP_MODEL_PREFIXES)
+
+def _search_quality(img, fmt, subsampling, max_quality, max_bytes):
+    # Highest quality in [MIN_QUALITY, max_quality] that fits: (quality, bytes) or None
+    low, high, best = MIN_QUALITY, max_quality, None
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(img, fmt, quality, subsampling)
+        if len(data) <= max_bytes:
+            best = (quality, data)
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best
+
+def _search(img, quality, max_bytes, webp):
+    # (decision, bytes) for the image at its current size, or None if nothing fits
+    jpeg = {}
+    for subsampling in (0, 2):  # 4:4:4, 4:2:0
+        found = _search_quality(img, "JPEG", subsampling, quality, max_bytes)
+        if found:
+            jpeg[subsampling] = found
+    choice = None
+    if 0 in jpeg and (2 not in jpeg or jpeg[2][0] - jpeg[0][0] <= SUBSAMPLING_MARGIN):
+        choice = ("JPEG", 0) + jpeg[0]
+    elif 2 in jpeg:
+        choice = ("JPEG", 2) + jpeg[2]
+    if webp:
+        found = _search_quality(img, "WEBP", None, quality, max_bytes)
+        if found and (choice is None or found[0] >= choice[2]):
+            choice = ("WEBP", None) + found
+    if choice is None:
+        return None
+    fmt, subsampling, found_quality, data = choice
+    return {"size": max(img.size), "format": fmt, "quality": found_quality, "subsampling": subsampling}, data
+
+def _decide(image_path, max_size, quality, max_bytes, webp):
+    img = _load_image(image_path, max_size)
+    # Unchanged from encode_jpeg whenever that already fits
+    data = _encode(img, "JPEG", quality)
+    if len(data) <= max_bytes:
+        return {"size": max(img.size), "format": "JPEG", "quality": quality, "subsampling": None}, data
+    while True:
+        found = _search(img, quality, max_bytes, webp)
+        if found:
+            return found
+        if min(img.size) * DOWNSCALE_STEP < MIN_SIDE:
+            print(f"⚠️ {os.path.basename(image_path)} does not fit {max_bytes} bytes even at {max(img.size)}px")
+            return {"size": max(img.size), "format": "JPEG", "quality": MIN_QUALITY, "subsampling": 2,
+                    "fits": False}, _encode(img, "JPEG", MIN_QUALITY, 2)
+        # Re-read at the smaller bound so a stored decision reproduces the same pixels
+        img = _load_image(image_path, int(max(img.size) * DOWNSCALE_STEP))
+
+def _load_decisions():
+    global _decisions
+    if _decisions is None:
+        _decisions = {}
+        if os.path.exists(DECISIONS_PATH):
+            try:
+                with open(DECISIONS_PATH, "r", encoding="utf-8") as f:
+                    _decisions = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Encode decisions unreadable, searching again: {e}")
+    return _decisions
+
+def _save_decision(key, decision):
+    with _decisions_lock:
+        _load_decisions()[key] = decision
+        os.makedirs(os.path.dirname(DECISIONS_PATH), exist_ok=True)
+        with open(DECISIONS_PATH + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(_decisions, f, indent=1, sort_keys=True)
+        os.replace(DECISIONS_PATH + ".tmp", DECISIONS_PATH)
+
+def encode_within(image_path, max_size, quality, max_bytes, webp=False):
+    # DataURL of the image in at most max_bytes (before base64): quality binary
+    # search, 4:4:4 vs 4:2:0 JPEG, WebP if allowed, then downscaling. quality
+    # is the ceiling. max_bytes None is plain encode_jpeg.
+    if max_bytes is None:
+        return DataURL(encode_jpeg(image_path, max_size, quality))
+    stat = os.stat(image_path)
+    key = (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns, max_size, quality, max_bytes, webp)
+    cached = _cached(key)
+    if cached is not None:
+        return cached
+
+    decision_key = "|".join(str(part) for part in key)
+    with _decisions_lock:
+        decision = _load_decisions().get(decision_key)
+    data = None
+    if decision:
+        img = _load_image(image_path, decision["size"])
+        data = _encode(img, decision["format"], decision["quality"], decision["subsampling"])
+        if len(data) > max_bytes and decision.get("fits", True):
+            # Different Pillow/libjpeg build than the one that decided
+            data = None
+    if data is None:
+        with tracing.span("encode.search", bytes=max_bytes):
+            decision, data = _decide(image_path, max_size, quality, max_bytes, webp)
+        _save_decision(decision_key, decision)
+    mime_type = "image/webp" if decision["format"] == "WEBP" else "image/jpeg"
+    return _remember(key, DataURL(data, mime_type))
+
+class DataURL:
+    def __init__(self, data, mime_type="image/jpeg"):
+        self.data = data
+        self.mime_type = mime_type
+
+    def encoded_length(self):
+        return len(self.prefix()) + 4 * ((len(self.data) + 2) // 3)
+
+    def prefix(self):
+        return f"data:{self.mime_type};base64,".encode("ascii")
+
+    def chunks(self):
+        yield self.prefix()
+        view = memoryview(self.data)
+        for start in range(0, len(view), CHUNK_SIZE):
+            yield base64.b64encode(view[start:start + CHUNK_SIZE])
+
+class JSONStream:
+    # Iterable request body with a known length, so requests sends it with a
+    # Content-Length header instead of chunked encoding. Re-iterable: retries
+    # and hedged duplicates each get a fresh pass over the same bytes.
+    def __init__(self, payload):
+        self.model = payload.get("model")
+        self.images = []
+        marker = f"@@image-{uuid.uuid4().hex}-"
+        text = json.dumps(payload, default=lambda obj: self._placeholder(obj, marker))
+        self.parts = []
+        for i, piece in enumerate(text.split(f'"{marker}')):
+            if i == 0:
+                self.parts.append(piece.encode("utf-8"))
+            else:
+                # piece = '<index>@@"...rest of the document'
+                index, rest = piece.split('@@"', 1)
+                self.parts.append((int(index), rest.encode("utf-8")))
+        self.length = sum(len(p) if isinstance(p, bytes) else len(p[1]) for p in self.parts)
+        self.length += sum(2 + image.encoded_length() for image in self.images)
+
+    def _placeholder(self, obj, marker):
+        if not isinstance(obj, DataURL):
+            raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+        self.images.append(obj)
+        return f"{marker}{len(self.images) - 1}@@"
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            index, rest = part
+            yield b'"'
+            yield from self.images[index].chunks()
+            yield b'"'
+            yield rest
+
+    def getvalue(self):
+        # Whole body at once (debugging, request recording)
+        return b"".join(self)
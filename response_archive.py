@@ -0,0 +1,295 @@
+import os
+import re
+import json
+import gzip
+import time
+import base64
+import hashlib
+import argparse
+import threading
+import tracing
+
+# Archive of raw API responses (generate, evaluate, phase1, test_image_models)
+# for re-running extraction and parsing offline. Base64 payloads (data: URLs,
+# b64_json fields) are decoded into content-addressed blob files, so an image
+# is stored once, as binary, however many responses carry it; what is left of
+# each response is compact JSON compressed with zstd (the optional zstandard
+# package) or gzip:
+#   blobs/<ab>/<sha256>.<ext>        decoded payloads
+#   records/<ab>/<sha256>.json.zst   response JSON with payloads replaced by
+#                                    "data:<mime>;blob,<name>" / "blob:<name>"
+#   index.jsonl                      one line per archived response
+#   python response_archive.py                 # what is archived, and how big
+#   python response_archive.py --replay        # re-run the pipeline's parsers
+#   python response_archive.py --import generation_outputs_images
+ARCHIVE_DIR = os.path.join(".cache", "responses")
+INDEX_FILENAME = "index.jsonl"
+
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+# Shorter base64 strings (signatures, tiny icons) stay inline
+BLOB_MIN_CHARS = 4096
+
+DATA_URL_RE = re.compile(r'data:([\w.+-]+/[\w.+-]+(?:;[\w.+-]+=[\w.+-]+)*);base64,([A-Za-z0-9+/]+={0,2})')
+BASE64_RE = re.compile(r'[A-Za-z0-9+/]+={0,2}')
+BLOB_NAME_RE = re.compile(r'[0-9a-f]{64}\.[a-z]+')
+BLOB_DATA_URL_RE = re.compile(r'data:([\w.+-]+/[\w.+-]+(?:;[\w.+-]+=[\w.+-]+)*);blob,([0-9a-f]{64}\.[a-z]+)')
+
+# Leading bytes -> blob file extension; providers label WebP as image/png, so
+# the MIME type of a data: URL isn't trusted for this
+BLOB_SIGNATURES = ((b"\x89PNG", ".png"), (b"\xff\xd8\xff", ".jpg"), (b"GIF8", ".gif"), (b"%PDF", ".pdf"))
+
+_lock = threading.Lock()
+
+def _zstandard():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+def _compress(data):
+    zstandard = _zstandard()
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), ".json.zst"
+    return gzip.compress(data, GZIP_LEVEL, mtime=0), ".json.gz"
+
+def _decompress(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".zst"):
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise ImportError(f"{path} is zstd-compressed: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def blob_name(data):
+    extension = ".bin"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        extension = ".webp"
+    for signature, ext in BLOB_SIGNATURES:
+        if data.startswith(signature):
+            extension = ext
+    return hashlib.sha256(data).hexdigest() + extension
+
+def blob_path(name):
+    return os.path.join(ARCHIVE_DIR, "blobs", name[:2], name)
+
+def _store_blob(encoded, blobs):
+    # Name of the blob holding base64 text `encoded`, or None if it isn't
+    # canonical base64 (it could not be restored byte-for-byte)
+    try:
+        data = base64.b64decode(encoded, validate=True)
+    except ValueError:
+        return None
+    if base64.b64encode(data).decode("ascii") != encoded:
+        return None
+    name = blob_name(data)
+    if name not in blobs and not os.path.exists(blob_path(name)):
+        _write_atomic(blob_path(name), data)
+    blobs[name] = len(data)
+    return name
+
+def _strip_string(text, blobs):
+    if len(text) < BLOB_MIN_CHARS:
+        return text
+
+    def replace(match):
+        if len(match.group(2)) < BLOB_MIN_CHARS:
+            return match.group(0)
+        name = _store_blob(match.group(2), blobs)
+        return f"data:{match.group(1)};blob,{name}" if name else match.group(0)
+
+    if "data:" in text:
+        text = DATA_URL_RE.sub(replace, text)
+    if len(text) >= BLOB_MIN_CHARS and BASE64_RE.fullmatch(text):
+        name = _store_blob(text, blobs)
+        if name:
+            return f"blob:{name}"
+    return text
+
+def strip_blobs(value, blobs):
+    # Copy of a parsed response with large base64 payloads moved to blob files;
+    # blobs collects {name: decoded size}
+    if isinstance(value, dict):
+        return {k: strip_blobs(v, blobs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [strip_blobs(v, blobs) for v in value]
+    if isinstance(value, str):
+        return _strip_string(value, blobs)
+    return value
+
+def _blob_base64(name):
+    with open(blob_path(name), "rb") as f:
+        return base64.b64encode(f.read()).decode("ascii")
+
+def restore_blobs(value):
+    # Inverse of strip_blobs: the response exactly as the API returned it
+    if isinstance(value, dict):
+        return {k: restore_blobs(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [restore_blobs(v) for v in value]
+    if isinstance(value, str):
+        if value.startswith("blob:") and BLOB_NAME_RE.fullmatch(value, 5):
+            return _blob_base64(value[5:])
+        if ";blob," in value:
+            return BLOB_DATA_URL_RE.sub(lambda m: f"data:{m.group(1)};base64,{_blob_base64(m.group(2))}", value)
+    return value
+
+def blob_ref(value):
+    # Blob name a parser pulled out of a stripped response: "blob:<name>", or
+    # "<name>" from splitting "data:<mime>;blob,<name>" at the comma like a
+    # base64 data URL. None for anything else.
+    if not isinstance(value, str):
+        return None
+    if value.startswith("blob:"):
+        value = value[5:]
+    elif value.startswith("data:") and ";blob," in value:
+        value = value.split(",", 1)[1]
+    return value if BLOB_NAME_RE.fullmatch(value) else None
+
+def archive_response(stage, model, response, **context):
+    # Archives one parsed response; returns its index entry, or None if it
+    # could not be written (archiving never fails the API call it records)
+    with tracing.span(f"{stage}.archive", model=model):
+        try:
+            blobs = {}
+            raw_bytes = len(json.dumps(response, separators=(",", ":")))
+            stripped = json.dumps(strip_blobs(response, blobs), separators=(",", ":")).encode("utf-8")
+            record_id = hashlib.sha256(stripped).hexdigest()
+            compressed, extension = _compress(stripped)
+            record = os.path.join("records", record_id[:2], record_id + extension)
+            if not os.path.exists(os.path.join(ARCHIVE_DIR, record)):
+                _write_atomic(os.path.join(ARCHIVE_DIR, record), compressed)
+            entry = dict(context, id=record_id, time=time.time(), stage=stage, model=model,
+                         record=record.replace(os.sep, "/"), blobs=sorted(blobs), raw_bytes=raw_bytes,
+                         stored_bytes=len(compressed), blob_bytes=sum(blobs.values()))
+            with _lock:
+                with open(os.path.join(ARCHIVE_DIR, INDEX_FILENAME), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            return entry
+        except Exception as e:
+            print(f"⚠️ Could not archive {stage} response from {model}: {e}")
+            return None
+
+def load_index():
+    path = os.path.join(ARCHIVE_DIR, INDEX_FILENAME)
+    entries = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return entries
+
+def load(entry, inline_blobs=False):
+    response = json.loads(_decompress(os.path.join(ARCHIVE_DIR, entry["record"])))
+    return restore_blobs(response) if inline_blobs else response
+
+def iter_responses(stage=None, model=None, inline_blobs=False):
+    # (index entry, response) for every archived response, oldest first.
+    # Without inline_blobs, payloads stay blob references (see blob_ref), which
+    # is what keeps re-parsing thousands of image responses fast.
+    for entry in load_index():
+        if (stage is None or entry["stage"] == stage) and (model is None or entry["model"] == model):
+            yield entry, load(entry, inline_blobs)
+
+def import_legacy(directories):
+    # full_response.txt files written by test_image_models.py before the archive
+    imported = 0
+    for directory in directories:
+        for root, _, files in sorted(os.walk(directory)):
+            if "full_response.txt" not in files:
+                continue
+            path = os.path.join(root, "full_response.txt")
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    response = json.load(f)
+            except (OSError, ValueError):
+                print(f"⏭️ Skipping {path}, not a JSON response")
+                continue
+            if archive_response("test", response.get("model", os.path.basename(root)), response,
+                                subject=os.path.basename(root), source=path.replace(os.sep, "/")):
+                imported += 1
+    print(f"📦 Imported {imported} responses")
+
+def replay(stage=None):
+    # Re-runs the pipeline's response parsers over the archive
+    import batch_generate_3d
+    import evaluate_models
+    started = time.time()
+    outcomes = {}
+    for entry, response in iter_responses(stage):
+        if entry["stage"] in ("generate", "test"):
+            img_url, b64_image = batch_generate_3d.extract_image_payload(response)
+            outcome = "image blob" if blob_ref(b64_image) else "image url" if img_url else \
+                      "inline base64" if b64_image else "no image"
+        elif entry["stage"] == "evaluate":
+            content = (response.get("choices") or [{}])[0].get("message", {}).get("content") or ""
+            try:
+                json.loads(evaluate_models.extract_json(content))
+                outcome = "scores"
+            except json.JSONDecodeError:
+                outcome = "unparseable"
+        else:
+            continue
+        key = (entry["stage"], outcome)
+        outcomes[key] = outcomes.get(key, 0) + 1
+    print(f"🔁 Replayed {sum(outcomes.values())} responses in {time.time() - started:.2f}s")
+    for (stage_name, outcome), n in sorted(outcomes.items()):
+        print(f"   {stage_name:<9} {outcome:<14} {n:>6}")
+
+def print_summary():
+    entries = load_index()
+    if not entries:
+        print(f"📦 No responses archived in {ARCHIVE_DIR}/")
+        return
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault((entry["stage"], entry["model"]), [0, 0, 0, 0])
+        group[0] += 1
+        group[1] += entry["raw_bytes"]
+        group[2] += entry["stored_bytes"]
+        group[3] += entry["blob_bytes"]
+    mb = 1024 ** 2
+    print(f"📦 {len(entries)} responses archived in {ARCHIVE_DIR}/")
+    print(f"{'stage':<9} {'model':<42} {'n':>5} {'raw MB':>8} {'json MB':>8} {'blobs MB':>9}")
+    for (stage, model), (n, raw, stored, blob) in sorted(groups.items()):
+        print(f"{stage:<9} {model[:42]:<42} {n:>5} {raw / mb:>8.2f} {stored / mb:>8.3f} {blob / mb:>9.2f}")
+    blob_dir = os.path.join(ARCHIVE_DIR, "blobs")
+    on_disk = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(blob_dir) for f in files)
+    raw = sum(e["raw_bytes"] for e in entries)
+    stored = sum(e["stored_bytes"] for e in entries)
+    print(f"   {raw / mb:.1f} MB of responses kept as {stored / mb:.2f} MB of JSON + {on_disk / mb:.1f} MB of unique blobs")
+
+def build_arg_parser(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(description="Inspect, import or replay archived API responses.")
+    parser.add_argument("--replay", action="store_true", help="re-run the response parsers over the archive")
+    parser.add_argument("--stage", choices=["generate", "evaluate", "test"], help="only replay this stage")
+    parser.add_argument("--import", dest="import_dirs", nargs="+", metavar="DIR",
+                        help="archive full_response.txt files found under these directories")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.import_dirs:
+        import_legacy(args.import_dirs)
+    if args.replay:
+        replay(args.stage)
+    else:
+        print_summary()
+
+if __name__ == "__main__":
+    main()
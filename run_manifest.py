@@ -0,0 +1,364 @@
+import os
+import sys
+import json
+import glob
+import hashlib
+import shutil
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+import batch_generate_3d
+import generation_cache
+import evaluate_models
+import scheduler
+import tracing
+import pricing
+import input_store
+
+# Every cell a manifest run has produced, keyed by what determines its output.
+# Lets a new run reuse results from any earlier run dir instead of paying again,
+# and tells an output made for this key from a stale one at the same path.
+LEDGER_PATH = os.path.join(".cache", "run_ledger.json")
+
+DEFAULT_INPUTS = ["*.jpg", "*.jpeg", "*.png", "*.webp", "*.avif"]
+
+_hash_cache = {}
+
+def file_sha256(path):
+    if path not in _hash_cache:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        _hash_cache[path] = digest.hexdigest()
+    return _hash_cache[path]
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def cell_key(*parts):
+    return text_sha256(json.dumps(parts, sort_keys=True))
+
+def load_manifest(path):
+    with open(path, "rb") as f:
+        manifest = tomllib.load(f)
+
+    manifest.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    manifest.setdefault("input_dir", batch_generate_3d.INPUT_DIR)
+    manifest.setdefault("inputs", DEFAULT_INPUTS)
+
+    for stage in ("generate", "evaluate"):
+        section = manifest.get(stage)
+        if section is None:
+            continue
+        prompt_file = section.get("prompt_file")
+        if prompt_file:
+            with open(prompt_file, "r", encoding="utf-8") as f:
+                section["prompt"] = f.read()
+    return manifest
+
+def resolve_inputs(manifest):
+    input_dir = manifest["input_dir"]
+    files = set()
+    for pattern in manifest["inputs"]:
+        for path in glob.glob(os.path.join(input_dir, pattern)):
+            if os.path.isfile(path):
+                files.add(os.path.basename(path))
+    return input_store.canonical_inputs(input_dir, files)
+
+def load_ledger():
+    if os.path.exists(LEDGER_PATH):
+        with open(LEDGER_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+def save_ledger(ledger):
+    os.makedirs(os.path.dirname(LEDGER_PATH), exist_ok=True)
+    tmp_path = LEDGER_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(ledger, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, LEDGER_PATH)
+
+def generate_settings(manifest):
+    section = manifest["generate"]
+    return {
+        "output_dir": section.get("output_dir", batch_generate_3d.OUTPUT_DIR),
+        "models": list(dict.fromkeys(section.get("models", batch_generate_3d.MODELS))),
+        "prompt": section.get("prompt", batch_generate_3d.PROMPT),
+        "prompt_version": section.get("prompt_version", ""),
+        "concurrency": section.get("concurrency", batch_generate_3d.MAX_WORKERS),
+        "max_image_size": section.get("max_image_size", batch_generate_3d.MAX_IMAGE_SIZE),
+        "jpeg_quality": section.get("jpeg_quality", batch_generate_3d.JPEG_QUALITY),
+        "max_upload_bytes": section.get("max_upload_bytes", batch_generate_3d.MAX_UPLOAD_BYTES)
+    }
+
+def evaluate_settings(manifest):
+    section = manifest["evaluate"]
+    generated_dir = evaluate_models.GENERATED_DIR
+    if "generate" in manifest:
+        generated_dir = generate_settings(manifest)["output_dir"]
+    return {
+        "output_dir": section.get("output_dir", evaluate_models.EVAL_OUTPUT_DIR),
+        "generated_dir": section.get("generated_dir", generated_dir),
+        "evaluators": list(dict.fromkeys(section.get("evaluators", evaluate_models.EVALUATOR_MODELS))),
+        "prompt": section.get("prompt", evaluate_models.EVAL_PROMPT),
+        "prompt_version": section.get("prompt_version", ""),
+        "concurrency": section.get("concurrency", evaluate_models.MAX_WORKERS),
+        "max_image_size": section.get("max_image_size", evaluate_models.MAX_IMAGE_SIZE),
+        "jpeg_quality": section.get("jpeg_quality", evaluate_models.JPEG_QUALITY),
+        "max_upload_bytes": section.get("max_upload_bytes", evaluate_models.MAX_UPLOAD_BYTES),
+        # Explicit encoding pins every evaluator; otherwise tuned profiles apply
+        "encoding_profiles": "max_image_size" not in section and "jpeg_quality" not in section
+    }
+
+def prompt_version(settings):
+    # Bumping prompt_version reruns cells whose prompt text is unchanged (e.g.
+    # a new rubric interpretation); unset, keys match those planned without it
+    return [{"prompt_version": settings["prompt_version"]}] if settings["prompt_version"] else []
+
+def upload_cap(settings):
+    # Extra key part only when a byte cap is set, so cells planned before caps existed still match
+    return [settings["max_upload_bytes"]] if settings["max_upload_bytes"] is not None else []
+
+def plan_generate(manifest):
+    settings = generate_settings(manifest)
+    prompt_hash = text_sha256(settings["prompt"])
+    cells = {}
+    for filename in resolve_inputs(manifest):
+        input_hash = file_sha256(os.path.join(manifest["input_dir"], filename))
+        for model in settings["models"]:
+            key = cell_key("generate", input_hash, model, prompt_hash,
+                           settings["max_image_size"], settings["jpeg_quality"], *upload_cap(settings),
+                           *prompt_version(settings))
+            output_path = os.path.join(settings["output_dir"], batch_generate_3d.output_filename_for(filename, model))
+            if key in cells:
+                # Same content under another name (e.g. a .png and .webp copy): run once, copy after
+                cells[key]["aliases"].append(output_path)
+                continue
+            cells[key] = {"stage": "generate", "args": (filename, model), "output": output_path, "aliases": []}
+    return settings, cells
+
+def plan_evaluate(manifest):
+    settings = evaluate_settings(manifest)
+    prompt_hash = text_sha256(settings["prompt"])
+    cells = {}
+    inputs = resolve_inputs(manifest)
+    if not os.path.isdir(settings["generated_dir"]):
+        return settings, cells
+
+    for gen_file in sorted(os.listdir(settings["generated_dir"])):
+        if not gen_file.lower().endswith(".png"):
+            continue
+        for inp_file in inputs:
+            inp_name = os.path.splitext(inp_file)[0]
+            if not gen_file.startswith(inp_name + "_"):
+                continue
+            gen_model_name = os.path.splitext(gen_file)[0][len(inp_name) + 1:]
+            gen_path = os.path.join(settings["generated_dir"], gen_file)
+            input_hash = file_sha256(os.path.join(manifest["input_dir"], inp_file))
+            for evaluator in settings["evaluators"]:
+                max_size, quality = settings["max_image_size"], settings["jpeg_quality"]
+                if settings["encoding_profiles"]:
+                    max_size, quality = evaluate_models.encoding_for(evaluator)
+                key = cell_key("evaluate", input_hash, file_sha256(gen_path), evaluator, prompt_hash, max_size, quality,
+                               *upload_cap(settings), *prompt_version(settings))
+                output_path = os.path.join(settings["output_dir"], gen_model_name,
+                                           os.path.basename(evaluate_models.eval_output_path(inp_file, evaluator, gen_model_name)))
+                if key in cells:
+                    cells[key]["aliases"].append(output_path)
+                    continue
+                cells[key] = {"stage": "evaluate", "args": (inp_file, gen_path, evaluator, gen_model_name, None),
+                              "output": output_path, "aliases": []}
+            break
+    return settings, cells
+
+def apply_generate_settings(manifest, settings):
+    batch_generate_3d.INPUT_DIR = manifest["input_dir"]
+    batch_generate_3d.OUTPUT_DIR = settings["output_dir"]
+    batch_generate_3d.PROMPT = settings["prompt"]
+    batch_generate_3d.MAX_WORKERS = settings["concurrency"]
+    batch_generate_3d.MAX_IMAGE_SIZE = settings["max_image_size"]
+    batch_generate_3d.JPEG_QUALITY = settings["jpeg_quality"]
+    batch_generate_3d.MAX_UPLOAD_BYTES = settings["max_upload_bytes"]
+
+def apply_evaluate_settings(manifest, settings):
+    evaluate_models.INPUT_DIR = manifest["input_dir"]
+    evaluate_models.GENERATED_DIR = settings["generated_dir"]
+    evaluate_models.EVAL_OUTPUT_DIR = settings["output_dir"]
+    evaluate_models.EVAL_PROMPT = settings["prompt"]
+    evaluate_models.MAX_WORKERS = settings["concurrency"]
+    evaluate_models.MAX_IMAGE_SIZE = settings["max_image_size"]
+    evaluate_models.JPEG_QUALITY = settings["jpeg_quality"]
+    evaluate_models.MAX_UPLOAD_BYTES = settings["max_upload_bytes"]
+    if not settings["encoding_profiles"]:
+        evaluate_models.ENCODING_PROFILES_PATH = None
+
+def ledger_paths(entry):
+    # Every path known to hold the output of a ledger entry
+    return [entry["output"]] + entry.get("copies", []) if entry else []
+
+def record_cell(ledger, key, path, run, stage):
+    entry = ledger.setdefault(key, {"output": path, "run": run, "stage": stage})
+    if path not in ledger_paths(entry):
+        entry.setdefault("copies", []).append(path)
+
+def is_current(ledger, key, path, cell):
+    # An existing file only counts if it was produced for this key; one left at
+    # the same path by another prompt, input or encoding is stale
+    if not os.path.exists(path):
+        return False
+    if path in ledger_paths(ledger.get(key)):
+        return True
+    if cell["stage"] == "generate":
+        # Outputs of plain generate runs are links to the cache object of their key
+        filename, model = cell["args"]
+        file_path = os.path.join(batch_generate_3d.INPUT_DIR, filename)
+        return generation_cache.is_alias(path, batch_generate_3d.generation_key(file_path, model))
+    return False
+
+def reuse_source(ledger, key):
+    return next((p for p in ledger_paths(ledger.get(key)) if os.path.exists(p)), None)
+
+def classify_cells(cells, ledger):
+    # Split cells into present for their key, reusable from an earlier run, and
+    # to run; stale lists those whose path holds another key's output
+    present, reusable, pending, stale = [], [], [], []
+    for key, cell in cells.items():
+        if is_current(ledger, key, cell["output"], cell):
+            present.append(key)
+            continue
+        if os.path.exists(cell["output"]):
+            stale.append(key)
+        (reusable if reuse_source(ledger, key) else pending).append(key)
+    return present, reusable, pending, stale
+
+def reuse_cells(cells, ledger):
+    # Removes stale outputs (the workers skip existing files) and copies the
+    # reusable cells in; returns (present, reused, pending, stale)
+    present, reused, pending, stale = classify_cells(cells, ledger)
+    for key in stale:
+        os.remove(cells[key]["output"])
+    for key in reused:
+        os.makedirs(os.path.dirname(cells[key]["output"]), exist_ok=True)
+        shutil.copy2(reuse_source(ledger, key), cells[key]["output"])
+    return present, reused, pending, stale
+
+def fill_aliases(cells, ledger, run):
+    for key, cell in cells.items():
+        if not is_current(ledger, key, cell["output"], cell):
+            continue
+        for alias in cell["aliases"]:
+            if not is_current(ledger, key, alias, cell):
+                if os.path.lexists(alias):
+                    os.remove(alias)
+                os.makedirs(os.path.dirname(alias), exist_ok=True)
+                shutil.copy2(cell["output"], alias)
+                record_cell(ledger, key, alias, run, cell["stage"])
+
+def section_limits(manifest, stage, defaults):
+    # [generate.model_concurrency] / [evaluate.model_concurrency] tables
+    limits = dict(defaults, **manifest[stage].get("model_concurrency", {}))
+    invalid = {model: limit for model, limit in limits.items() if not isinstance(limit, int) or limit < 1}
+    if invalid:
+        print(f"❌ Error: [{stage}.model_concurrency] limits must be at least 1: {invalid}")
+        sys.exit(1)
+    return limits
+
+def run_stage(manifest, stage, dry_run, ledger):
+    if stage == "generate":
+        settings, cells = plan_generate(manifest)
+        apply_generate_settings(manifest, settings)
+        worker = batch_generate_3d.process_file_model
+        model_index = 1
+        model_limits = section_limits(manifest, stage, batch_generate_3d.MODEL_CONCURRENCY)
+    else:
+        settings, cells = plan_evaluate(manifest)
+        apply_evaluate_settings(manifest, settings)
+        worker = evaluate_models.process_evaluation
+        model_index = 2
+        model_limits = section_limits(manifest, stage, evaluate_models.MODEL_CONCURRENCY)
+
+    def model_of(task):
+        return cells[task[0]]["args"][model_index]
+    budget_usd = manifest[stage].get("budget_usd")
+
+    if dry_run:
+        present, reusable, pending, stale = classify_cells(cells, ledger)
+        print(f"📋 {stage}: {len(cells)} cells, {len(present)} present, "
+              f"{len(reusable)} reusable from earlier runs, {len(pending)} to run "
+              f"({len(stale)} existing outputs are stale)")
+        to_run = [(k,) for k in pending]
+        pricing.print_estimate(stage, to_run, model_of)
+        if budget_usd is not None:
+            pricing.fit_budget(stage, to_run, model_of, budget_usd)
+        return
+
+    os.makedirs(settings["output_dir"], exist_ok=True)
+    present, reused, pending, stale = reuse_cells(cells, ledger)
+    for key in reused:
+        record_cell(ledger, key, cells[key]["output"], manifest["name"], stage)
+    print(f"📋 {stage}: {len(cells)} cells, {len(present)} present, {len(reused)} reused, {len(pending)} to run")
+    if stale:
+        print(f"🔄 {len(stale)} outputs were made with another prompt, input or encoding and are redone")
+
+    if pending and stage == "generate" and not batch_generate_3d.API_KEY:
+        print("❌ Error: API key not set.")
+        sys.exit(1)
+
+    successful = 0
+    failed = 0
+    tasks = [(key,) for key in pending]
+    pricing.print_estimate(stage, tasks, model_of)
+    run_cell = lambda key: worker(*cells[key]["args"])
+    if budget_usd is not None:
+        tasks, _ = pricing.fit_budget(stage, tasks, model_of, budget_usd)
+        pricing.budget = pricing.Budget(budget_usd)
+        run_cell = pricing.budgeted(run_cell, stage, model_of, lambda task: True)
+
+    results = scheduler.run_scheduled(tasks, run_cell,
+                                      settings["concurrency"], model_of=model_of,
+                                      predict=lambda t: scheduler.predict_latency(stage, model_of(t)),
+                                      model_limits=model_limits)
+    for (key,), success in results:
+        if success and os.path.exists(cells[key]["output"]):
+            record_cell(ledger, key, cells[key]["output"], manifest["name"], stage)
+            successful += 1
+        else:
+            failed += 1
+
+    fill_aliases(cells, ledger, manifest["name"])
+    save_ledger(ledger)
+    print(f"✅ {stage}: {successful} succeeded, ❌ {failed} failed")
+    if pricing.budget:
+        pricing.budget.report()
+        pricing.budget = None
+
+def run(manifest_paths, dry_run=False):
+    ledger = load_ledger()
+    with scheduler.graceful_shutdown():
+        for path in manifest_paths:
+            if scheduler.stop_requested():
+                break
+            manifest = load_manifest(path)
+            print(f"\n🚀 Run '{manifest['name']}' ({path})")
+            if not dry_run:
+                tracing.start_run(manifest["name"])
+            for stage in ("generate", "evaluate"):
+                if stage in manifest and not scheduler.stop_requested():
+                    run_stage(manifest, stage, dry_run, ledger)
+            if not dry_run:
+                tracing.summarize(tracing.trace_path())
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python run_manifest.py [--dry-run] runs/<name>.toml [...]")
+        sys.exit(1)
+    args = sys.argv[1:]
+    dry_run = "--dry-run" in args
+    run([a for a in args if a != "--dry-run"], dry_run=dry_run)
+
+if __name__ == "__main__":
+    main()
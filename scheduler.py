@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import heapq
+import signal
+import threading
+from statistics import median
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import tracing
+
+# Per-call latencies measured by the pipeline scripts, one JSON object per line
+HISTORY_PATH = os.path.join(".cache", "latency_history.jsonl")
+
+# Only the most recent samples per model are used for predictions
+HISTORY_WINDOW = 50
+
+# Used for models that have never been timed
+DEFAULT_LATENCY = 60.0
+
+# Where an interrupted run_scheduled() records the tasks it had not finished,
+# so the next run of that stage starts with them (see graceful_shutdown)
+CHECKPOINT_DIR = os.path.join(".cache", "checkpoints")
+
+SHUTDOWN_SIGNALS = ("SIGINT", "SIGTERM")
+
+_lock = threading.Lock()
+_history = None
+
+_stop = threading.Event()
+_shutdown = {"depth": 0, "signals": 0, "handlers": {}, "on_abort": []}
+
+def _load_history():
+    global _history
+    if _history is None:
+        _history = {}
+        if os.path.exists(HISTORY_PATH):
+            with open(HISTORY_PATH, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if not record.get("ok", True):
+                        continue
+                    _history.setdefault((record["stage"], record["model"]), []).append(record["latency"])
+    return _history
+
+def record_latency(stage, model, latency, ok=True):
+    # Failures are logged but kept out of the samples: a burst of fast 429s
+    # would drag down the median and the p90 that triggers hedging
+    record = {"stage": stage, "model": model, "latency": round(latency, 3), "ok": ok, "ts": time.time()}
+    with _lock:
+        if ok:
+            _load_history().setdefault((stage, model), []).append(record["latency"])
+        os.makedirs(os.path.dirname(HISTORY_PATH), exist_ok=True)
+        with open(HISTORY_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+def latency_samples(stage, model):
+    with _lock:
+        return list(_load_history().get((stage, model), [])[-HISTORY_WINDOW:])
+
+def predict_latency(stage, model):
+    samples = latency_samples(stage, model)
+    if samples:
+        return median(samples)
+
+    # Unknown model: assume it behaves like a typical model of the same stage
+    with _lock:
+        stage_medians = [median(v[-HISTORY_WINDOW:]) for (s, _), v in _load_history().items() if s == stage and v]
+    return median(stage_medians) if stage_medians else DEFAULT_LATENCY
+
+def latency_percentile(stage, model, pct, min_samples=5):
+    # None until there are enough samples to say what "slow" means for this model
+    samples = sorted(latency_samples(stage, model))
+    if len(samples) < min_samples:
+        return None
+    return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+def simulate_makespan(durations, max_workers, model_limits):
+    # Greedy list scheduling in queue order, honouring per-model concurrency
+    # limits: returns the predicted wall time for the whole queue.
+    queue = list(durations)
+    running = []  # heap of (finish_time, model)
+    in_flight = {}
+    now = 0.0
+    while queue or running:
+        free = max_workers - len(running)
+        i = 0
+        while free > 0 and i < len(queue):
+            model, duration = queue[i]
+            limit = model_limits.get(model)
+            if limit is None or in_flight.get(model, 0) < limit:
+                heapq.heappush(running, (now + duration, model))
+                in_flight[model] = in_flight.get(model, 0) + 1
+                queue.pop(i)
+                free -= 1
+            else:
+                i += 1
+        if not running:
+            break
+        now, model = heapq.heappop(running)
+        in_flight[model] -= 1
+    return now
+
+def stop_requested():
+    return _stop.is_set()
+
+# Called before a second signal exits the process, e.g. to save a checkpoint
+# or close a browser that would otherwise outlive it
+def add_abort_hook(hook):
+    _shutdown["on_abort"].append(hook)
+
+def remove_abort_hook(hook):
+    _shutdown["on_abort"].remove(hook)
+
+def _on_signal(signum, frame):
+    _shutdown["signals"] += 1
+    if _shutdown["signals"] == 1:
+        _stop.set()
+        print("\n🛑 Stopping: no new tasks, waiting for requests in flight (signal again to abort them)", flush=True)
+        return
+    # Every output is written to a temp file and renamed, so abandoning the
+    # worker threads mid-request loses only their requests, never a file
+    print("\n💥 Aborting", flush=True)
+    for hook in list(_shutdown["on_abort"]):
+        try:
+            hook()
+        except Exception as e:
+            print(f"⚠️ Abort hook failed: {e}", flush=True)
+    os._exit(130)
+
+@contextmanager
+def graceful_shutdown():
+    # While active, the first SIGINT/SIGTERM only sets stop_requested() and a
+    # second one exits at once. Nests; signal handlers can only be installed
+    # from the main thread, elsewhere this just tracks the flag.
+    outermost = _shutdown["depth"] == 0
+    if outermost:
+        _stop.clear()
+        _shutdown["signals"] = 0
+        if threading.current_thread() is threading.main_thread():
+            for name in SHUTDOWN_SIGNALS:
+                if hasattr(signal, name):
+                    _shutdown["handlers"][name] = signal.signal(getattr(signal, name), _on_signal)
+    _shutdown["depth"] += 1
+    try:
+        yield
+    finally:
+        _shutdown["depth"] -= 1
+        if outermost:
+            for name, handler in _shutdown["handlers"].items():
+                signal.signal(getattr(signal, name), handler)
+            _shutdown["handlers"].clear()
+
+def checkpoint_path(name):
+    return os.path.join(CHECKPOINT_DIR, f"{name}.json")
+
+def load_checkpoint(name):
+    path = checkpoint_path(name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except Exception as e:
+        print(f"⚠️ Checkpoint {path} unreadable, ignoring it: {e}")
+        return None
+    checkpoint["tasks"] = [tuple(t) for t in checkpoint["tasks"]]
+    return checkpoint
+
+def save_checkpoint(name, in_flight, not_started, finished):
+    # In-flight tasks first: they were the furthest along when the run stopped
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = checkpoint_path(name)
+    checkpoint = {"stopped": time.time(), "finished": finished, "in_flight": len(in_flight),
+                  "tasks": [list(t) for t in list(in_flight) + list(not_started)]}
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+def clear_checkpoint(name):
+    if os.path.exists(checkpoint_path(name)):
+        os.remove(checkpoint_path(name))
+
+def format_duration(seconds):
+    return f"{seconds:.1f}s" if seconds < 120 else f"{seconds / 60:.1f} min"
+
+def run_scheduled(tasks, worker, max_workers, model_of, predict, model_limits=None, checkpoint=None):
+    # Runs worker(*task) for every task, longest predicted first (LPT), never
+    # exceeding model_limits[model] concurrent calls for a model. Yields
+    # (task, result) as tasks finish. After a stop signal nothing new starts;
+    # with a checkpoint name the unfinished tasks are saved and go first in
+    # the next run of that name.
+    model_limits = model_limits or {}
+    queue = sorted(tasks, key=predict, reverse=True)
+    resumed = load_checkpoint(checkpoint) if checkpoint else None
+    if resumed:
+        order = {task: i for i, task in enumerate(resumed["tasks"])}
+        queue.sort(key=lambda t: order.get(t, len(order)))
+        left = sum(1 for t in queue if t in order)
+        print(f"↩️ Resuming the run stopped at {time.strftime('%H:%M', time.localtime(resumed['stopped']))}: "
+              f"its {left} unfinished tasks go first")
+
+    predicted = simulate_makespan([(model_of(t), predict(t)) for t in queue], max_workers, model_limits)
+    start_time = time.time()
+    print(f"🗓️ Scheduled {len(queue)} tasks longest-first, predicted makespan {format_duration(predicted)} "
+          f"(done ~{time.strftime('%H:%M', time.localtime(start_time + predicted))})")
+
+    in_flight = {}
+    futures = {}
+    finished = [0]
+
+    def save():
+        save_checkpoint(checkpoint, futures.values(), queue, finished[0])
+
+    if checkpoint:
+        add_abort_hook(save)
+    try:
+        with graceful_shutdown(), ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while (queue and not stop_requested()) or futures:
+                i = 0
+                while len(futures) < max_workers and i < len(queue) and not stop_requested():
+                    model = model_of(queue[i])
+                    limit = model_limits.get(model)
+                    if limit is None or in_flight.get(model, 0) < limit:
+                        task = queue.pop(i)
+                        tracing.record_span("queue_wait", start_time, time.time() - start_time, model=model)
+                        futures[executor.submit(worker, *task)] = task
+                        in_flight[model] = in_flight.get(model, 0) + 1
+                    else:
+                        i += 1
+                if not futures:
+                    if not stop_requested():
+                        # Only tasks of models whose limit is below 1 are left
+                        blocked = sorted({str(model_of(t)) for t in queue})
+                        print(f"❌ {len(queue)} tasks can never start: concurrency limit below 1 for {', '.join(blocked)}")
+                    break
+
+                done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = futures.pop(future)
+                    in_flight[model_of(task)] -= 1
+                    finished[0] += 1
+                    yield task, future.result()
+    finally:
+        if checkpoint:
+            remove_abort_hook(save)
+    if checkpoint:
+        if queue:
+            save()
+            print(f"💾 {len(queue)} tasks not started, saved to {checkpoint_path(checkpoint)}; run again to resume")
+        else:
+            clear_checkpoint(checkpoint)
+    if queue:
+        return
+    actual = time.time() - start_time
+    print(f"🗓️ Makespan: predicted {format_duration(predicted)}, actual {format_duration(actual)}")
@@ -1,10 +1,10 @@
 import os
 import requests
-import json
 import base64
 import time
 import sys
 import re
+import response_archive
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Configuration
@@ -13,6 +13,9 @@ API_KEY = "YOUR_OPENROUTER_API_KEY_HERE"
 if API_KEY == "YOUR_OPENROUTER_API_KEY_HERE":
     API_KEY = os.environ.get("OPENROUTER_API_KEY")
 
+# Same endpoint override as batch_generate_3d.py (OPENROUTER_API_URL)
+API_URL = os.environ.get("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+
 INPUT_IMAGE_PATH = os.path.join("input", "floor_plan.jpg")
 OUTPUT_DIR = "generation_outputs_images_isometric_2"
 
@@ -130,7 +133,7 @@ def test_single_model(model, image_base64):
     
     start_time = time.time()
     try:
-        response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data, timeout=60)
+        response = requests.post(API_URL, headers=headers, json=data, timeout=60)
         latency = time.time() - start_time
         
         if response.status_code == 200:
@@ -143,8 +146,8 @@ def test_single_model(model, image_base64):
             model_output_dir = os.path.join(OUTPUT_DIR, sanitized_model_name)
             os.makedirs(model_output_dir, exist_ok=True)
             
-            with open(os.path.join(model_output_dir, "full_response.txt"), "w", encoding='utf-8') as f:
-                f.write(json.dumps(result, indent=2))
+            # Raw response (image payload as a blob): python response_archive.py
+            response_archive.archive_response("test", model, result, subject=sanitized_model_name, latency=latency)
                 
             if 'choices' in result and len(result['choices']) > 0:
                 choice = result['choices'][0]['message']
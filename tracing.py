@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import uuid
+import threading
+from statistics import quantiles
+from contextlib import contextmanager, ExitStack
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Span-based tracing for every pipeline stage. Spans are appended as JSON lines
+# to traces/<run>.jsonl (convertible to OTLP/JSON with export_otlp), and every
+# span duration also feeds an in-process histogram that can be scraped in
+# Prometheus text format while a long run is going.
+TRACE_DIR = "traces"
+
+# Prometheus histogram buckets, in seconds
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_lock = threading.Lock()
+_local = threading.local()
+_run = {"id": None, "trace_id": None, "file": None, "path": None}
+_histograms = {}  # (span name, model) -> [bucket counts..., +Inf count, sum]
+_counters = {}  # (metric, labels tuple) -> value
+
+# Context-manager factories called as hook(name, attrs) around every span, so
+# tools like profiling.py can attach to pipeline stages without editing them
+_span_hooks = []
+
+def add_span_hook(hook):
+    _span_hooks.append(hook)
+
+def remove_span_hook(hook):
+    _span_hooks.remove(hook)
+
+def _open_run(name):
+    if _run["file"]:
+        _run["file"].close()
+    _run["id"] = f"{time.strftime('%Y%m%d-%H%M%S')}_{name}"
+    _run["trace_id"] = uuid.uuid4().hex
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    _run["path"] = os.path.join(TRACE_DIR, f"{_run['id']}.jsonl")
+    _run["file"] = open(_run["path"], "a", encoding="utf-8")
+
+def start_run(name):
+    with _lock:
+        _open_run(name)
+    return _run["path"]
+
+def trace_path():
+    return _run["path"]
+
+def _write(record):
+    with _lock:
+        if _run["file"] is None:
+            # Scripts imported without a start_run() still get a trace file
+            _open_run("adhoc")
+        record["trace_id"] = _run["trace_id"]
+        _run["file"].write(json.dumps(record) + "\n")
+        _run["file"].flush()
+        _observe(record)
+
+def _observe(record):
+    key = (record["name"], record["attrs"].get("model", ""))
+    histogram = _histograms.setdefault(key, [0] * (len(LATENCY_BUCKETS) + 2))
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if record["duration"] <= bound:
+            histogram[i] += 1
+    histogram[len(LATENCY_BUCKETS)] += 1
+    histogram[-1] += record["duration"]
+    status_key = ("pipeline_spans_total", (("span", record["name"]), ("status", record["status"])))
+    _counters[status_key] = _counters.get(status_key, 0) + 1
+
+def count(metric, value=1, **labels):
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def record_span(name, start, duration, status="ok", **attrs):
+    # For phases measured indirectly, e.g. server vs download time of one request
+    stack = getattr(_local, "stack", [])
+    _write({
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": stack[-1] if stack else None,
+        "name": name,
+        "start": start,
+        "duration": duration,
+        "status": status,
+        "attrs": attrs
+    })
+
+def record_http(stage, model, response, start_time, latency):
+    # Splits a finished request into upload + server time (until the response
+    # headers arrived, response.elapsed) and body download time
+    body = getattr(response.request, "body", None) or b""
+    server_time = min(response.elapsed.total_seconds(), latency)
+    record_span(f"{stage}.server", start_time, server_time, model=model,
+                upload_bytes=len(body), status_code=response.status_code)
+    record_span(f"{stage}.download", start_time + server_time, latency - server_time, model=model,
+                download_bytes=len(response.content))
+    count("pipeline_upload_bytes_total", len(body), stage=stage, model=model)
+    count("pipeline_download_bytes_total", len(response.content), stage=stage, model=model)
+    count("pipeline_requests_total", stage=stage, model=model, code=response.status_code)
+
+@contextmanager
+def span(name, **attrs):
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    span_id = uuid.uuid4().hex[:16]
+    parent_id = _local.stack[-1] if _local.stack else None
+    _local.stack.append(span_id)
+    start = time.time()
+    record = {"span_id": span_id, "parent_id": parent_id, "name": name, "start": start,
+              "status": "ok", "attrs": attrs}
+    try:
+        with ExitStack() as hooks:
+            for hook in list(_span_hooks):
+                hooks.enter_context(hook(name, attrs))
+            yield record["attrs"]
+    except BaseException as e:
+        record["status"] = "error"
+        record["attrs"]["error"] = repr(e)
+        raise
+    finally:
+        _local.stack.pop()
+        record["duration"] = time.time() - start
+        _write(record)
+
+def metrics_text():
+    lines = ["# TYPE pipeline_span_seconds histogram"]
+    with _lock:
+        for (name, model), histogram in sorted(_histograms.items()):
+            labels = f'span="{name}",model="{model}"'
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                lines.append(f'pipeline_span_seconds_bucket{{{labels},le="{bound}"}} {histogram[i]}')
+            lines.append(f'pipeline_span_seconds_bucket{{{labels},le="+Inf"}} {histogram[len(LATENCY_BUCKETS)]}')
+            lines.append(f'pipeline_span_seconds_count{{{labels}}} {histogram[len(LATENCY_BUCKETS)]}')
+            lines.append(f'pipeline_span_seconds_sum{{{labels}}} {histogram[-1]:.6f}')
+        for metric in sorted({m for m, _ in _counters}):
+            lines.append(f"# TYPE {metric} counter")
+            for (m, labels), value in sorted(_counters.items()):
+                if m == metric:
+                    label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f"{metric}{{{label_text}}} {value}")
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port):
+    httpd = ThreadingHTTPServer(('', port), MetricsHandler)
+    threading.Thread(name="metrics_server", target=httpd.serve_forever, daemon=True).start()
+    print(f"📈 Metrics at http://localhost:{port}/metrics")
+    return httpd
+
+def load_spans(path):
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return spans
+
+def percentiles(values):
+    if len(values) < 2:
+        value = values[0] if values else 0.0
+        return value, value, value
+    cuts = quantiles(values, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+def summarize(path):
+    spans = load_spans(path)
+    if not spans:
+        print(f"No spans in {path}")
+        return
+
+    groups = {}
+    for s in spans:
+        groups.setdefault((s["name"], s["attrs"].get("model", "")), []).append(s)
+
+    wall = max(s["start"] + s["duration"] for s in spans) - min(s["start"] for s in spans)
+    print(f"\n📊 Trace summary: {path} ({len(spans)} spans, {wall:.1f}s wall)")
+    print(f"{'span':<18} {'model':<42} {'n':>5} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'total':>9} {'/min':>7}")
+    for (name, model), group in sorted(groups.items()):
+        durations = [s["duration"] for s in group]
+        errors = sum(1 for s in group if s["status"] != "ok")
+        p50, p95, p99 = percentiles(durations)
+        throughput = len(group) / wall * 60 if wall > 0 else 0.0
+        print(f"{name:<18} {model[:42]:<42} {len(group):>5} {errors:>4} {p50:>7.2f}s {p95:>7.2f}s {p99:>7.2f}s "
+              f"{sum(durations):>8.1f}s {throughput:>7.1f}")
+
+def export_otlp(path, out_path=None):
+    # OTLP/JSON (ExportTraceServiceRequest) for collectors / trace viewers
+    out_path = out_path or os.path.splitext(path)[0] + ".otlp.json"
+    otlp_spans = []
+    for s in load_spans(path):
+        otlp_spans.append({
+            "traceId": s["trace_id"],
+            "spanId": s["span_id"],
+            "parentSpanId": s["parent_id"] or "",
+            "name": s["name"],
+            "startTimeUnixNano": str(int(s["start"] * 1e9)),
+            "endTimeUnixNano": str(int((s["start"] + s["duration"]) * 1e9)),
+            "status": {"code": 1 if s["status"] == "ok" else 2},
+            "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in s["attrs"].items()]
+        })
+    payload = {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "floorbench"}}]},
+        "scopeSpans": [{"scope": {"name": "floorbench.tracing"}, "spans": otlp_spans}]
+    }]}
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    return out_path
@@ -0,0 +1,199 @@
+import os
+import re
+import json
+import hashlib
+import tree_sitter_javascript
+from tree_sitter import Language, Parser
+
+# Bump when the checks change so cached verdicts are recomputed
+VALIDATOR_VERSION = "2"
+
+CACHE_FILENAME = ".validation_cache.json"
+
+JS_LANGUAGE = Language(tree_sitter_javascript.language())
+
+# Addons the global template attaches to window.THREE
+GLOBAL_THREE_EXTRAS = {"OrbitControls"}
+
+INLINE_SCRIPT_RE = re.compile(r"<script(?![^>]*\bsrc=)([^>]*)>(.*?)</script>", re.IGNORECASE | re.DOTALL)
+SCRIPT_TYPE_RE = re.compile(r"\btype\s*=\s*[\"']?([^\"'\s>]*)", re.IGNORECASE)
+
+# <script type> values the browser runs as JavaScript. Everything else (import
+# maps, JSON, x-shader/x-vertex GLSL, templates) is data and is not parsed.
+JS_SCRIPT_TYPES = {"", "text/javascript", "application/javascript", "module"}
+
+_exports_cache = {}
+
+def load_three_exports(vendor_dir):
+    # Names exported by the vendored module build; None if it isn't vendored yet
+    if vendor_dir in _exports_cache:
+        return _exports_cache[vendor_dir]
+
+    module_path = os.path.join(vendor_dir, "build", "three.module.js")
+    names = None
+    if os.path.exists(module_path):
+        with open(module_path, "r", encoding="utf-8") as f:
+            source = f.read()
+        names = set()
+        for block in re.findall(r"export\s*\{([^}]*)\}", source):
+            for item in block.split(","):
+                item = item.strip()
+                if item:
+                    names.add(item.split(" as ")[-1].strip())
+    _exports_cache[vendor_dir] = names
+    return names
+
+def extract_scripts(html):
+    scripts = []
+    for attrs, body in INLINE_SCRIPT_RE.findall(html):
+        script_type = SCRIPT_TYPE_RE.search(attrs)
+        if script_type and script_type.group(1).strip().lower() not in JS_SCRIPT_TYPES:
+            continue
+        scripts.append(body)
+    return scripts
+
+def node_text(node, source):
+    return source[node.start_byte:node.end_byte].decode("utf-8", errors="replace")
+
+def walk(node):
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(reversed(current.children))
+
+def check_script(source_text, vendor_dir, vendor_url, three_exports, result):
+    source = source_text.encode("utf-8")
+    tree = Parser(JS_LANGUAGE).parse(source)
+    root = tree.root_node
+
+    if root.has_error:
+        for node in walk(root):
+            if node.type == "ERROR" or node.is_missing:
+                line, column = node.start_point
+                snippet = node_text(node, source).splitlines()[0][:80] if node.end_byte > node.start_byte else node.type
+                result["errors"].append(f"Syntax error at line {line + 1}, column {column + 1}: {snippet!r}")
+                if len(result["errors"]) >= 5:
+                    break
+
+    three_names = {"THREE"}
+    for node in walk(root):
+        if node.type == "import_statement":
+            source_node = node.child_by_field_name("source")
+            if source_node is None:
+                continue
+            specifier = node_text(source_node, source).strip("'\"`")
+            if not resolve_import(specifier, vendor_dir, vendor_url):
+                result["errors"].append(f"Unresolved import: {specifier}")
+            if specifier != "three":
+                continue
+            for child in walk(node):
+                if child.type == "namespace_import":
+                    for ident in child.children:
+                        if ident.type == "identifier":
+                            three_names.add(node_text(ident, source))
+                elif child.type == "import_specifier" and three_exports is not None:
+                    name = node_text(child.child_by_field_name("name"), source)
+                    if name not in three_exports:
+                        result["errors"].append(f"Unknown three export: {name}")
+
+        elif node.type == "call_expression":
+            function = node.child_by_field_name("function")
+            if function is None:
+                continue
+            if function.type == "member_expression":
+                prop = node_text(function.child_by_field_name("property"), source)
+                if prop == "render":
+                    result["checks"]["render_call"] = True
+                elif prop == "setAnimationLoop":
+                    result["checks"]["render_call"] = True
+                    result["checks"]["animation_loop"] = True
+                elif prop == "requestAnimationFrame":
+                    result["checks"]["animation_loop"] = True
+            elif node_text(function, source) == "requestAnimationFrame":
+                result["checks"]["animation_loop"] = True
+
+    if three_exports is None:
+        return
+
+    allowed = three_exports | GLOBAL_THREE_EXTRAS
+    for node in walk(root):
+        if node.type != "member_expression":
+            continue
+        obj = node.child_by_field_name("object")
+        prop = node.child_by_field_name("property")
+        if obj is None or prop is None or obj.type != "identifier":
+            continue
+        if node_text(obj, source) in three_names:
+            name = node_text(prop, source)
+            if name not in allowed:
+                result["errors"].append(f"Unknown three API: THREE.{name}")
+
+def resolve_import(specifier, vendor_dir, vendor_url):
+    if specifier == "three":
+        return True
+    if specifier.startswith("three/addons/"):
+        rel_path = specifier[len("three/addons/"):]
+        if not os.path.exists(os.path.join(vendor_dir, "build")):
+            return True  # can't check addons until three.js is vendored
+        return os.path.exists(os.path.join(vendor_dir, "examples", "jsm", *rel_path.split("/")))
+    if specifier.startswith(vendor_url + "/"):
+        rel_path = specifier[len(vendor_url) + 1:]
+        return os.path.exists(os.path.join(vendor_dir, *rel_path.split("/")))
+    return False
+
+def validate_code(code, vendor_dir, vendor_url):
+    result = {
+        "valid": True,
+        "errors": [],
+        "warnings": [],
+        "checks": {"render_call": False, "animation_loop": False}
+    }
+
+    three_exports = load_three_exports(vendor_dir)
+    if three_exports is None:
+        result["warnings"].append("three.js not vendored; THREE API names not checked")
+
+    if "<html" in code.lower() or "<!doctype" in code.lower():
+        scripts = extract_scripts(code)
+    else:
+        scripts = [code]
+
+    for script in scripts:
+        check_script(script, vendor_dir, vendor_url, three_exports, result)
+
+    if not result["checks"]["render_call"]:
+        result["errors"].append("No renderer.render() or setAnimationLoop() call")
+    if not result["checks"]["animation_loop"]:
+        result["warnings"].append("No animation loop (requestAnimationFrame/setAnimationLoop); scene renders once")
+
+    # De-duplicate while keeping order (the same unknown API is often used many times)
+    result["errors"] = list(dict.fromkeys(result["errors"]))
+    result["valid"] = not result["errors"]
+    return result
+
+def content_hash(code, vendor_dir):
+    digest = hashlib.sha256()
+    digest.update(f"{VALIDATOR_VERSION}:{vendor_dir}:{load_three_exports(vendor_dir) is not None}\n".encode("utf-8"))
+    digest.update(code.encode("utf-8"))
+    return digest.hexdigest()
+
+def load_cache(output_dir):
+    path = os.path.join(output_dir, CACHE_FILENAME)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable validation cache {path}: {e}")
+    return {}
+
+def save_cache(output_dir, cache):
+    with open(os.path.join(output_dir, CACHE_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=1)
+
+def validate_cached(code, vendor_dir, vendor_url, cache):
+    key = content_hash(code, vendor_dir)
+    if key not in cache:
+        cache[key] = validate_code(code, vendor_dir, vendor_url)
+    return cache[key]
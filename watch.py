@@ -0,0 +1,287 @@
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import tracing
+import scheduler
+import input_store
+
+# Long-running watch mode (`floorbench watch`): instead of re-running every
+# stage over every directory, react to the files that changed.
+#   input/<plan>                  -> ingest it, then generate it with every model
+#   batch_outputs/<plan>_<m>.png  -> evaluate it with every evaluator
+#   evaluation_outputs3/**.json   -> rebuild dashboard_data.js (coalesced)
+# The pipeline's own results feed the next step the same way, so a new plan
+# flows through to the dashboard without another command. Filesystem events
+# come from the watchdog package (inotify, FSEvents, ReadDirectoryChangesW)
+# when it is installed, otherwise from polling the three trees. A file is only
+# acted on once it has had no events for DEBOUNCE_SECONDS, so half-written
+# files and bursts of saves collapse into one task.
+#   python watch.py               # react to changes from now on
+#   python watch.py --catch-up    # first queue whatever is pending already
+DEBOUNCE_SECONDS = 2.0
+
+# Rescan interval without watchdog
+POLL_INTERVAL = 1.0
+
+# How often the loop wakes to check debounced files and finished tasks
+TICK_SECONDS = 0.25
+
+# Tasks in flight across all stages; None for the larger of the generate and
+# evaluate MAX_WORKERS. Per-model caps (MODEL_CONCURRENCY) apply as usual.
+MAX_WORKERS = None
+
+# watchdog event types that mean the file's content may have changed
+CHANGE_EVENTS = ("created", "modified", "moved", "closed")
+
+class PollingObserver(threading.Thread):
+    # Size/mtime snapshots of the watched trees, diffed every POLL_INTERVAL
+    def __init__(self, directories, events):
+        super().__init__(name="watch_poller", daemon=True)
+        self.directories = directories
+        self.events = events
+        self.stopped = threading.Event()
+        self.state = self.snapshot()
+
+    def snapshot(self):
+        state = {}
+        for directory in self.directories:
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    state[path] = (stat.st_size, stat.st_mtime_ns)
+        return state
+
+    def run(self):
+        while not self.stopped.wait(POLL_INTERVAL):
+            state = self.snapshot()
+            for path, signature in state.items():
+                if self.state.get(path) != signature:
+                    self.events.put(path)
+            self.state = state
+
+    def stop(self):
+        self.stopped.set()
+
+def start_observer(directories, events):
+    # watchdog observer feeding changed paths into events, or the polling fallback
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        observer = PollingObserver(directories, events)
+        observer.start()
+        print(f"👀 Polling {', '.join(directories)} every {POLL_INTERVAL}s (pip install watchdog for filesystem events)")
+        return observer
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.is_directory or event.event_type not in CHANGE_EVENTS:
+                return
+            events.put(getattr(event, "dest_path", "") or event.src_path)
+
+    observer = Observer()
+    for directory in directories:
+        observer.schedule(Handler(), directory, recursive=True)
+    observer.start()
+    print(f"👀 Watching {', '.join(directories)}")
+    return observer
+
+class Watcher:
+    def __init__(self, max_workers=MAX_WORKERS, debounce=DEBOUNCE_SECONDS):
+        import batch_generate_3d
+        import evaluate_models
+        import aggregate_data
+        self.generate = batch_generate_3d
+        self.evaluate = evaluate_models
+        self.aggregate = aggregate_data
+        self.max_workers = max_workers or max(batch_generate_3d.MAX_WORKERS, evaluate_models.MAX_WORKERS)
+        self.debounce = debounce
+        self.directories = [batch_generate_3d.INPUT_DIR, batch_generate_3d.OUTPUT_DIR, evaluate_models.EVAL_OUTPUT_DIR]
+        self.events = queue.Queue()
+        self.settling = {}  # path -> time of its latest event
+        self.pending = []  # (stage, task) in arrival order
+        self.scheduled = set()  # pending or running (stage, task)
+        self.futures = {}
+        self.in_flight = {}  # (stage, model) -> running tasks
+        self.aggregate_due = False
+        self.counts = {}  # (stage, ok) -> tasks
+
+    def model_of(self, stage, task):
+        if stage == "generate":
+            return task[1]
+        if stage == "evaluate":
+            return task[2]
+        return None
+
+    def worker(self, stage):
+        return {"ingest": input_store.ingest_file,
+                "generate": self.generate.process_file_model,
+                "evaluate": self.evaluate.process_evaluation}[stage]
+
+    def model_limit(self, stage, model):
+        module = {"generate": self.generate, "evaluate": self.evaluate}.get(stage)
+        return module.MODEL_CONCURRENCY.get(model) if module else None
+
+    def schedule(self, stage, task):
+        if (stage, task) not in self.scheduled:
+            self.scheduled.add((stage, task))
+            self.pending.append((stage, task))
+
+    def _under(self, path, directory):
+        return os.path.abspath(path).startswith(os.path.abspath(directory) + os.sep)
+
+    def changed(self, path):
+        # Schedules whatever depends on a settled file
+        name = os.path.basename(path)
+        if not os.path.isfile(path) or name.endswith(".tmp"):
+            return
+        if os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.generate.INPUT_DIR):
+            if name.lower().endswith(input_store.INPUT_EXTENSIONS) \
+                    and name in input_store.canonical_inputs(self.generate.INPUT_DIR):
+                self.schedule("ingest", path)
+        elif os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.generate.OUTPUT_DIR):
+            if name.lower().endswith(".png"):
+                for task in self.evaluation_tasks(name):
+                    self.schedule("evaluate", task)
+        elif self._under(path, self.evaluate.EVAL_OUTPUT_DIR) and name.endswith(".json"):
+            self.aggregate_due = True
+
+    def evaluation_tasks(self, generated_filename):
+        import image_dedup
+        inputs = {os.path.splitext(f)[0]: f for f in input_store.canonical_inputs(self.evaluate.INPUT_DIR)}
+        plan, generated_model = image_dedup.split_output_name(generated_filename, inputs)
+        if plan is None:
+            return []
+        generated_path = os.path.join(self.evaluate.GENERATED_DIR, generated_filename)
+        tasks = [(inputs[plan], generated_path, evaluator, generated_model, None)
+                 for evaluator in self.evaluate.EVALUATOR_MODELS]
+        return [t for t in tasks if self.evaluate.is_pending(t)]
+
+    def catch_up(self):
+        # Everything already pending, as if every file had just changed
+        for directory in self.directories:
+            for root, _, files in os.walk(directory):
+                for name in sorted(files):
+                    self.changed(os.path.join(root, name))
+        self.aggregate_due = True
+
+    def collect_events(self):
+        try:
+            path = self.events.get(timeout=TICK_SECONDS)
+        except queue.Empty:
+            path = None
+        now = time.time()
+        while path is not None:
+            self.settling[path] = now
+            try:
+                path = self.events.get_nowait()
+            except queue.Empty:
+                path = None
+        for path, last in list(self.settling.items()):
+            if now - last >= self.debounce:
+                del self.settling[path]
+                self.changed(path)
+
+    def submit(self, executor):
+        i = 0
+        while len(self.futures) < self.max_workers and i < len(self.pending):
+            stage, task = self.pending[i]
+            model = self.model_of(stage, task)
+            limit = self.model_limit(stage, model)
+            if limit is not None and self.in_flight.get((stage, model), 0) >= limit:
+                i += 1
+                continue
+            del self.pending[i]
+            self.in_flight[(stage, model)] = self.in_flight.get((stage, model), 0) + 1
+            args = task if isinstance(task, tuple) else (task,)
+            self.futures[executor.submit(self.worker(stage), *args)] = (stage, task)
+
+    def finish(self):
+        if not self.futures:
+            return
+        done, _ = wait(list(self.futures), timeout=0, return_when=FIRST_COMPLETED)
+        for future in done:
+            stage, task = self.futures.pop(future)
+            self.scheduled.discard((stage, task))
+            self.in_flight[(stage, self.model_of(stage, task))] -= 1
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"❌ {stage} {task} raised: {e}")
+                result = None
+            ok = bool(result)
+            self.counts[(stage, ok)] = self.counts.get((stage, ok), 0) + 1
+            if stage == "ingest" and ok:
+                # The plan's pixels are in the store now; generate it with every model
+                filename = os.path.basename(task)
+                for model in self.generate.MODELS:
+                    self.schedule("generate", (filename, model))
+
+    def refresh_dashboard(self):
+        if not self.aggregate_due:
+            return
+        self.aggregate_due = False
+        try:
+            self.aggregate.refresh()
+        except Exception as e:
+            print(f"❌ Could not refresh {self.aggregate.DASHBOARD_DATA_PATH}: {e}")
+
+    def run(self, catch_up=False):
+        for directory in self.directories:
+            os.makedirs(directory, exist_ok=True)
+        tracing.start_run("watch")
+        observer = start_observer(self.directories, self.events)
+        if catch_up:
+            self.catch_up()
+        print(f"🔁 Up to {self.max_workers} tasks at a time, {self.debounce}s debounce. "
+              f"Ctrl+C to stop, twice to abort running tasks.")
+        try:
+            # After the first signal, tasks already running finish and the
+            # dashboard is refreshed once more; queued ones are left for --catch-up
+            with scheduler.graceful_shutdown(), ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while not scheduler.stop_requested() or self.futures:
+                    self.collect_events()
+                    self.finish()
+                    if not scheduler.stop_requested():
+                        self.submit(executor)
+                    self.refresh_dashboard()
+            if self.counts:
+                self.aggregate_due = True
+                self.refresh_dashboard()
+        finally:
+            observer.stop()
+            if self.pending:
+                print(f"⏸️ {len(self.pending)} queued tasks not started; `watch --catch-up` runs them")
+            summary = ", ".join(f"{stage} {'✅' if ok else '❌'} {n}" for (stage, ok), n in sorted(self.counts.items()))
+            print(f"🏁 Watch finished: {summary or 'nothing ran'}")
+
+def build_arg_parser(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(description="Run generation, evaluation and aggregation as files change.")
+    parser.add_argument("--catch-up", action="store_true", help="first queue everything already pending")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="tasks in flight across all stages")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS, help="seconds a file must be quiet")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    import batch_generate_3d
+    import evaluate_models
+    if os.environ.get("OPENROUTER_API_KEY"):
+        # evaluate_models.API_KEY is not read from the environment otherwise
+        evaluate_models.API_KEY = os.environ["OPENROUTER_API_KEY"]
+    if not batch_generate_3d.API_KEY or batch_generate_3d.API_KEY == "YOUR_OPENROUTER_API_KEY_HERE":
+        print("❌ Error: API key not set.")
+        sys.exit(1)
+    Watcher(args.workers, args.debounce).run(args.catch_up)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import tracing
+import scheduler
+
+# Shared task queue so several worker processes or hosts (each with its own
+# OPENROUTER_API_KEY and concurrency) can work through one benchmark run. It is
+# a SQLite file: put it on a filesystem every worker can reach and run workers
+# from checkouts that share the output directories, so results land in the
+# usual batch_outputs/ and evaluation_outputs3/ layout for aggregate_data.py.
+# SQLite's file locking is what coordinates the hosts, so the journal stays in
+# the default rollback mode (WAL needs shared memory and breaks over NFS/SMB).
+QUEUE_PATH = os.path.join(".cache", "work_queue.sqlite")
+
+# A claimed task belongs to its worker for this long; workers extend the lease
+# every LEASE_SECONDS / 3 while the task runs. An expired lease (crashed or
+# disconnected worker) puts the task back in the queue.
+LEASE_SECONDS = 300
+
+# Lease expiries before a task is marked failed instead of requeued again
+MAX_ATTEMPTS = 3
+
+# How often an idle worker with --wait looks for new tasks
+POLL_INTERVAL = 5
+
+STAGES = ("generate", "evaluate")
+WORKER_FUNCTIONS = {"generate": "process_file_model", "evaluate": "process_evaluation"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    stage TEXT NOT NULL,
+    model TEXT NOT NULL,
+    args TEXT NOT NULL,
+    priority REAL NOT NULL,
+    then_evaluate INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    updated REAL,
+    UNIQUE (stage, args)
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (status, priority);
+"""
+
+def connect(path=QUEUE_PATH):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+    conn.executescript(SCHEMA)
+    return conn
+
+def stage_module(stage):
+    if stage == "generate":
+        import batch_generate_3d
+        return batch_generate_3d
+    import evaluate_models
+    return evaluate_models
+
+def model_index(stage):
+    return 1 if stage == "generate" else 2
+
+def enqueue(conn, stage, tasks, then_evaluate=False, retry_failed=False):
+    module = stage_module(stage)
+    added = 0
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for task in tasks:
+            if not module.is_pending(task):
+                continue
+            args = json.dumps(list(task))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO tasks (stage, model, args, priority, then_evaluate, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (stage, task[model_index(stage)], args, module.predict_task(task), int(then_evaluate), now))
+            added += cursor.rowcount
+            if retry_failed and not cursor.rowcount:
+                conn.execute("UPDATE tasks SET status = 'pending', attempts = 0, updated = ? "
+                             "WHERE stage = ? AND args = ? AND status = 'failed'", (now, stage, args))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return added
+
+def requeue_expired(conn, now):
+    conn.execute("UPDATE tasks SET status = 'failed', lease_owner = NULL, updated = ? "
+                 "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?", (now, now, MAX_ATTEMPTS))
+    cursor = conn.execute("UPDATE tasks SET status = 'pending', lease_owner = NULL, updated = ? "
+                          "WHERE status = 'leased' AND lease_expires < ?", (now, now))
+    if cursor.rowcount:
+        print(f"♻️ Requeued {cursor.rowcount} tasks with expired leases")
+
+def claim(conn, worker_id, stages, busy_models, lease_seconds=LEASE_SECONDS):
+    # Longest predicted task first, skipping models this worker already runs
+    # at its per-model cap. Returns (id, stage, args, then_evaluate) or None.
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        requeue_expired(conn, now)
+        query = f"SELECT id, stage, model, args, then_evaluate FROM tasks WHERE status = 'pending' " \
+                f"AND stage IN ({','.join('?' * len(stages))})"
+        params = list(stages)
+        if busy_models:
+            query += f" AND model NOT IN ({','.join('?' * len(busy_models))})"
+            params += list(busy_models)
+        row = conn.execute(query + " ORDER BY priority DESC, id LIMIT 1", params).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute("UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                     "attempts = attempts + 1, updated = ? WHERE id = ?",
+                     (worker_id, now + lease_seconds, now, row[0]))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return row[0], row[1], tuple(json.loads(row[3])), bool(row[4])
+
+def heartbeat(conn, worker_id, task_ids, lease_seconds=LEASE_SECONDS):
+    if not task_ids:
+        return
+    conn.execute(f"UPDATE tasks SET lease_expires = ? WHERE lease_owner = ? AND status = 'leased' "
+                 f"AND id IN ({','.join('?' * len(task_ids))})",
+                 [time.time() + lease_seconds, worker_id] + list(task_ids))
+
+def complete(conn, worker_id, task_id, ok):
+    # A worker whose lease expired and was handed to someone else no longer owns
+    # the task; its late result is on disk either way, so nothing is recorded.
+    conn.execute("UPDATE tasks SET status = ?, lease_owner = NULL, lease_expires = NULL, updated = ? "
+                 "WHERE id = ? AND lease_owner = ?", ("done" if ok else "failed", time.time(), task_id, worker_id))
+
+def pending_count(conn, stages):
+    query = f"SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'leased') AND stage IN ({','.join('?' * len(stages))})"
+    return conn.execute(query, list(stages)).fetchone()[0]
+
+def evaluation_tasks_for(filename, model):
+    # Follow-up evaluations of a freshly generated image (enqueue --then-evaluate)
+    import batch_generate_3d
+    import evaluate_models
+    generated_path = os.path.join(batch_generate_3d.OUTPUT_DIR, batch_generate_3d.output_filename_for(filename, model))
+    return [(filename, generated_path, evaluator, model.replace('/', '_'), None)
+            for evaluator in evaluate_models.EVALUATOR_MODELS]
+
+def print_status(conn):
+    rows = conn.execute("SELECT stage, status, COUNT(*) FROM tasks GROUP BY stage, status ORDER BY stage, status").fetchall()
+    if not rows:
+        print("Queue is empty.")
+        return
+    for stage, status, n in rows:
+        print(f"   {stage:<9} {status:<8} {n}")
+    for owner, n, expires in conn.execute("SELECT lease_owner, COUNT(*), MAX(lease_expires) FROM tasks "
+                                          "WHERE status = 'leased' GROUP BY lease_owner"):
+        print(f"   🔒 {owner}: {n} leased, lease ends in {expires - time.time():.0f}s")
+
+class Heartbeat(threading.Thread):
+    # Keeps this worker's leases alive from its own connection, so a slow API
+    # call never lets a lease lapse while the main loop is blocked in wait().
+    def __init__(self, path, worker_id, lease_seconds):
+        super().__init__(name="queue_heartbeat", daemon=True)
+        self.path = path
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.task_ids = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def run(self):
+        conn = connect(self.path)
+        while not self.stopped.wait(self.lease_seconds / 3):
+            with self.lock:
+                task_ids = list(self.task_ids)
+            try:
+                heartbeat(conn, self.worker_id, task_ids, self.lease_seconds)
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ Heartbeat failed (will retry): {e}")
+        conn.close()
+
+def run_worker(path=QUEUE_PATH, stages=STAGES, concurrency=None, lease_seconds=LEASE_SECONDS, keep_waiting=False):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    modules = {stage: stage_module(stage) for stage in stages}
+    concurrency = concurrency or max(m.MAX_WORKERS for m in modules.values())
+
+    # Each host uses its own key; evaluate_models.API_KEY is not read from the environment otherwise
+    if os.environ.get("OPENROUTER_API_KEY"):
+        for module in modules.values():
+            module.API_KEY = os.environ["OPENROUTER_API_KEY"]
+
+    conn = connect(path)
+    beat = Heartbeat(path, worker_id, lease_seconds)
+    beat.start()
+    tracing.start_run("worker")
+    print(f"👷 Worker {worker_id} pulling {', '.join(stages)} tasks from {path} ({concurrency} at a time)")
+
+    successful = 0
+    failed = 0
+    in_flight = {}
+    futures = {}
+    # The first Ctrl+C/SIGTERM stops claiming and lets running tasks complete;
+    # a second one exits at once and their leases expire for another worker
+    with scheduler.graceful_shutdown(), ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            while len(futures) < concurrency and not scheduler.stop_requested():
+                busy = set()
+                for (stage, model), n in in_flight.items():
+                    limit = modules[stage].MODEL_CONCURRENCY.get(model)
+                    if limit is not None and n >= limit:
+                        busy.add(model)
+                claimed = claim(conn, worker_id, stages, busy, lease_seconds)
+                if claimed is None:
+                    break
+                task_id, stage, task, then_evaluate = claimed
+                key = (stage, task[model_index(stage)])
+                in_flight[key] = in_flight.get(key, 0) + 1
+                with beat.lock:
+                    beat.task_ids.add(task_id)
+                worker = getattr(modules[stage], WORKER_FUNCTIONS[stage])
+                futures[executor.submit(worker, *task)] = (task_id, stage, task, then_evaluate)
+
+            if not futures:
+                if scheduler.stop_requested():
+                    break
+                if keep_waiting or pending_count(conn, stages):
+                    # Other workers still hold leases that may expire and come back
+                    time.sleep(POLL_INTERVAL)
+                    continue
+                break
+
+            done, _ = wait(list(futures), timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                task_id, stage, task, then_evaluate = futures.pop(future)
+                in_flight[(stage, task[model_index(stage)])] -= 1
+                with beat.lock:
+                    beat.task_ids.discard(task_id)
+                try:
+                    ok = bool(future.result())
+                except Exception as e:
+                    print(f"❌ Task {stage} {task} raised: {e}")
+                    ok = False
+                complete(conn, worker_id, task_id, ok)
+                if ok:
+                    successful += 1
+                    if stage == "generate" and then_evaluate:
+                        enqueue(conn, "evaluate", evaluation_tasks_for(*task))
+                else:
+                    failed += 1
+
+    beat.stopped.set()
+    conn.close()
+    print(f"\n🏁 Worker {worker_id} done: ✅ {successful} succeeded, ❌ {failed} failed")
+    tracing.summarize(tracing.trace_path())
+
+def cmd_enqueue(args):
+    conn = connect(args.queue)
+    stages = STAGES if args.stage == "all" else (args.stage,)
+    for stage in stages:
+        added = enqueue(conn, stage, stage_module(stage).plan_tasks(),
+                        then_evaluate=args.then_evaluate and stage == "generate", retry_failed=args.retry_failed)
+        print(f"📥 Enqueued {added} {stage} tasks")
+    print_status(conn)
+
+def cmd_status(args):
+    print_status(connect(args.queue))
+
+def cmd_worker(args):
+    stages = STAGES if args.stage == "all" else (args.stage,)
+    run_worker(args.queue, stages, args.concurrency, args.lease, args.wait)
+
+def build_arg_parser(parser=None):
+    if parser is None:
+        parser = argparse.ArgumentParser(description="Shared generation/evaluation queue for multiple workers.")
+    parser.add_argument("--queue", default=QUEUE_PATH, help="queue database on a filesystem all workers share")
+    subparsers = parser.add_subparsers(dest="queue_command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="add pending tasks from input/ (and batch_outputs/ for evaluate)")
+    enqueue_parser.add_argument("--stage", choices=STAGES + ("all",), default="generate")
+    enqueue_parser.add_argument("--then-evaluate", action="store_true",
+                                help="queue evaluations of each image as soon as it is generated")
+    enqueue_parser.add_argument("--retry-failed", action="store_true", help="put failed tasks back in the queue")
+    enqueue_parser.set_defaults(queue_func=cmd_enqueue)
+
+    status_parser = subparsers.add_parser("status", help="task counts and active leases")
+    status_parser.set_defaults(queue_func=cmd_status)
+
+    worker_parser = subparsers.add_parser("worker", help="pull and run tasks until the queue is drained")
+    worker_parser.add_argument("--stage", choices=STAGES + ("all",), default="all")
+    worker_parser.add_argument("--concurrency", type=int, help="parallel tasks (default: the stage's MAX_WORKERS)")
+    worker_parser.add_argument("--lease", type=int, default=LEASE_SECONDS, help="lease length in seconds")
+    worker_parser.add_argument("--wait", action="store_true", help="keep polling for new tasks instead of exiting")
+    worker_parser.set_defaults(queue_func=cmd_worker)
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    args.queue_func(args)
+
+if __name__ == "__main__":
+    main()